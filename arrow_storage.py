@@ -0,0 +1,104 @@
+import logging
+import os
+import pandas as pd
+import shutil
+
+from web import flask_app
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Dataset tables stored as Arrow IPC files rather than in DATA_DB, for datasets whose DatasetMetadata.storage is 'arrow'. Each table
+# is a directory under DATA_ARROW_DIRECTORY named after its db_location, holding one file per chunk written by DBMaker. The files
+# are memory-mapped when read, so only the columns asked for are ever read from disk, and without copying until they're turned
+# into pandas.
+
+
+def check_available():
+    if pa is None:
+        e = 'pyarrow is needed to store datasets as Arrow files'
+        logging.error(e)
+        raise ImportError(e)
+
+
+def get_table_directory(db_location):
+    return os.path.join(flask_app.config['DATA_ARROW_DIRECTORY'], db_location)
+
+
+def get_part_paths(db_location):
+    directory = get_table_directory(db_location)
+    return [os.path.join(directory, x) for x in sorted(os.listdir(directory))]
+
+
+def open_part(path):
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def iterate_columns(db_location, columns):
+    # A DataFrame of just columns for each file of the table, in the order the rows were written
+    check_available()
+    for path in get_part_paths(db_location):
+        yield open_part(path).select(columns).to_pandas(split_blocks=True)
+
+
+def read_columns(db_location, columns):
+    # Chunks are typed separately, so they're put together the way pandas would e.g. an int chunk and one with nulls as floats
+    dfs = list(iterate_columns(db_location, columns))
+    if len(dfs) == 1:
+        return dfs[0]
+    return pd.concat(dfs, ignore_index=True)
+
+
+def get_row_count(db_location):
+    check_available()
+    return sum(open_part(path).num_rows for path in get_part_paths(db_location))
+
+
+def remove_table(db_location):
+    shutil.rmtree(get_table_directory(db_location), ignore_errors=True)
+
+
+def to_arrow_table(df):
+    # Booleans are stored as 0 and 1, the way SQLite stores them
+    bool_columns = [x for x in df.columns if df[x].dtype == bool]
+    if len(bool_columns) > 0:
+        df = df.astype({x: 'int64' for x in bool_columns})
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # An Arrow column holds a single type, so a column mixing numbers and text is stored as text
+        df = df.copy()
+        for column in df.columns:
+            if df[column].dtype == 'object':
+                df[column] = df[column].astype(str).where(df[column].notna(), None)
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+class ArrowTableWriter():
+    '''
+    Writes a table one DataFrame chunk at a time, each to its own file, since a later chunk can type a column differently (e.g. as
+    floats once it has nulls). A table with no rows still gets one empty file so that its columns are known.
+    '''
+
+    def __init__(self, db_location, empty_df):
+        check_available()
+        self.directory = get_table_directory(db_location)
+        # Anything already there was left by an import that failed
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        self.empty_df = empty_df
+        self.part_count = 0
+
+    def write(self, df):
+        table = to_arrow_table(df)
+        path = os.path.join(self.directory, f'part-{self.part_count:05d}.arrow')
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        self.part_count += 1
+
+    def close(self):
+        if self.part_count == 0:
+            self.write(self.empty_df)
@@ -0,0 +1,494 @@
+'''
+Micro-benchmarks for the hot spots of db_structure, each comparing the current implementation with the one it replaced.
+
+python benchmarks.py [name ...]
+'''
+import http.cookiejar
+import itertools
+import json
+import numpy as np
+import os
+import pandas as pd
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import arrow_storage
+import constants as c
+import db_structure
+import utilities as u
+
+from pandas.api.types import is_numeric_dtype
+from web import db, flask_app
+from web.models import ColumnMetadata, ColumnSignature, ColumnStats, DatasetMetadata, Group, User, UserGroups
+
+
+def time_call(fxn, *args, repeat=3):
+    # Best of repeat runs, in seconds, along with the last result
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = fxn(*args)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def legacy_finalize_aggregated_df(df, groupby_columns, filter_filters):
+    # finalize_aggregated_df before it was vectorized: a row-wise apply for labels, one append per missing label and a list.index
+    # lookup per row to sort
+    groupby_label_options = []
+    for filter_combo in itertools.product(*filter_filters):
+        label = ''
+        for i in filter_combo:
+            label += str(i) + '_'
+        label = label[:-1]
+        groupby_label_options.append(label)
+
+    if len(df) > 0:
+        def get_breakdown_label(row, ind_variables):
+            return_str = ''
+            for x in ind_variables:
+                return_str += str(row[x]) + '_'
+            return_str = return_str[:-1]
+            return return_str
+
+        df['groupby_labels'] = df.apply(lambda x: get_breakdown_label(x, groupby_columns), axis=1)
+    else:
+        df['groupby_labels'] = None
+
+    df = df.drop(columns=groupby_columns)
+
+    found_labels = list(df['groupby_labels'].value_counts().index)
+    missing_labels = [x for x in groupby_label_options if x not in found_labels]
+    if len(missing_labels) > 0:
+        for missing_label in missing_labels:
+            df = df.append({'groupby_labels': missing_label}, ignore_index=True)
+        df = df.fillna(0)
+
+    def find_sort_order(row):
+        return groupby_label_options.index(row['groupby_labels'])
+
+    df['sort_order'] = df.apply(lambda x: find_sort_order(x), axis=1)
+    df = df.sort_values(by='sort_order').reset_index(drop=True)
+    df = df.drop(columns=['sort_order'])
+
+    return df
+
+
+def legacy_aggregate_df(df_original, groupby_columns, filters, aggregate_column=None, aggregate_fxn='Count'):
+    # DBExtractor.aggregate_df before it stopped copying: a deep copy of the whole joined df, dropna over every column and one more
+    # copy per list filter
+    df = df_original.copy(deep=True)
+    df = df.dropna()
+
+    filter_filters = []
+    for column in groupby_columns:
+        filter = filters.get(column, None)
+        if filter is None:
+            series = df.loc[:, column]
+            if is_numeric_dtype(series):
+                min = u.reduce_precision(series.min(), 2)
+                max = u.reduce_precision(series.max(), 2)
+
+                label = f'({min}, {max})'
+                df[column] = label
+                filter_filters.append([label])
+            else:
+                filter_filters.append(sorted(series.unique(), key=lambda x: x.upper()))
+        elif filter['type'] == 'list':
+            filter_filters.append(filter['filter'])
+            df = df[df[column].isin(filter['filter'])]
+        elif filter['type'] == 'range':
+            bin_cuts = db_structure.get_bin_cuts(filter['filter']['min'], filter['filter']['max'], filter['filter']['bins'])
+            bin_labels = db_structure.get_bin_labels(bin_cuts)
+            df[column] = pd.cut(df[column], bin_cuts, include_lowest=True, labels=bin_labels).dropna()
+            filter_filters.append(bin_labels)
+
+    if len(df) > 0:
+        if aggregate_column is None:
+            df = df.groupby(groupby_columns).size()
+            if len(groupby_columns) > 1:
+                df = df.unstack(fill_value=0).sort_index(axis=1).stack()
+            df = df.reset_index(name='Count')
+        else:
+            g = df.groupby(groupby_columns, observed=True)
+
+            if aggregate_fxn == 'Count':
+                df = g[aggregate_column].value_counts().unstack(fill_value=0).sort_index(axis=1).reset_index()
+            elif aggregate_fxn == 'Percents':
+                df = (g[aggregate_column].value_counts(normalize=True) * 100).round(1).unstack(fill_value=0).sort_index(axis=1).reset_index()
+            elif aggregate_fxn == 'Sum':
+                df = g.sum().reset_index()
+                df[aggregate_column] = df[aggregate_column].fillna(0)
+            elif aggregate_fxn == 'Mean':
+                df = (g.mean()).round(2).reset_index()
+                df[aggregate_column] = df[aggregate_column].fillna(0)
+            elif aggregate_fxn == 'Median':
+                df = (g.median()).round(2).reset_index()
+                df[aggregate_column] = df[aggregate_column].fillna(0)
+
+    return db_structure.finalize_aggregated_df(df, groupby_columns, filter_filters)
+
+
+def make_aggregated_df(num_groupby_columns, num_bins, fraction_present, seed=0):
+    # Looks like the Count output of aggregate_df over range filters, with only fraction_present of the bin combinations observed
+    random = np.random.default_rng(seed)
+    groupby_columns = [f'T_col{i}' for i in range(num_groupby_columns)]
+    filter_filters = [db_structure.get_bin_labels(db_structure.get_bin_cuts(0, num_bins, num_bins)) for _ in groupby_columns]
+    combinations = list(itertools.product(*filter_filters))
+    present = sorted(random.choice(len(combinations), int(len(combinations) * fraction_present), replace=False))
+
+    df = pd.DataFrame([combinations[i] for i in present], columns=groupby_columns)
+    for column, bin_labels in zip(groupby_columns, filter_filters):
+        df[column] = pd.Categorical(df[column], categories=bin_labels)
+    df['Count'] = random.integers(1, 100, len(df))
+    return df, groupby_columns, filter_filters
+
+
+def benchmark_finalize():
+    print('finalize_aggregated_df: groupby columns x bins -> legacy / vectorized')
+    for num_groupby_columns, num_bins in [(2, 10), (3, 10), (4, 6), (4, 10)]:
+        df, groupby_columns, filter_filters = make_aggregated_df(num_groupby_columns, num_bins, fraction_present=0.5)
+        legacy_seconds, expected = time_call(legacy_finalize_aggregated_df, df.copy(), groupby_columns, filter_filters, repeat=1)
+        seconds, result = time_call(db_structure.finalize_aggregated_df, df.copy(), groupby_columns, filter_filters)
+        # The legacy version turns the counts into floats whenever it has to fill in a missing label
+        pd.testing.assert_frame_equal(expected, result, check_dtype=False)
+        print(f'  {num_groupby_columns} x {num_bins} ({len(result)} labels): {legacy_seconds:.3f}s / {seconds:.4f}s = {legacy_seconds / seconds:.0f}x')
+
+
+def make_joined_df(num_rows, num_other_columns, seed=0):
+    # Looks like the joined df of a path: a few columns a graph uses among many it doesn't. There are no nulls, since the legacy
+    # version dropped rows with a null in any column, not just the ones a graph uses
+    random = np.random.default_rng(seed)
+    columns = {
+        'T_sex': random.choice(['Male', 'Female'], num_rows),
+        'T_site': random.choice([f'Site {i}' for i in range(20)], num_rows),
+        'T_age': random.integers(0, 18, num_rows),
+        'T_score': np.round(random.normal(50, 10, num_rows), 2)
+    }
+    for i in range(num_other_columns):
+        columns[f'T_other{i}'] = random.choice(['a', 'b', 'c'], num_rows).astype(object) if i % 2 else random.random(num_rows)
+    return pd.DataFrame(columns)
+
+
+MEMORY_CASES = [
+    (['T_sex', 'T_age'], {'T_age': {'type': 'range', 'filter': {'min': 0, 'max': 18, 'bins': 6}}}, 'T_score', 'Mean'),
+    (['T_site'], {'T_site': {'type': 'list', 'filter': ['Site 1', 'Site 2', 'Site 3']}}, 'T_sex', 'Count'),
+    (['T_sex', 'T_site'], {}, None, 'Count')
+]
+
+
+def max_rss_mb(reset=False):
+    # The peak RSS so far (VmHWM), which Linux lets us reset so that building the df doesn't count. Elsewhere fall back to
+    # ru_maxrss, which can't be reset
+    try:
+        if reset:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+        with open('/proc/self/status') as f:
+            return int(next(x for x in f if x.startswith('VmHWM:')).split()[1]) / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def measure_memory(implementation, num_rows, num_other_columns):
+    # Run in its own process by benchmark_memory, since peak RSS only ever goes up
+    aggregate_df = legacy_aggregate_df if implementation == 'legacy' else db_structure.aggregate_df
+    df = make_joined_df(num_rows, num_other_columns)
+    before = max_rss_mb(reset=True)
+    results = [aggregate_df(df, *case) for case in MEMORY_CASES]
+    after = max_rss_mb()
+    print(f'{before:.0f} {after:.0f}')
+    for result in results:
+        print(result.to_json())
+
+
+def benchmark_memory(num_rows=2000000, num_other_columns=20):
+    print(f'aggregate_df on {num_rows} rows x {num_other_columns + 4} columns: peak RSS in MB before -> after aggregating')
+    outputs = {}
+    for implementation in ['legacy', 'current']:
+        output = subprocess.run([sys.executable, __file__, '--measure-memory', implementation, str(num_rows), str(num_other_columns)], capture_output=True, text=True, check=True).stdout.split('\n')
+        before, after = [float(x) for x in output[0].split()]
+        outputs[implementation] = [pd.read_json(x) for x in output[1:] if x]
+        print(f'  {implementation}: {before:.0f} -> {after:.0f} (+{after - before:.0f})')
+    # The legacy version also summed or averaged every other numeric column of the joined df, which the graphs never used
+    for expected, result in zip(outputs['legacy'], outputs['current']):
+        pd.testing.assert_frame_equal(expected[result.columns], result, check_dtype=False)
+
+
+# The aggregations of TestDataExtraction in tests.py, as (path, groupby_columns, filters, aggregate_column, aggregate_fxn)
+ENGINE_CASES = [
+    (['HOSPITALADMIT', 'CAREPROCESSES', 'DEATH'], ['CAREPROCESSES_MechVent', 'HOSPITALADMIT_Sex', 'DEATH_DeathMode'], {}, None, 'Count'),
+    (['HOSPITALADMIT', 'CAREPROCESSES', 'DEATH'], ['CAREPROCESSES_MechVent', 'HOSPITALADMIT_Sex'], {'CAREPROCESSES_MechVent': {'type': 'list', 'filter': ['Yes']}, 'HOSPITALADMIT_Sex': {'type': 'list', 'filter': ['Male']}}, 'DEATH_DeathMode', 'Percents'),
+    (['HOSPITALADMIT', 'CAREPROCESSES', 'PHYSIOSTATUS'], ['CAREPROCESSES_MechVent', 'HOSPITALADMIT_Sex'], {}, 'PHYSIOSTATUS_LowpH', 'Mean'),
+    (['HOSPITALADMIT', 'CAREPROCESSES', 'PHYSIOSTATUS'], ['CAREPROCESSES_MechVent', 'HOSPITALADMIT_Sex', 'PHYSIOSTATUS_LowpH'], {'CAREPROCESSES_MechVent': {'type': 'list', 'filter': ['Yes']}, 'HOSPITALADMIT_Sex': {'type': 'list', 'filter': ['Male']}, 'PHYSIOSTATUS_LowpH': {'type': 'range', 'filter': {'min': 6.8, 'max': 6.9, 'bins': 10}}}, None, 'Count'),
+]
+ENGINES = ['pandas', 'sqlite', 'chunked', 'duckdb']
+
+
+def make_topicc_like_csvs(directory, num_patients, seed=0):
+    # The TOPICC tables and columns that ENGINE_CASES use, joined on PudID, with several physiology rows per patient
+    random = np.random.default_rng(seed)
+    pud_ids = np.arange(num_patients)
+    deaths = num_patients // 20
+    tables = {
+        'HOSPITALADMIT': {'PudID': pud_ids, 'Sex': random.choice(['Male', 'Female'], num_patients)},
+        'CAREPROCESSES': {'PudID': pud_ids, 'MechVent': random.choice(['Yes', 'No'], num_patients)},
+        'DEATH': {'PudID': random.choice(pud_ids, deaths, replace=False), 'DeathMode': random.choice(['Brain death', 'Failed resuscitation', 'Limitation of care', 'Withdrawal of care'], deaths)},
+        'PHYSIOSTATUS': {'PudID': np.repeat(pud_ids, 4), 'LowpH': np.where(random.random(num_patients * 4) < 0.1, np.nan, np.round(random.normal(7.3, 0.15, num_patients * 4), 2))}
+    }
+    os.makedirs(directory)
+    for table, columns in tables.items():
+        pd.DataFrame(columns).to_csv(os.path.join(directory, f'{table}.csv'), index=False)
+
+
+def time_engines(dataset_name):
+    # Seconds per engine for each of ENGINE_CASES, checking that every engine gives what 'pandas' does
+    with db_structure.DBExtractor(dataset_name) as db_extractor:
+        for path, groupby_columns, filters, aggregate_column, aggregate_fxn in ENGINE_CASES:
+            columns = groupby_columns + ([] if aggregate_column is None else [aggregate_column])
+            table_columns_of_interest = [tuple(x.split('_', 1)) for x in columns]
+
+            def aggregate(engine):
+                # Without the caches, which would otherwise serve every run after the first
+                db_structure.invalidate_dataset_caches(dataset_name)
+                return db_extractor.aggregate_paths([path], table_columns_of_interest, groupby_columns, filters, aggregate_column, aggregate_fxn, engine)
+
+            timings = []
+            expected = None
+            for engine in ENGINES:
+                try:
+                    seconds, result = time_call(aggregate, engine)
+                except Exception as e:
+                    # e.g. duckdb, or its sqlite extension, isn't installed
+                    timings.append(f'{engine} unavailable ({type(e).__name__})')
+                    continue
+                if expected is None:
+                    expected = result
+                pd.testing.assert_frame_equal(expected, result, check_exact=False, atol=0.011 if aggregate_fxn == 'Mean' else 0)
+                timings.append(f'{engine} {seconds:.3f}s')
+            print(f'  {aggregate_fxn} of {aggregate_column or "rows"} by {", ".join(groupby_columns)}: ' + ', '.join(timings))
+
+
+def benchmark_engines(num_patients=250000):
+    '''
+    Runs in the configured app and data dbs. Uses TOPICC if it has been imported, and otherwise imports a dataset shaped like it
+    with num_patients patients, once per storage, removing them afterwards.
+    '''
+    if db.session.query(DatasetMetadata).filter(DatasetMetadata.dataset_name == 'TOPICC').first() is not None:
+        print('aggregate_paths on TOPICC, per engine')
+        time_engines('TOPICC')
+        return
+
+    storages = [c.STORAGE_SQLITE] + ([] if arrow_storage.pa is None else [c.STORAGE_ARROW])
+    directory = tempfile.mkdtemp()
+    try:
+        for storage in storages:
+            dataset_name = f'benchmark_{storage}'
+            make_topicc_like_csvs(os.path.join(directory, storage), num_patients)
+            db_maker = db_structure.DBMaker(dataset_name, os.path.join(directory, storage), storage=storage)
+            db_maker.create_db()
+            try:
+                db_structure.DBLinker(dataset_name).add_global_fk('PudID')
+                print(f'aggregate_paths on a TOPICC-like dataset of {num_patients} patients stored in {storage}, per engine')
+                time_engines(dataset_name)
+            finally:
+                db_maker.remove_db()
+    finally:
+        shutil.rmtree(directory)
+
+
+# The server run_application.py starts, on a given port and without CSRF so that the simulated users can log in
+LATENCY_SERVER = '''
+from gevent import monkey
+monkey.patch_all()
+import sys
+from gevent.pywsgi import WSGIServer
+from web import flask_app
+flask_app.config['WTF_CSRF_ENABLED'] = False
+WSGIServer(('127.0.0.1', int(sys.argv[1])), flask_app, log=None).serve_forever()
+'''
+
+
+def simulate_users(port, url, count, seconds, username=None, password=None):
+    # count users each requesting url over and over for seconds, logged in if a username is given. Returns every request's
+    # latency in seconds
+    latencies = []
+
+    def simulate_user():
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        if username is not None:
+            opener.open(f'http://127.0.0.1:{port}/login', urllib.parse.urlencode({'username': username, 'password': password}).encode()).read()
+        end_time = time.perf_counter() + seconds
+        while time.perf_counter() < end_time:
+            start_time = time.perf_counter()
+            opener.open(f'http://127.0.0.1:{port}{url}').read()
+            latencies.append(time.perf_counter() - start_time)
+
+    threads = [threading.Thread(target=simulate_user) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def measure_latency(port, offload_threads, graph_data_url, username, password, seconds, heavy_users, light_users):
+    # Latencies of /login for light_users while heavy_users keep asking for graph data, served by LATENCY_SERVER with the caches
+    # off so that every graph is computed
+    env = dict(os.environ, OFFLOAD_THREADS=str(offload_threads), GRAPH_DATA_CACHE_MAX_BYTES='0', JOIN_CACHE_MAX_BYTES='0')
+    server = subprocess.Popen([sys.executable, '-c', LATENCY_SERVER, str(port)], env=env)
+    try:
+        start_time = time.perf_counter()
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.perf_counter() - start_time > 30:
+                    raise
+                time.sleep(0.1)
+
+        heavy_latencies = []
+        heavy_thread = threading.Thread(target=lambda: heavy_latencies.extend(simulate_users(port, graph_data_url, heavy_users, seconds, username, password)))
+        heavy_thread.start()
+        time.sleep(1)
+        light_latencies = simulate_users(port, '/login', light_users, seconds - 1)
+        heavy_thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+    return np.array(light_latencies), np.array(heavy_latencies)
+
+
+def benchmark_latency(num_patients=100000, seconds=20, heavy_users=4, light_users=4):
+    '''
+    How long the login page takes to load under gevent while other users keep asking for graphs, running DBExtractor's slow calls
+    on the hub and then off it (see offload.py). Runs in the configured app and data dbs with a TOPICC-like dataset and a user
+    that it removes afterwards.
+    '''
+    print(f'/login latency in ms with {light_users} users, while {heavy_users} users ask for graphs of {num_patients} patients')
+    directory = tempfile.mkdtemp()
+    dataset_name = 'benchmark_latency'
+    db_maker = None
+    user = None
+    try:
+        make_topicc_like_csvs(os.path.join(directory, dataset_name), num_patients)
+        db_maker = db_structure.DBMaker(dataset_name, os.path.join(directory, dataset_name))
+        db_maker.create_db()
+        db_structure.DBLinker(dataset_name).add_global_fk('PudID')
+
+        if db.session.query(Group).filter(Group.group_name == 'Basic').first() is None:
+            db.session.add(Group(group_name='Basic'))
+        user = User(username=dataset_name)
+        user.set_password(f'{dataset_name}_password')
+        db.session.add(user)
+        db.session.commit()
+        user.assign_group('Basic')
+
+        column_ids = dict(((x.table_name, x.column_source_name), x.id) for x in db.session.query(ColumnMetadata).filter(ColumnMetadata.dataset_name == dataset_name).all())
+        graph_data_url = '/get_graph_data?' + urllib.parse.urlencode({
+            'chosen_dataset': dataset_name,
+            'chosen_ind_column_ids[]': [column_ids[('HOSPITALADMIT', 'Sex')], column_ids[('CAREPROCESSES', 'MechVent')]],
+            'chosen_outcome_column_id': column_ids[('PHYSIOSTATUS', 'LowpH')],
+            'aggregate_fxn': 'Mean',
+            'filters': json.dumps({})
+        }, doseq=True)
+
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        for offload_threads in [0, 4]:
+            light_latencies, heavy_latencies = measure_latency(port, offload_threads, graph_data_url, user.username, f'{dataset_name}_password', seconds, heavy_users, light_users)
+            light_ms = [np.percentile(light_latencies, q) * 1000 for q in [50, 99]] + [light_latencies.max() * 1000]
+            print(f'  OFFLOAD_THREADS={offload_threads}: p50 {light_ms[0]:.0f}, p99 {light_ms[1]:.0f}, max {light_ms[2]:.0f} over {len(light_latencies)} requests; {len(heavy_latencies)} graphs at {np.median(heavy_latencies):.2f}s each')
+    finally:
+        if user is not None and user.id is not None:
+            db.session.query(UserGroups).filter(UserGroups.user_id == user.id).delete()
+            db.session.delete(user)
+            db.session.commit()
+        if db_maker is not None:
+            db_maker.remove_db()
+        shutil.rmtree(directory)
+
+
+def make_wide_schema_columns(num_tables, seed=0):
+    # {(table, column): values} for a schema where every table has a sample of the patients in T000, every third a sample of the
+    # encounters in T001 and every fifth a sample of the sites in T002, along with columns of small and large numbers, reals and
+    # categories that shouldn't be linked to anything
+    random = np.random.default_rng(seed)
+    patient_ids = np.arange(200000)
+    encounter_ids = np.arange(1000000, 1500000)
+    site_codes = np.array([f'S{x:04d}' for x in range(500)])
+    columns = {('T000', 'PatientID'): patient_ids, ('T001', 'EncounterID'): encounter_ids, ('T002', 'SiteCode'): site_codes}
+    for t in range(3, num_tables):
+        table = f'T{t:03d}'
+        columns[(table, 'PatientID')] = random.choice(patient_ids, random.integers(5000, 20000), replace=False)
+        if t % 3 == 0:
+            columns[(table, 'EncounterID')] = random.choice(encounter_ids, random.integers(5000, 20000), replace=False)
+        if t % 5 == 0:
+            columns[(table, 'SiteCode')] = random.choice(site_codes, random.integers(50, 200), replace=False)
+        columns[(table, 'Age')] = random.integers(0, 100, 5000)
+        columns[(table, 'Count')] = random.integers(0, 10000000, 5000)
+        columns[(table, 'Value')] = random.normal(0, 1, 5000)
+        columns[(table, 'Category')] = random.choice([f'C{x}' for x in range(30)], 5000)
+    return columns
+
+
+def benchmark_link_discovery(num_tables=300):
+    '''
+    How long DBLinkFinder takes to propose the links of a schema of num_tables tables, whose column signatures and stats are made
+    straight from generated values rather than by importing them. Every table other than T000-T002 should get linked to T000, and
+    some to T001 and T002, and nothing else.
+    '''
+    dataset_name = 'benchmark_link_discovery'
+    columns = make_wide_schema_columns(num_tables)
+    for (table, column), values in columns.items():
+        signature_tracker = db_structure.ColumnSignatureTracker(flask_app.config['COLUMN_SIGNATURE_SIZE'])
+        signature_tracker.update(values)
+        db.session.add(signature_tracker.get_column_signature(dataset_name, table, column))
+        db.session.add(ColumnMetadata(dataset_name=dataset_name, table_name=table, column_source_name=column, column_custom_name=column, is_many=bool(pd.Series(values).duplicated().any())))
+        if is_numeric_dtype(values):
+            db.session.add(ColumnStats(dataset_name=dataset_name, table_name=table, column_source_name=column, column_type=c.COLUMN_TYPE_NUMERIC, min=float(values.min()), max=float(values.max())))
+    db.session.commit()
+
+    try:
+        start_time = time.perf_counter()
+        links = db_structure.DBLinkFinder(dataset_name).find_links()
+        seconds = time.perf_counter() - start_time
+
+        expected_links = set()
+        for table, column in columns:
+            parent_table = {'PatientID': 'T000', 'EncounterID': 'T001', 'SiteCode': 'T002'}.get(column)
+            if parent_table is not None and table != parent_table:
+                expected_links.add((table, column, parent_table))
+        found_links = set((x['table_1'], x['column_1'], x['table_2']) for x in links if x['column_1'] == x['column_2'])
+        print(f'{len(links)} links proposed among {len(columns)} columns of {num_tables} tables in {seconds:.2f}s: {len(expected_links & found_links)} of the {len(expected_links)} expected, {len(links) - len(expected_links & found_links)} others')
+    finally:
+        for model in [ColumnSignature, ColumnMetadata, ColumnStats]:
+            db.session.query(model).filter(model.dataset_name == dataset_name).delete()
+        db.session.commit()
+
+
+BENCHMARKS = {
+    'finalize': benchmark_finalize,
+    'memory': benchmark_memory,
+    'engines': benchmark_engines,
+    'latency': benchmark_latency,
+    'link_discovery': benchmark_link_discovery
+}
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure-memory']:
+        measure_memory(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        for name in sys.argv[1:] or BENCHMARKS.keys():
+            BENCHMARKS[name]()
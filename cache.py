@@ -0,0 +1,330 @@
+import atexit
+import logging
+import offload
+import os
+import pandas as pd
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from web import flask_app
+
+# Process-wide caches, created on first use: serialized /get_graph_data responses, and the DataFrames joined along a path that the
+# pandas aggregation works from. Each process (e.g. each gunicorn worker) has its own, so anything that changes what a dataset's
+# graphs would show must call invalidate_dataset, which DBMaker, DBLinker and the column customization routes do, and bump the
+# dataset's generation in the metadata db so that the other processes drop theirs (see db_structure.check_dataset_generation).
+# There's also a cache of logged in users and their roles, which anything changing a user must call invalidate_user for. The
+# caches are used from offload's pool threads too, so they're locked with offload.Lock.
+_graph_data_cache = None
+_join_cache = None
+_user_cache = None
+_lock = offload.Lock()
+
+
+def get_graph_data_cache():
+    global _graph_data_cache
+    with _lock:
+        if _graph_data_cache is None:
+            _graph_data_cache = ByteLRUCache(flask_app.config['GRAPH_DATA_CACHE_MAX_BYTES'])
+        return _graph_data_cache
+
+
+def get_join_cache():
+    global _join_cache
+    with _lock:
+        if _join_cache is None:
+            _join_cache = JoinCache(flask_app.config['JOIN_CACHE_MAX_BYTES'], flask_app.config['JOIN_CACHE_SPILL_DIRECTORY'], flask_app.config['JOIN_CACHE_SPILL_MAX_BYTES'])
+        return _join_cache
+
+
+def get_user_cache():
+    global _user_cache
+    with _lock:
+        if _user_cache is None:
+            _user_cache = UserCache(flask_app.config['USER_CACHE_TTL'])
+        return _user_cache
+
+
+def invalidate_user(user_id):
+    get_user_cache().invalidate(user_id)
+
+
+def invalidate_dataset(dataset_name):
+    get_graph_data_cache().invalidate(dataset_name)
+    get_join_cache().invalidate(dataset_name)
+
+
+class ByteLRUCache():
+    '''
+    Least recently used cache of bytes values, evicting until the values add up to at most max_bytes. A max_bytes of 0 turns it
+    off.
+
+    Keys are tuples starting with the dataset name, so that invalidate can drop everything for a dataset. It also bumps the
+    dataset's generation: take generation() before computing a value and hand it to put, which then skips values computed from
+    data that has since changed.
+
+    Subclasses can cache other values by overriding get_size, and do something with what gets evicted in evicted.
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.size_bytes = 0
+        self.generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = offload.Lock()
+
+    def get_size(self, value):
+        return len(value)
+
+    def evicted(self, key, value, generation):
+        # Called without the lock held, for every value put that didn't fit or was pushed out
+        pass
+
+    def generation(self, dataset_name):
+        with self.lock:
+            return self.generations.get(dataset_name, 0)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, generation):
+        if self.max_bytes == 0:
+            return
+        size = self.get_size(value)
+        evicted = []
+        with self.lock:
+            if generation != self.generations.get(key[0], 0):
+                return
+            if size > self.max_bytes:
+                evicted.append((key, value))
+            else:
+                self.remove(key)
+                self.entries[key] = value
+                self.sizes[key] = size
+                self.size_bytes += size
+                while self.size_bytes > self.max_bytes:
+                    evicted_key, evicted_value = self.entries.popitem(last=False)
+                    self.size_bytes -= self.sizes.pop(evicted_key)
+                    evicted.append((evicted_key, evicted_value))
+            self.evictions += len(evicted)
+
+        for evicted_key, evicted_value in evicted:
+            self.evicted(evicted_key, evicted_value, generation)
+
+    def remove(self, key):
+        # With the lock held
+        if key in self.entries:
+            del self.entries[key]
+            self.size_bytes -= self.sizes.pop(key)
+
+    def invalidate(self, dataset_name):
+        with self.lock:
+            self.generations[dataset_name] = self.generations.get(dataset_name, 0) + 1
+            for key in [x for x in self.entries if x[0] == dataset_name]:
+                self.remove(key)
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else None,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'size_bytes': self.size_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+class JoinCache(ByteLRUCache):
+    '''
+    DataFrames joined along a path, keyed by (dataset_name, path, frozenset of columns) and sized by their memory usage. find
+    serves any cached join along the same path with at least the columns asked for, so changing a filter or the aggregate
+    function of a graph doesn't re-run the join. The frames are shared, so nothing may modify one it gets from here.
+
+    With a spill_directory, frames evicted from memory are written there as Feather files (which needs pyarrow) rather than
+    dropped, keeping at most spill_max_bytes on disk, and are read back into memory when next found. Frames too big for memory
+    go straight to disk.
+    '''
+
+    def __init__(self, max_bytes, spill_directory=None, spill_max_bytes=0):
+        super().__init__(max_bytes)
+        self.spill_directory = spill_directory
+        self.spill_max_bytes = spill_max_bytes
+        # {key: (file path, size in bytes on disk, generation)}
+        self.spilled = OrderedDict()
+        self.spilled_bytes = 0
+        self.spills = 0
+        if self.spill_directory is not None:
+            # A directory of its own, since other processes may be spilling to the same place
+            os.makedirs(self.spill_directory, exist_ok=True)
+            self.spill_directory = tempfile.mkdtemp(prefix='join_cache_', dir=self.spill_directory)
+            atexit.register(shutil.rmtree, self.spill_directory, ignore_errors=True)
+
+    def get_key(self, dataset_name, path, columns):
+        return (dataset_name, tuple(path), frozenset(columns))
+
+    def get_size(self, df):
+        return int(df.memory_usage(index=True, deep=True).sum())
+
+    def find(self, dataset_name, path, columns):
+        # The cached join with the fewest columns that has all of columns, with just those columns in that order
+        wanted_key = self.get_key(dataset_name, path, columns)
+        with self.lock:
+            df = None
+            key = self.find_superset_key(self.entries, wanted_key)
+            if key is not None:
+                self.entries.move_to_end(key)
+                df = self.entries[key]
+            else:
+                key = self.find_superset_key(self.spilled, wanted_key)
+                if key is None:
+                    self.misses += 1
+                    return None
+                file_path, file_size, generation = self.spilled.pop(key)
+                self.spilled_bytes -= file_size
+            self.hits += 1
+
+        if df is None:
+            df = pd.read_feather(file_path)
+            os.remove(file_path)
+            self.put(key, df, generation)
+        return df if list(df.columns) == list(columns) else df[list(columns)]
+
+    def find_superset_key(self, entries, wanted_key):
+        keys = [x for x in entries if x[:2] == wanted_key[:2] and wanted_key[2] <= x[2]]
+        return min(keys, key=lambda x: len(x[2])) if len(keys) > 0 else None
+
+    def put(self, key, df, generation):
+        # A join with more columns along the same path makes any cached with fewer of them redundant
+        with self.lock:
+            for redundant_key in [x for x in self.entries if x[:2] == key[:2] and x[2] < key[2]]:
+                self.remove(redundant_key)
+        super().put(key, df, generation)
+
+    def evicted(self, key, df, generation):
+        if self.spill_directory is None or self.spill_max_bytes == 0:
+            return
+
+        file_path = os.path.join(self.spill_directory, f'{uuid.uuid4().hex}.feather')
+        try:
+            df.reset_index(drop=True).to_feather(file_path)
+        except ImportError:
+            logging.warning('pyarrow is not installed, so joins evicted from the join cache are dropped rather than spilled to disk')
+            self.spill_directory = None
+            return
+        except Exception as e:
+            # e.g. a column mixing numbers and text, which Arrow can't store
+            logging.warning(f'Unable to spill the join along {key[1]} to disk: {e}')
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            return
+        file_size = os.path.getsize(file_path)
+
+        removed_file_paths = []
+        with self.lock:
+            if generation != self.generations.get(key[0], 0) or file_size > self.spill_max_bytes:
+                removed_file_paths.append(file_path)
+            else:
+                if key in self.spilled:
+                    removed_file_paths.append(self.spilled[key][0])
+                    self.spilled_bytes -= self.spilled.pop(key)[1]
+                self.spilled[key] = (file_path, file_size, generation)
+                self.spilled_bytes += file_size
+                self.spills += 1
+                while self.spilled_bytes > self.spill_max_bytes:
+                    _, (removed_file_path, removed_file_size, _) = self.spilled.popitem(last=False)
+                    self.spilled_bytes -= removed_file_size
+                    removed_file_paths.append(removed_file_path)
+        for removed_file_path in removed_file_paths:
+            os.remove(removed_file_path)
+
+    def invalidate(self, dataset_name):
+        super().invalidate(dataset_name)
+        removed_file_paths = []
+        with self.lock:
+            for key in [x for x in self.spilled if x[0] == dataset_name]:
+                file_path, file_size, _ = self.spilled.pop(key)
+                self.spilled_bytes -= file_size
+                removed_file_paths.append(file_path)
+        for file_path in removed_file_paths:
+            os.remove(file_path)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        with self.lock:
+            stats.update({
+                'spills': self.spills,
+                'spilled_entries': len(self.spilled),
+                'spilled_bytes': self.spilled_bytes,
+                'spill_max_bytes': self.spill_max_bytes
+            })
+        return stats
+
+
+class UserCache():
+    '''
+    Users by id along with their roles, for load_user, so that requests by a logged in user run no queries to find out who they
+    are and what they may do. The users are detached from any session and must not be modified; load_user merges a copy into the
+    request's session instead.
+
+    Entries expire ttl seconds after they're cached. invalidate drops a user from this process's cache only, so the ttl bounds how
+    long other processes go on using a user's old roles or password. A ttl of 0 turns it off.
+    '''
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        # {user id: (user, roles, time cached)}
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        # (user, roles), or None
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[2] > self.ttl:
+                del self.entries[user_id]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[:2]
+
+    def put(self, user_id, user, roles):
+        if self.ttl == 0:
+            return
+        with self.lock:
+            self.entries[user_id] = (user, roles, time.monotonic())
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else None,
+                'entries': len(self.entries),
+                'ttl': self.ttl
+            }
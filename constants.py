@@ -3,3 +3,17 @@ COLUMN_ONE = 'ONE'
 
 COLUMN_TYPE_NUMERIC = 'NUMERIC'
 COLUMN_TYPE_TEXT = 'TEXT'
+
+# What a ColumnSignature's values are, for link discovery
+VALUE_TYPE_INTEGER = 'integer'
+VALUE_TYPE_REAL = 'real'
+VALUE_TYPE_TEXT = 'text'
+
+STORAGE_SQLITE = 'sqlite'
+STORAGE_ARROW = 'arrow'
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
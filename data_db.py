@@ -0,0 +1,133 @@
+import logging
+import offload
+import queue
+import sqlite3
+import threading
+
+from contextlib import contextmanager
+from web import flask_app
+
+# Per connection, bytes of the db mapped into memory and the page cache size, which is in KiB when negative
+DATA_DB_MMAP_SIZE = 268435456
+DATA_DB_CACHE_SIZE = -65536
+
+# Shared connections to DATA_DB, created on first use. Reads go through a bounded pool of read-only connections that are lent out
+# for the length of a request, while everything that writes (DBMaker, DBIndexer) shares one writer connection, since SQLite only
+# allows one writer at a time anyway. Under gevent, connections are borrowed and given back both in offload's pool threads and on
+# the hub, so the pool synchronizes with offload's primitives.
+_pool = None
+_writer = None
+_lock = offload.Lock()
+
+
+def get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # The writer switches the db to WAL, which is what lets readers carry on while it writes
+            get_writer_unlocked()
+            _pool = DataConnectionPool(flask_app.config['DATA_DB'], flask_app.config['DATA_DB_POOL_SIZE'], flask_app.config['DATA_DB_POOL_TIMEOUT'])
+        return _pool
+
+
+def get_writer():
+    with _lock:
+        return get_writer_unlocked()
+
+
+def get_writer_unlocked():
+    global _writer
+    if _writer is None:
+        _writer = DataWriter(flask_app.config['DATA_DB'])
+    return _writer
+
+
+def forget_connections():
+    # In a forked process, whose inherited connections still belong to its parent. They're dropped without being closed, and new
+    # ones are opened as they are needed
+    global _pool, _writer
+    _pool = None
+    _writer = None
+
+
+def get_pragmas():
+    return [
+        f'PRAGMA mmap_size = {DATA_DB_MMAP_SIZE};',
+        f'PRAGMA cache_size = {DATA_DB_CACHE_SIZE};',
+        'PRAGMA temp_store = MEMORY;'
+    ]
+
+
+class DataConnectionPool():
+    '''
+    At most size read-only connections to the data db, opened as they are first needed and then reused.
+
+    acquire waits up to timeout seconds for a connection to be released once all of them are lent out, then raises TimeoutError.
+    '''
+
+    def __init__(self, path, size, timeout):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.idle_connections = offload.SimpleQueue()
+        self.opened_count = 0
+        self.lock = offload.Lock()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        for pragma in get_pragmas():
+            conn.execute(pragma)
+        conn.execute('PRAGMA query_only = ON;')
+        return conn
+
+    def acquire(self):
+        try:
+            return self.idle_connections.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            can_open = self.opened_count < self.size
+            if can_open:
+                self.opened_count += 1
+        if can_open:
+            try:
+                return self.connect()
+            except Exception:
+                with self.lock:
+                    self.opened_count -= 1
+                raise
+
+        try:
+            return offload.wait_off_hub(self.idle_connections.get, timeout=self.timeout)
+        except queue.Empty:
+            e = f'No data db connection was released within {self.timeout}s, all {self.size} are in use'
+            logging.error(e)
+            raise TimeoutError(e)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self.idle_connections.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+
+class DataWriter():
+    '''
+    The one connection that writes to the data db. Hold lock for as long as a write (or a transaction) needs the connection to
+    itself; it is re-entrant, so a writer can call other code that takes it too.
+    '''
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode = WAL;')
+        for pragma in get_pragmas():
+            self.conn.execute(pragma)
+        self.lock = threading.RLock()
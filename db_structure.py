@@ -1,16 +1,385 @@
 import itertools
+import json
 import logging
+import multiprocessing
+import numpy as np
 import os
 import pandas as pd
+import queue
 import sqlite3
+import time
+import traceback
+import uuid
+import arrow_storage
+import cache
 import constants as c
+import data_db
+import offload
+import sketches
 import utilities as u
 
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal as D
-from pandas.api.types import is_numeric_dtype
+from pandas.api.types import is_integer_dtype, is_numeric_dtype
 from sqlalchemy.exc import OperationalError
 from web import db, flask_app
-from web.models import DatasetMetadata, TableMetadata, ColumnMetadata, TableRelationship
+from web.models import DatasetMetadata, TableMetadata, ColumnMetadata, TableRelationship, TablePath, DataIndex, ColumnStats, ColumnSignature
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Process-wide cache of {dataset_name: RelationshipGraph}. Any code that changes TableRelationship rows for a dataset must call
+# invalidate_relationship_graph (or invalidate_dataset_caches) so that the next DBExtractor rebuilds the graph from the metadata db.
+# Other processes find out from the dataset's cache_generation in the metadata db, which invalidate_dataset_caches changes and
+# check_dataset_generation compares with the one their caches were filled under, every CACHE_GENERATION_CHECK_SECONDS at most.
+_relationship_graphs = {}
+_relationship_graphs_lock = offload.Lock()
+# {dataset_name: (cache_generation, time.monotonic() it was last checked)}
+_dataset_generations = {}
+# How long a process goes on using its caches of a dataset another process changed
+CACHE_GENERATION_CHECK_SECONDS = 1
+
+
+def get_relationship_graph(dataset_name):
+    check_dataset_generation(dataset_name)
+    with _relationship_graphs_lock:
+        graph = _relationship_graphs.get(dataset_name)
+        if graph is None:
+            graph = RelationshipGraph(dataset_name)
+            _relationship_graphs[dataset_name] = graph
+        return graph
+
+
+def invalidate_relationship_graph(dataset_name):
+    with _relationship_graphs_lock:
+        _relationship_graphs.pop(dataset_name, None)
+
+
+def invalidate_dataset_caches(dataset_name):
+    # Everything cached about a dataset's tables and relationships, including the graph data built from them. Call it before
+    # committing the change, so that other processes drop their caches along with it
+    invalidate_relationship_graph(dataset_name)
+    cache.invalidate_dataset(dataset_name)
+    bump_dataset_generation(dataset_name)
+
+
+def bump_dataset_generation(dataset_name):
+    # A new token rather than a count, so that a dataset removed and made again doesn't come back with a generation seen before
+    db.session.query(DatasetMetadata).filter(DatasetMetadata.dataset_name == dataset_name).update({DatasetMetadata.cache_generation: uuid.uuid4().hex}, synchronize_session=False)
+
+
+def check_dataset_generation(dataset_name):
+    # Drops this process's caches for the dataset if another process has changed it since they were filled. Call it before
+    # reading any of them
+    with _relationship_graphs_lock:
+        checked = _dataset_generations.get(dataset_name)
+    if checked is not None and time.monotonic() - checked[1] < CACHE_GENERATION_CHECK_SECONDS:
+        return
+
+    generation = db.session.query(DatasetMetadata.cache_generation).filter(DatasetMetadata.dataset_name == dataset_name).scalar()
+    with _relationship_graphs_lock:
+        is_changed = checked is not None and checked[0] != generation
+        _dataset_generations[dataset_name] = (generation, time.monotonic())
+    if is_changed:
+        logging.info(f'{dataset_name} was changed by another process, dropping its cached graphs and graph data')
+        invalidate_relationship_graph(dataset_name)
+        cache.invalidate_dataset(dataset_name)
+
+
+# Name of the per-group row count column returned by SQLAggregator
+GROUPED_COUNT_COLUMN = 'grouped_count'
+
+# What each kind of link made by DBLinker.add_fks makes table_1 and table_2 to each other
+LINK_ROW_TYPES = {
+    'parent_child': ('is_parent', 'is_child'),
+    'sibling': ('is_sibling', 'is_sibling'),
+    'step_sibling': ('is_step_sibling', 'is_step_sibling')
+}
+
+# Columns whose first hashes DBLinkFinder joins with every column's hashes at once
+LINK_DISCOVERY_JOIN_COLUMNS = 64
+
+# Values bound at once in an IN (...) list, under SQLite's default limit of 999 variables per statement
+SQL_IN_BATCH_SIZE = 900
+
+
+def get_bin_cuts(min, max, num_bins):
+    min = D(min)
+    max = D(max)
+    num_bins = D(num_bins)
+    
+    step_size = (max - min) / num_bins
+    current_cut = min
+    bin_cuts = []
+    while len(bin_cuts) < num_bins:
+        current_cut = u.reduce_precision(current_cut, precision=2)
+        bin_cuts.append(float(current_cut))
+        current_cut += step_size
+    bin_cuts.append(float(max))  # added in case there are rounding errors, and planning for choosing inclusive right-non-inclusive intervals
+
+    return bin_cuts
+
+
+def get_bin_labels(bin_cuts):
+    # e.g. [6.8, 6.81, 6.82] --> ['(6.8, 6.81]', '(6.81, 6.82]']
+    bin_labels = [str(x) for x in u.pairwise(bin_cuts)]
+    return [x.replace(')', ']') for x in bin_labels]
+
+
+def aggregate_df(df, groupby_columns, filters, aggregate_column=None, aggregate_fxn='Count'):
+    # Filter, bin and group the joined df for a graph, without modifying df and copying only the rows and columns it keeps
+    columns = groupby_columns + ([] if aggregate_column is None else [aggregate_column])
+    keep_rows = np.ones(len(df), dtype=bool)
+    for column in columns:
+        keep_rows &= df[column].notna().to_numpy()
+
+    # Each groupby column only sees the list filters of the columns before it, e.g. a label's min and max
+    filter_filters = []
+    for column in groupby_columns:
+        filter = filters.get(column, None)
+        if filter is None:
+            series = df[column][keep_rows]
+            if is_numeric_dtype(series):
+                min = u.reduce_precision(series.min(), 2)
+                max = u.reduce_precision(series.max(), 2)
+                filter_filters.append([f'({min}, {max})'])
+            else:
+                filter_filters.append(sorted(series.unique(), key=lambda x: x.upper()))
+        elif filter['type'] == 'list':
+            filter_filters.append(filter['filter'])
+            keep_rows &= df[column].isin(filter['filter']).to_numpy()
+        elif filter['type'] == 'range':
+            filter_filters.append(get_bin_labels(get_bin_cuts(filter['filter']['min'], filter['filter']['max'], filter['filter']['bins'])))
+
+    df = df[columns].take(np.flatnonzero(keep_rows))
+
+    for column, column_filter_filters in zip(groupby_columns, filter_filters):
+        filter = filters.get(column, None)
+        if filter is None:
+            if is_numeric_dtype(df[column]):
+                df[column] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=column_filter_filters)
+            else:
+                df[column] = pd.Categorical(df[column], categories=column_filter_filters)
+        elif filter['type'] == 'list':
+            if is_integer_dtype(df[column]):
+                df[column] = pd.to_numeric(df[column], downcast='integer')
+            elif not is_numeric_dtype(df[column]):
+                df[column] = df[column].astype('category')
+        elif filter['type'] == 'range':
+            bin_cuts = get_bin_cuts(filter['filter']['min'], filter['filter']['max'], filter['filter']['bins'])
+            df[column] = pd.cut(df[column], bin_cuts, include_lowest=True, labels=column_filter_filters)
+
+    if len(df) > 0:
+        if aggregate_column is None:
+            # just get the counts then
+            df = df.groupby(groupby_columns).size()
+            if len(groupby_columns) > 1:
+                df = df.unstack(fill_value=0).sort_index(axis=1).stack()
+            df = df.reset_index(name='Count')
+        else:
+            g = df.groupby(groupby_columns, observed=True)
+
+            if aggregate_fxn == 'Count':
+                df = g[aggregate_column].value_counts().unstack(fill_value=0).sort_index(axis=1).reset_index()
+            elif aggregate_fxn == 'Percents':
+                df = (g[aggregate_column].value_counts(normalize=True) * 100).round(1).unstack(fill_value=0).sort_index(axis=1).reset_index()
+            elif aggregate_fxn == 'Sum':
+                df = g.sum().reset_index()
+                df[aggregate_column] = df[aggregate_column].fillna(0)
+            elif aggregate_fxn == 'Mean':
+                df = (g.mean()).round(2).reset_index()
+                df[aggregate_column] = df[aggregate_column].fillna(0)
+            elif aggregate_fxn == 'Median':
+                df = (g.median()).round(2).reset_index()
+                df[aggregate_column] = df[aggregate_column].fillna(0)
+
+    return finalize_aggregated_df(df, groupby_columns, filter_filters)
+
+
+def finalize_aggregated_df(df, groupby_columns, filter_filters):
+    # Replace the groupby columns with one groupby_labels column, e.g. 'A_(6.8, 6.81]', with a row for every combination of
+    # filter_filters so that empty groups still show up as 0
+    grid = pd.MultiIndex.from_product(filter_filters, names=groupby_columns)
+    value_columns = [x for x in df.columns if x not in groupby_columns]
+
+    if len(df) > 0:
+        # Categorical columns are compared by value, not category, once they are plain objects
+        keys = pd.MultiIndex.from_arrays([df[column].astype(object) for column in groupby_columns], names=groupby_columns)
+        df = df[value_columns].set_axis(keys, axis=0).reindex(grid, fill_value=0)
+    else:
+        df = pd.DataFrame(0, index=grid, columns=df[value_columns].columns)
+
+    level_labels = [pd.Series(grid.levels[i].astype(str).take(grid.codes[i])) for i in range(grid.nlevels)]
+    df = df.reset_index(drop=True)
+    df['groupby_labels'] = level_labels[0].str.cat(level_labels[1:], sep='_') if len(level_labels) > 1 else level_labels[0]
+    return df
+
+
+class IsManyTracker():
+    # Works out whether a column repeats any non-null value one chunk at a time, or None once it's seen max_tracked_values distinct values
+    def __init__(self, max_tracked_values):
+        self.max_tracked_values = max_tracked_values
+        self.seen_values = set()
+        self.is_many = False
+
+    def update(self, values):
+        if self.seen_values is None:
+            return
+
+        values = values.dropna()
+        if values.duplicated().any() or values.isin(self.seen_values).any():
+            self.is_many = True
+            self.seen_values = None
+            return
+
+        self.seen_values.update(values)
+        if len(self.seen_values) > self.max_tracked_values:
+            self.is_many = None
+            self.seen_values = None
+
+
+class ColumnSignatureTracker():
+    # Builds a column's sketches.MinHash and c.VALUE_TYPE_* one chunk at a time
+    def __init__(self, size):
+        self.min_hash = sketches.MinHash(size)
+        self.value_type = None
+
+    def update(self, values):
+        values = pd.Series(values).dropna()
+        if len(values) == 0:
+            return
+        if not is_numeric_dtype(values) or values.dtype == bool:
+            value_type = c.VALUE_TYPE_TEXT
+        elif is_integer_dtype(values) or (values % 1 == 0).all():
+            value_type = c.VALUE_TYPE_INTEGER
+        else:
+            value_type = c.VALUE_TYPE_REAL
+        if self.value_type is None or value_type == c.VALUE_TYPE_TEXT or (value_type == c.VALUE_TYPE_REAL and self.value_type == c.VALUE_TYPE_INTEGER):
+            self.value_type = value_type
+        self.min_hash.update(values)
+
+    def get_column_signature(self, dataset_name, table_name, column):
+        return ColumnSignature(
+            dataset_name=dataset_name,
+            table_name=table_name,
+            column_source_name=column,
+            value_type=self.value_type or c.VALUE_TYPE_TEXT,
+            size=self.min_hash.k,
+            distinct_count=self.min_hash.distinct_count(),
+            hashes=self.min_hash.to_bytes()
+        )
+
+
+def read_csv_for_db(file_path, db_location, chunksize, max_tracked_values, storage=c.STORAGE_SQLITE, signature_size=None):
+    # Parses a CSV in chunks into what DBMaker writes, without touching a db so that it can run in a worker process. Yields ('create', ...),
+    # ('rows', ...) or ('frame', ...) per chunk and ('done', ...), or ('reset', {column: dtype}) when a later chunk retypes a column
+    dtypes = {}
+    parse_seconds = 0
+    while True:
+        widened_dtypes, parse_seconds = yield from read_csv_chunks_for_db(file_path, db_location, chunksize, max_tracked_values, storage, signature_size, dtypes, parse_seconds)
+        if widened_dtypes is None:
+            return
+        dtypes.update(widened_dtypes)
+        yield ('reset', {column: str(dtype) for column, dtype in widened_dtypes.items()})
+
+
+def read_csv_chunks_for_db(file_path, db_location, chunksize, max_tracked_values, storage, signature_size, dtypes, parse_seconds):
+    # One pass of read_csv_for_db over the file with the given dtypes. Returns (None, seconds spent parsing) once it has yielded
+    # 'done', or ({column: dtype}, seconds spent parsing) as soon as a chunk types a column differently than the first chunk did
+    row_count = 0
+    trackers = None
+    signature_trackers = {}
+    create_message = None
+    declared_dtypes = None
+
+    start_time = time.perf_counter()
+    for chunk in pd.read_csv(file_path, chunksize=chunksize, dtype=dtypes):
+        if trackers is None:
+            trackers = {column: IsManyTracker(max_tracked_values) for column in chunk.columns}
+            if signature_size is not None:
+                signature_trackers = {column: ColumnSignatureTracker(signature_size) for column in chunk.columns}
+            if storage == c.STORAGE_ARROW:
+                create_message = ('create', chunk.head(0))
+            else:
+                create_message = ('create', ) + get_create_table_sql(db_location, chunk)
+            declared_dtypes = chunk.dtypes
+        else:
+            widened_dtypes = get_widened_dtypes(declared_dtypes, chunk.dtypes)
+            if len(widened_dtypes) > 0:
+                return widened_dtypes, parse_seconds + time.perf_counter() - start_time
+
+        for column in chunk.columns:
+            trackers[column].update(chunk[column])
+            if signature_size is not None:
+                signature_trackers[column].update(chunk[column])
+        if storage == c.STORAGE_ARROW:
+            data_message = ('frame', chunk)
+        else:
+            data_message = ('rows', list(chunk.astype(object).where(chunk.notna(), None).itertuples(name=None)))
+        row_count += len(chunk)
+        parse_seconds += time.perf_counter() - start_time
+
+        if create_message is not None:
+            yield create_message
+            create_message = None
+        yield data_message
+        start_time = time.perf_counter()
+
+    if trackers is None:
+        # Header only, so there were no chunks to read
+        chunk = pd.read_csv(file_path, nrows=0)
+        trackers = {column: IsManyTracker(max_tracked_values) for column in chunk.columns}
+        if signature_size is not None:
+            signature_trackers = {column: ColumnSignatureTracker(signature_size) for column in chunk.columns}
+        if storage == c.STORAGE_ARROW:
+            yield ('create', chunk)
+        else:
+            yield ('create', ) + get_create_table_sql(db_location, chunk)
+    parse_seconds += time.perf_counter() - start_time
+
+    yield ('done', {column: tracker.is_many for column, tracker in trackers.items()}, row_count, parse_seconds, signature_trackers)
+    return None, parse_seconds
+
+
+def get_widened_dtypes(declared_dtypes, dtypes):
+    # {column: dtype to read it as} for the columns of dtypes that a table declared from declared_dtypes wouldn't keep as they are
+    widened_dtypes = {}
+    for column, dtype in dtypes.items():
+        kinds = [x.kind.replace('u', 'i') for x in [declared_dtypes[column], dtype]]
+        if kinds[0] == kinds[1] or kinds == ['f', 'i']:
+            continue
+        widened_dtypes[column] = np.dtype('float64') if kinds == ['i', 'f'] else np.dtype(object)
+    return widened_dtypes
+
+
+def get_create_table_sql(db_location, df):
+    # The table is laid out the way df.to_sql would, i.e. an indexed "index" column followed by df's columns, typed from df
+    create_statements = [
+        pd.io.sql.get_schema(df.reset_index(), db_location),
+        f'CREATE INDEX "ix_{db_location}_index" ON "{db_location}" ("index");'
+    ]
+    column_names = ', '.join(f'"{column}"' for column in ['index'] + list(df.columns))
+    placeholders = ', '.join('?' for _ in range(len(df.columns) + 1))
+    return create_statements, f'INSERT INTO "{db_location}" ({column_names}) VALUES ({placeholders});'
+
+
+def put_csv_for_db(message_queue, cancelled, data_file_name, *args):
+    # Runs in a DBMaker worker process. Passes everything read_csv_for_db yields to the writer, tagged with the file name
+    try:
+        for message in read_csv_for_db(*args):
+            while True:
+                if cancelled.is_set():
+                    return
+                try:
+                    message_queue.put((data_file_name, message), timeout=1)
+                    break
+                except queue.Full:
+                    pass
+    except Exception:
+        message_queue.put((data_file_name, ('error', traceback.format_exc())))
 
 
 class DBMaker():
@@ -18,12 +387,24 @@ class DBMaker():
     This class will take the files in the directory and then create tables in the main application db. It will also add metadata
     '''
 
-    def __init__(self, dataset_name, directory_path, data_file_extension='.csv', delimiter=','):
+    def __init__(self, dataset_name, directory_path, data_file_extension='.csv', delimiter=',', chunksize=None, max_tracked_values=None, workers=None, storage=None):
         self.directory_path = directory_path
         self.abs_path = os.path.join(os.getcwd(), directory_path)
         self.dataset_name = dataset_name
         self.data_file_extension = data_file_extension
-        self.data_conn = sqlite3.connect(flask_app.config['DATA_DB'])
+        self.chunksize = chunksize or flask_app.config['INGEST_CHUNK_SIZE']
+        self.max_tracked_values = max_tracked_values or flask_app.config['INGEST_MAX_TRACKED_VALUES']
+        self.workers = workers or flask_app.config['INGEST_WORKERS']
+        # Recorded in DatasetMetadata, so everything reading the dataset later follows it
+        self.storage = storage or flask_app.config['DATA_STORAGE']
+        if self.storage not in [c.STORAGE_SQLITE, c.STORAGE_ARROW]:
+            e = f'Unknown storage {self.storage}'
+            logging.error(e)
+            raise ValueError(e)
+        if self.storage == c.STORAGE_ARROW:
+            arrow_storage.check_available()
+        self.data_writer = data_db.get_writer()
+        self.data_conn = self.data_writer.conn
 
     def create_db(self, overwrite=False):
         # First check to see if either dataset_name or the folder are already in the db
@@ -44,65 +425,190 @@ class DBMaker():
         dataset_metadata = DatasetMetadata(
             dataset_name=self.dataset_name,
             folder=self.directory_path,
-            prefix=prefix
+            prefix=prefix,
+            storage=self.storage
         )
         db.session.add(dataset_metadata)
         
         data_file_names = u.find_file_types(self.directory_path, self.data_file_extension)
 
-        for data_file_name in data_file_names:
-            idx = data_file_name.rfind('.')
-            table_name = data_file_name[:idx]
-            db_location = f'{prefix}_{table_name}'
+        # Every table is written in one transaction, and the metadata is only committed once they have all been written, so a
+        # failed import leaves nothing behind in either db, or in DATA_ARROW_DIRECTORY
+        self.import_report = {}
+        self.insert_statements = {}
+        self.arrow_writers = {}
+        with self.data_writer.lock:
+            self.data_conn.execute('BEGIN')
+            try:
+                if self.workers > 1 and len(data_file_names) > 1:
+                    self.add_tables_in_parallel(prefix, data_file_names)
+                else:
+                    for data_file_name in data_file_names:
+                        for message in read_csv_for_db(*self.get_read_csv_args(prefix, data_file_name)):
+                            self.write_message(prefix, data_file_name, message)
+            except Exception:
+                self.data_conn.rollback()
+                db.session.rollback()
+                for db_location in self.arrow_writers:
+                    arrow_storage.remove_table(db_location)
+                raise
+
+            invalidate_dataset_caches(self.dataset_name)
+            self.data_conn.commit()
+            db.session.commit()
 
+        for data_file_name, timing in self.import_report.items():
+            logging.info(f'{data_file_name}: {timing["rows"]} rows, parsed in {timing["parse_seconds"]:.2f}s, written in {timing["write_seconds"]:.2f}s')
+        logging.info(f'Finished writing {self.dataset_name}')
+        return self.import_report
+
+    def get_table_name(self, data_file_name):
+        idx = data_file_name.rfind('.')
+        return data_file_name[:idx]
+
+    def get_read_csv_args(self, prefix, data_file_name):
+        db_location = f'{prefix}_{self.get_table_name(data_file_name)}'
+        return os.path.join(self.abs_path, data_file_name), db_location, self.chunksize, self.max_tracked_values, self.storage, flask_app.config['COLUMN_SIGNATURE_SIZE']
+
+    def add_tables_in_parallel(self, prefix, data_file_names):
+        # Parse the files in a pool of self.workers processes, which hand their chunks over through a bounded queue to this process, the
+        # only one writing to DATA_DB
+        with multiprocessing.Manager() as manager:
+            message_queue = manager.Queue(maxsize=self.workers * 2)
+            cancelled = manager.Event()
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = [
+                    executor.submit(put_csv_for_db, message_queue, cancelled, data_file_name, *self.get_read_csv_args(prefix, data_file_name))
+                    for data_file_name in data_file_names
+                ]
+                try:
+                    files_remaining = len(data_file_names)
+                    while files_remaining > 0:
+                        try:
+                            data_file_name, message = message_queue.get(timeout=1)
+                        except queue.Empty:
+                            for future in futures:
+                                if future.done() and future.exception() is not None:
+                                    raise future.exception()
+                            continue
+
+                        if message[0] == 'error':
+                            e = f'Unable to read {data_file_name}:\n{message[1]}'
+                            logging.error(e)
+                            raise Exception(e)
+
+                        self.write_message(prefix, data_file_name, message)
+                        if message[0] == 'done':
+                            files_remaining -= 1
+                except BaseException:
+                    cancelled.set()
+                    raise
+
+    def write_message(self, prefix, data_file_name, message):
+        # Write one of the messages yielded by read_csv_for_db for data_file_name
+        table_name = self.get_table_name(data_file_name)
+        db_location = f'{prefix}_{table_name}'
+        timing = self.import_report.setdefault(data_file_name, {'rows': 0, 'parse_seconds': 0, 'write_seconds': 0})
+        start_time = time.perf_counter()
+
+        if message[0] == 'create':
             logging.info(f'Writing {table_name} to {db_location}')
-            
-            df = pd.read_csv(os.path.join(self.abs_path, data_file_name))
-            df.to_sql(db_location, con=self.data_conn)
-            table_metadata = TableMetadata(
-                dataset_name=self.dataset_name,
-                table_name=table_name,
-                db_location=db_location,
-                file=data_file_name
-            )
+            if self.storage == c.STORAGE_ARROW:
+                self.arrow_writers[db_location] = arrow_storage.ArrowTableWriter(db_location, message[1])
+            else:
+                create_statements, self.insert_statements[db_location] = message[1], message[2]
+                for sql_statement in create_statements:
+                    self.data_conn.execute(sql_statement)
+
+        elif message[0] == 'rows':
+            self.data_conn.executemany(self.insert_statements[db_location], message[1])
+
+        elif message[0] == 'frame':
+            self.arrow_writers[db_location].write(message[1])
+
+        elif message[0] == 'reset':
+            # A later chunk typed columns differently than the one the table was declared from, so the file is being read again
+            logging.info(f'Rewriting {table_name} to {db_location}, reading {message[1]}')
+            if self.storage == c.STORAGE_ARROW:
+                del self.arrow_writers[db_location]
+                arrow_storage.remove_table(db_location)
+            else:
+                self.data_conn.execute(f'DROP TABLE "{db_location}";')
+
+        elif message[0] == 'done':
+            if self.storage == c.STORAGE_ARROW:
+                self.arrow_writers[db_location].close()
+            columns_is_many, timing['rows'], timing['parse_seconds'], signature_trackers = message[1], message[2], message[3], message[4]
+            self.add_table_metadata(table_name, db_location, data_file_name, columns_is_many, timing['rows'], signature_trackers)
+
+        timing['write_seconds'] += time.perf_counter() - start_time
 
-            db.session.add(table_metadata)
+    def add_table_metadata(self, table_name, db_location, data_file_name, columns_is_many, row_count, signature_trackers):
+        # The table hasn't been committed yet, so the column stats have to be computed on this connection
+        db_profiler = DBProfiler(self.dataset_name, self.data_conn)
+        table_metadata = TableMetadata(
+            dataset_name=self.dataset_name,
+            table_name=table_name,
+            db_location=db_location,
+            file=data_file_name,
+            row_count=row_count
+        )
+
+        db.session.add(table_metadata)
 
-            for column in df.columns:
-                if len(df[column].dropna()) > len(df[column].dropna().unique()):
-                    is_many = True
+        for column, is_many in columns_is_many.items():
+            if is_many is None:
+                logging.debug(f'Too many distinct values in {db_location}.{column} to track, counting duplicates in the table instead')
+                if self.storage == c.STORAGE_ARROW:
+                    is_many = bool(arrow_storage.read_columns(db_location, [column])[column].dropna().duplicated().any())
                 else:
-                    is_many = False
-
-                column_metadata = ColumnMetadata(
-                    dataset_name=self.dataset_name,
-                    table_name=table_name,
-                    column_source_name=column,
-                    column_custom_name=column,
-                    is_many=is_many
-                )
-                db.session.add(column_metadata)
-        
-        db.session.commit()
-        logging.info(f'Finished writing {self.dataset_name}')
+                    sql_statement = f'SELECT COUNT("{column}") > COUNT(DISTINCT "{column}") FROM "{db_location}";'
+                    is_many = bool(self.data_conn.execute(sql_statement).fetchone()[0])
+
+            column_metadata = ColumnMetadata(
+                dataset_name=self.dataset_name,
+                table_name=table_name,
+                column_source_name=column,
+                column_custom_name=column,
+                is_many=is_many
+            )
+            db.session.add(column_metadata)
+            db_profiler.add_column_stats(table_name, column, commit=False)
+            if column in signature_trackers:
+                db.session.add(signature_trackers[column].get_column_signature(self.dataset_name, table_name, column))
 
     def remove_db(self):
+        DBIndexer(self.dataset_name).remove_all_indexes()
+
+        storage = db.session.query(DatasetMetadata.storage).filter(DatasetMetadata.dataset_name == self.dataset_name).first()[0]
         table_metadata = db.session.query(TableMetadata).filter(TableMetadata.dataset_name == self.dataset_name).all()
-        for table in table_metadata:
-            sql_statement = f'DROP TABLE {table.db_location};'
-            try:
-                self.data_conn.cursor().execute(sql_statement)
-            except OperationalError:
-                logging.error(f'Unable to drop {table.db_location}. Does it exist in the db?')
+        if storage == c.STORAGE_ARROW:
+            for table in table_metadata:
+                arrow_storage.remove_table(table.db_location)
+        else:
+            with self.data_writer.lock:
+                for table in table_metadata:
+                    sql_statement = f'DROP TABLE {table.db_location};'
+                    try:
+                        self.data_conn.cursor().execute(sql_statement)
+                    except OperationalError:
+                        logging.error(f'Unable to drop {table.db_location}. Does it exist in the db?')
         
         db.session.query(TableMetadata).filter(TableMetadata.dataset_name == self.dataset_name).delete()
 
         db.session.query(ColumnMetadata).filter(ColumnMetadata.dataset_name == self.dataset_name).delete()
+
+        db.session.query(ColumnStats).filter(ColumnStats.dataset_name == self.dataset_name).delete()
+
+        db.session.query(ColumnSignature).filter(ColumnSignature.dataset_name == self.dataset_name).delete()
         
         db.session.query(DatasetMetadata).filter(DatasetMetadata.dataset_name == self.dataset_name).delete()
 
         db.session.query(TableRelationship).filter(TableRelationship.dataset_name == self.dataset_name).delete()
+
+        db.session.query(TablePath).filter(TablePath.dataset_name == self.dataset_name).delete()
         
+        invalidate_dataset_caches(self.dataset_name)
         db.session.commit()
 
 
@@ -125,103 +631,136 @@ class DBLinker():
         return True
 
     def add_global_fk(self, column):
-        # Find all tables that have this column name, then run add_fk to all combos
-        tables_found = [x[0] for x in db.session.query(ColumnMetadata.table_name).filter(ColumnMetadata.dataset_name == self.dataset_name, ColumnMetadata.column_source_name == column).all()]
-        
-        for table_combination in itertools.combinations(tables_found, 2):
-            self.add_fk(table_combination[0], column, table_combination[1], column)
+        # Find all tables that have this column name, then link every combination of them
+        return self.add_global_fks([column])
+
+    def add_global_fks(self, columns):
+        # Links every pair of tables sharing each of columns, in the order given. Returns the summary of add_fks
+        found_rows = db.session.query(ColumnMetadata.column_source_name, ColumnMetadata.table_name).filter(ColumnMetadata.dataset_name == self.dataset_name, ColumnMetadata.column_source_name.in_(columns)).order_by(ColumnMetadata.id).all()
+        tables_found = defaultdict(list)
+        for column, table in found_rows:
+            tables_found[column].append(table)
+
+        links = []
+        for column in columns:
+            for table_combination in itertools.combinations(tables_found[column], 2):
+                links.append((table_combination[0], column, table_combination[1], column))
+        return self.add_fks(links)
+
+    def add_fk(self, table_1, column_1, table_2, column_2, update_paths=True):
+        return self.add_fks([(table_1, column_1, table_2, column_2)], update_paths=update_paths)
+
+    def add_fks(self, links, update_paths=True):
+        # Links each (table_1, column_1, table_2, column_2) in one transaction, skipping tables already linked. Returns {'created': [...], 'skipped': [...]}
+        is_many = dict(((x.table_name, x.column_source_name), x.is_many) for x in db.session.query(ColumnMetadata.table_name, ColumnMetadata.column_source_name, ColumnMetadata.is_many).filter(ColumnMetadata.dataset_name == self.dataset_name))
+        linked_tables = set(frozenset(x) for x in db.session.query(TableRelationship.reference_table, TableRelationship.other_table).filter(TableRelationship.dataset_name == self.dataset_name))
+
+        summary = {'created': [], 'skipped': []}
+        relationship_rows = []
+        join_keys = []
+        for table_1, column_1, table_2, column_2 in links:
+            if frozenset([table_1, table_2]) in linked_tables:
+                # serves as a safety check.
+                logging.info(f'Relationship already exists between {table_1} and {table_2}. Cannot assign two foreign keys between two tables.')
+                summary['skipped'].append({'table_1': table_1, 'column_1': column_1, 'table_2': table_2, 'column_2': column_2, 'reason': 'already linked'})
+                continue
+
+            for table, column in [(table_1, column_1), (table_2, column_2)]:
+                if (table, column) not in is_many:
+                    logging.error(f'Unable to find column type for {table}.{column}')
+            link = self.get_link_type(is_many.get((table_1, column_1)), is_many.get((table_2, column_2)))
+            if link == 'child_parent':
+                link = 'parent_child'
+                table_1, column_1, table_2, column_2 = table_2, column_2, table_1, column_1
+            relationship_rows += self.make_link_rows(table_1, column_1, table_2, column_2, *LINK_ROW_TYPES[link])
+
+            linked_tables.add(frozenset([table_1, table_2]))
+            join_keys += [(table_1, column_1), (table_2, column_2)]
+            summary['created'].append({'table_1': table_1, 'column_1': column_1, 'table_2': table_2, 'column_2': column_2, 'link': link})
 
-    def add_fk(self, table_1, column_1, table_2, column_2):
-        column_1_is_many = self.column_type_is_many(table_1, column_1)
-        column_2_is_many = self.column_type_is_many(table_2, column_2)
-        
-        if self.table_relationship_exists(table_1, table_2):
-            logging.info(f'Relationship already exists between {table_1} and {table_2}. Cannot assign two foreign keys between two tables.')  # serves as a safety check.
-        else:
-            if column_1_is_many:
-                if column_2_is_many:
-                    self.add_step_sibling_link(step_sibling_1_table=table_1, step_sibling_1_column=column_1, step_sibling_2_table=table_2, step_sibling_2_column=column_2)
-                
-                elif not column_2_is_many:
-                    self.add_parent_child_link(parent_table=table_1, parent_column=column_1, child_table=table_2, child_column=column_2)
-
-            elif not column_1_is_many:
-                if column_2_is_many:
-                    self.add_parent_child_link(parent_table=table_2, parent_column=column_2, child_table=table_1, child_column=column_1)
-                
-                elif not column_2_is_many:
-                    self.add_sibling_link(sibling_1_table=table_1, sibling_1_column=column_1, sibling_2_table=table_2, sibling_2_column=column_2)
-        
-        db.session.commit()
+        try:
+            db.session.bulk_save_objects(relationship_rows)
+            db_indexer = DBIndexer(self.dataset_name)
+            for table, column in sorted(set(join_keys)):
+                db_indexer.add_join_key_index(table, column, commit=False)
+            if update_paths and len(join_keys) > 0:
+                self.update_table_paths(set(x[0] for x in join_keys), commit=False)
+            invalidate_dataset_caches(self.dataset_name)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(e)
+            raise Exception(e)
 
-    def add_parent_child_link(self, parent_table, parent_column, child_table, child_column, commit=False):
-        parent_row = TableRelationship(
-            dataset_name=self.dataset_name,
-            reference_table=parent_table,
-            other_table=child_table,
-            reference_key=parent_column,
-            other_key=child_column,
-            is_parent=True
-        )
+        logging.info(f'Created {len(summary["created"])} links in {self.dataset_name}, skipped {len(summary["skipped"])}')
+        return summary
+
+    def update_table_paths(self, tables, commit=True):
+        # Recompute the TablePath rows of the connected groups of tables, the only ones a link change can alter
+        graph = RelationshipGraph(self.dataset_name, load_paths=False)
+        affected_tables = set()
+        for table in tables:
+            affected_tables.update(graph.get_connected_tables(table))
+
+        db.session.query(TablePath).filter(TablePath.dataset_name == self.dataset_name, TablePath.start_table.in_(affected_tables)).delete(synchronize_session=False)
+
+        for start_table, destination_table in itertools.permutations(sorted(affected_tables), 2):
+            paths = graph.search_paths_between_tables(start_table, destination_table)
+            db.session.add(TablePath(
+                dataset_name=self.dataset_name,
+                start_table=start_table,
+                destination_table=destination_table,
+                paths=json.dumps(paths)
+            ))
 
-        child_row = TableRelationship(
-            dataset_name=self.dataset_name,
-            reference_table=child_table,
-            other_table=parent_table,
-            reference_key=child_column,
-            other_key=parent_column,
-            is_child=True
-        )
-        
-        db.session.add(parent_row)
-        db.session.add(child_row)
         if commit:
+            invalidate_dataset_caches(self.dataset_name)
             db.session.commit()
+        logging.info(f'Updated stored paths for {len(affected_tables)} tables in {self.dataset_name}')
+
+    def get_link_type(self, column_1_is_many, column_2_is_many):
+        # How add_fks links table_1 to table_2: 'step_sibling', 'sibling', or 'parent_child' ('child_parent') when table_1 (table_2)
+        # is the parent
+        if column_1_is_many:
+            return 'step_sibling' if column_2_is_many else 'parent_child'
+        return 'child_parent' if column_2_is_many else 'sibling'
+
+    def make_link_rows(self, table_1, column_1, table_2, column_2, link_type_1, link_type_2):
+        # The TableRelationship rows from each side of a link, where link_type_1 is what table_1 is to table_2, e.g. is_parent
+        return [
+            TableRelationship(
+                dataset_name=self.dataset_name,
+                reference_table=table_1,
+                other_table=table_2,
+                reference_key=column_1,
+                other_key=column_2,
+                **{link_type_1: True}
+            ),
+            TableRelationship(
+                dataset_name=self.dataset_name,
+                reference_table=table_2,
+                other_table=table_1,
+                reference_key=column_2,
+                other_key=column_1,
+                **{link_type_2: True}
+            )
+        ]
 
-    def add_sibling_link(self, sibling_1_table, sibling_1_column, sibling_2_table, sibling_2_column, commit=False):
-        sibling_1_row = TableRelationship(
-            dataset_name=self.dataset_name,
-            reference_table=sibling_1_table,
-            other_table=sibling_2_table,
-            reference_key=sibling_1_column,
-            other_key=sibling_2_column,
-            is_sibling=True
-        )
-        sibling_2_row = TableRelationship(
-            dataset_name=self.dataset_name,
-            reference_table=sibling_2_table,
-            other_table=sibling_1_table,
-            reference_key=sibling_2_column,
-            other_key=sibling_1_column,
-            is_sibling=True
-        )
+    def add_parent_child_link(self, parent_table, parent_column, child_table, child_column, commit=False):
+        db.session.add_all(self.make_link_rows(parent_table, parent_column, child_table, child_column, 'is_parent', 'is_child'))
+        invalidate_dataset_caches(self.dataset_name)
+        if commit:
+            db.session.commit()
 
-        db.session.add(sibling_1_row)
-        db.session.add(sibling_2_row)
+    def add_sibling_link(self, sibling_1_table, sibling_1_column, sibling_2_table, sibling_2_column, commit=False):
+        db.session.add_all(self.make_link_rows(sibling_1_table, sibling_1_column, sibling_2_table, sibling_2_column, 'is_sibling', 'is_sibling'))
+        invalidate_dataset_caches(self.dataset_name)
         if commit:
             db.session.commit()
 
     def add_step_sibling_link(self, step_sibling_1_table, step_sibling_1_column, step_sibling_2_table, step_sibling_2_column, commit=False):
-        step_sibling_1_row = TableRelationship(
-            dataset_name=self.dataset_name,
-            reference_table=step_sibling_1_table,
-            other_table=step_sibling_2_table,
-            reference_key=step_sibling_1_column,
-            other_key=step_sibling_2_column,
-            is_step_sibling=True
-        )
-        step_sibling_2_row = TableRelationship(
-            dataset_name=self.dataset_name,
-            reference_table=step_sibling_2_table,
-            other_table=step_sibling_1_table,
-            reference_key=step_sibling_2_column,
-            other_key=step_sibling_1_column,
-            is_step_sibling=True
-        )
-
-        db.session.add(step_sibling_1_row)
-        db.session.add(step_sibling_2_row)
-
+        db.session.add_all(self.make_link_rows(step_sibling_1_table, step_sibling_1_column, step_sibling_2_table, step_sibling_2_column, 'is_step_sibling', 'is_step_sibling'))
+        invalidate_dataset_caches(self.dataset_name)
         if commit:
             db.session.commit()
 
@@ -233,8 +772,454 @@ class DBLinker():
 
     def remove_all_relationships(self):
         logging.warning(f'Will remove all links for dataset {self.dataset_name}')
+        DBIndexer(self.dataset_name).remove_all_join_key_indexes(commit=False)
         db.session.query(TableRelationship).filter(TableRelationship.dataset_name == self.dataset_name).delete()
+        db.session.query(TablePath).filter(TablePath.dataset_name == self.dataset_name).delete()
+        invalidate_dataset_caches(self.dataset_name)
+        db.session.commit()
+
+
+class DBLinkFinder():
+    # Proposes links between tables from how much of one column's values are in another's, as estimated from ColumnSignatures
+
+    def __init__(self, dataset_name):
+        self.dataset_name = dataset_name
+
+    def find_links(self, min_containment=None):
+        # The best link for each pair of tables that aren't linked yet, where one of the columns has no repeats
+        min_containment = min_containment or flask_app.config['LINK_DISCOVERY_MIN_CONTAINMENT']
+        min_distinct = flask_app.config['LINK_DISCOVERY_MIN_DISTINCT']
+        signatures = db.session.query(ColumnSignature).filter(
+            ColumnSignature.dataset_name == self.dataset_name,
+            ColumnSignature.value_type.in_([c.VALUE_TYPE_INTEGER, c.VALUE_TYPE_TEXT]),
+            ColumnSignature.distinct_count >= min_distinct
+        ).order_by(ColumnSignature.id).all()
+        min_hashes = [x.get_min_hash() for x in signatures]
+        is_many = dict(((x.table_name, x.column_source_name), x.is_many) for x in db.session.query(ColumnMetadata.table_name, ColumnMetadata.column_source_name, ColumnMetadata.is_many).filter(ColumnMetadata.dataset_name == self.dataset_name))
+        signatures_is_many = np.array([bool(is_many.get((x.table_name, x.column_source_name))) for x in signatures])
+        value_ranges = dict(((x.table_name, x.column_source_name), (x.min, x.max)) for x in db.session.query(ColumnStats.table_name, ColumnStats.column_source_name, ColumnStats.min, ColumnStats.max).filter(ColumnStats.dataset_name == self.dataset_name, ColumnStats.column_type == c.COLUMN_TYPE_NUMERIC))
+
+        candidates = set()
+        for value_type in [c.VALUE_TYPE_INTEGER, c.VALUE_TYPE_TEXT]:
+            block = [i for i, x in enumerate(signatures) if x.value_type == value_type]
+            candidates.update(self.find_candidates(block, signatures, signatures_is_many, min_hashes, min_containment, min_distinct))
+
+        best_links = {}
+        for i, j in candidates:
+            containment, sample_size = min_hashes[i].containment(min_hashes[j])
+            if containment is None or containment < min_containment or sample_size < min_distinct:
+                continue
+            same_name = signatures[i].column_source_name == signatures[j].column_source_name
+            if not same_name and signatures[i].value_type == c.VALUE_TYPE_INTEGER and not self.covers_range(value_ranges.get((signatures[i].table_name, signatures[i].column_source_name)), value_ranges.get((signatures[j].table_name, signatures[j].column_source_name))):
+                continue
+            key = frozenset([signatures[i].table_name, signatures[j].table_name])
+            score = (same_name, containment, sample_size)
+            if key not in best_links or score > best_links[key][0]:
+                best_links[key] = (score, i, j)
+
+        linked_tables = set(frozenset(x) for x in db.session.query(TableRelationship.reference_table, TableRelationship.other_table).filter(TableRelationship.dataset_name == self.dataset_name))
+        db_linker = DBLinker(self.dataset_name)
+        links = []
+        for key, ((_, containment, sample_size), i, j) in best_links.items():
+            if key in linked_tables:
+                continue
+            table_1, column_1 = signatures[i].table_name, signatures[i].column_source_name
+            table_2, column_2 = signatures[j].table_name, signatures[j].column_source_name
+            links.append({
+                'table_1': table_1,
+                'column_1': column_1,
+                'table_2': table_2,
+                'column_2': column_2,
+                'containment': containment,
+                'sample_size': sample_size,
+                'link': db_linker.get_link_type(is_many.get((table_1, column_1)), is_many.get((table_2, column_2)))
+            })
+        links.sort(key=lambda x: (x['table_1'], x['table_2']))
+        logging.info(f'Found {len(links)} links in {self.dataset_name} from {len(candidates)} candidate pairs of {len(signatures)} columns')
+        return links
+
+    def covers_range(self, value_range, other_value_range):
+        # Whether value_range, a (min, max), spans enough of other_value_range's, which it's taken to do if either isn't known
+        if value_range is None or other_value_range is None or None in value_range + other_value_range:
+            return True
+        return value_range[1] - value_range[0] >= flask_app.config['LINK_DISCOVERY_MIN_RANGE_COVERAGE'] * (other_value_range[1] - other_value_range[0])
+
+    def find_candidates(self, block, signatures, signatures_is_many, min_hashes, min_containment, min_sample_size):
+        # (i, j) for the columns i of block that share enough of their first hashes with a column j to be contained in it
+        if len(block) < 2:
+            return []
+        column_count = len(signatures)
+        table_names = np.array([x.table_name for x in signatures])
+        distinct_counts = np.array([x.distinct_count for x in signatures])
+        thresholds = np.array([x.get_threshold() for x in min_hashes], dtype=np.uint64)
+        prefix_lengths = np.zeros(column_count, dtype=np.int64)
+        for i in block:
+            prefix_lengths[i] = min(len(min_hashes[i].hashes), 2 * int((1 - min_containment) * min_hashes[i].k) + 1)
+
+        # Every hash of the columns with repeats, and of those without, sorted along with the column it's from. Columns with
+        # repeats are only joined with columns without
+        hash_indexes = []
+        for is_many in [False, True]:
+            columns = [j for j in block if signatures_is_many[j] == is_many]
+            hashes = np.concatenate([min_hashes[j].hashes for j in columns] + [np.empty(0, dtype=np.uint64)])
+            owners = np.repeat(np.array(columns, dtype=np.int64), [len(min_hashes[j].hashes) for j in columns])
+            order = np.argsort(hashes, kind='stable')
+            hash_indexes.append((hashes[order], owners[order]))
+
+        candidates = []
+        # A few columns' first hashes at a time, so that the join stays small even when many columns share the same values
+        for start in range(0, len(block), LINK_DISCOVERY_JOIN_COLUMNS):
+            block_slice = block[start:start + LINK_DISCOVERY_JOIN_COLUMNS]
+            prefix_hashes = np.concatenate([min_hashes[i].hashes[:prefix_lengths[i]] for i in block_slice])
+            prefix_owners = np.repeat(np.array(block_slice, dtype=np.int64), prefix_lengths[block_slice])
+            for is_many, (hashes, owners) in zip([False, True], hash_indexes):
+                if is_many:
+                    keep = ~signatures_is_many[prefix_owners]
+                    prefix_hashes, prefix_owners = prefix_hashes[keep], prefix_owners[keep]
+                left = np.searchsorted(hashes, prefix_hashes, side='left')
+                match_counts = np.searchsorted(hashes, prefix_hashes, side='right') - left
+                positions = np.repeat(left - np.cumsum(match_counts) + match_counts, match_counts) + np.arange(match_counts.sum())
+                pair_keys, found = np.unique(np.repeat(prefix_owners, match_counts) * column_count + owners[positions], return_counts=True)
+                i, j = pair_keys // column_count, pair_keys % column_count
+                # Distinct counts of columns that aren't complete are estimates, within a few percent
+                keep = (table_names[i] != table_names[j]) & (distinct_counts[j] >= 0.9 * min_containment * distinct_counts[i])
+                i, j, found = i[keep], j[keep], found[keep]
+
+                sample_sizes = np.zeros(len(i), dtype=np.int64)
+                for column in np.unique(i):
+                    idx = np.nonzero(i == column)[0]
+                    sample_sizes[idx] = np.searchsorted(min_hashes[column].hashes, thresholds[j[idx]], side='right')
+                needed = np.minimum(prefix_lengths[i], sample_sizes) - np.floor((1 - min_containment) * sample_sizes).astype(np.int64)
+                keep = (sample_sizes >= min_sample_size) & (found >= needed)
+                candidates += list(zip(i[keep].tolist(), j[keep].tolist()))
+        return candidates
+
+    def add_links(self, links=None):
+        # Adds the links found by find_links, or the given ones, with DBLinker.add_fks. Returns its summary
+        if links is None:
+            links = self.find_links()
+        return DBLinker(self.dataset_name).add_fks([(x['table_1'], x['column_1'], x['table_2'], x['column_2']) for x in links])
+
+
+class DBIndexer():
+    # Creates and drops the join key and filter indexes of the data tables in DATA_DB, tracked in DataIndex
+    def __init__(self, dataset_name):
+        self.dataset_name = dataset_name
+        self.prefix, self.storage = db.session.query(DatasetMetadata.prefix, DatasetMetadata.storage).filter(DatasetMetadata.dataset_name == self.dataset_name).first()
+        self.data_writer = data_db.get_writer()
+        self.data_conn = self.data_writer.conn
+
+    def get_index_name(self, table, column):
+        return f'idx_{self.prefix}_{table}_{column}'
+
+    def get_index(self, table, column):
+        return db.session.query(DataIndex).filter(DataIndex.dataset_name == self.dataset_name, DataIndex.table_name == table, DataIndex.column_name == column).first()
+
+    def add_join_key_index(self, table, column, commit=True):
+        return self.add_index(table, column, is_join_key=True, commit=commit)
+
+    def add_filter_index(self, table, column, commit=True):
+        return self.add_index(table, column, is_filter=True, commit=commit)
+
+    def add_index(self, table, column, is_join_key=False, is_filter=False, commit=True):
+        if self.storage == c.STORAGE_ARROW:
+            return None
+
+        data_index = self.get_index(table, column)
+        if data_index is None:
+            index_name = self.get_index_name(table, column)
+            sql_statement = f'CREATE INDEX IF NOT EXISTS {index_name} ON {self.prefix}_{table} ({column});'
+            try:
+                with self.data_writer.lock:
+                    self.data_conn.cursor().execute(sql_statement)
+                    self.data_conn.commit()
+            except sqlite3.OperationalError:
+                logging.error(f'Unable to create index on {table}.{column}. Does it exist in the db?')
+                return None
+            logging.info(f'Created index {index_name}')
+
+            data_index = DataIndex(
+                dataset_name=self.dataset_name,
+                table_name=table,
+                column_name=column,
+                index_name=index_name,
+                is_join_key=False,
+                is_filter=False
+            )
+            db.session.add(data_index)
+
+        data_index.is_join_key = data_index.is_join_key or is_join_key
+        data_index.is_filter = data_index.is_filter or is_filter
+        if commit:
+            db.session.commit()
+        return data_index
+
+    def remove_filter_index(self, table, column, commit=True):
+        data_index = self.get_index(table, column)
+        if data_index is None:
+            return
+        data_index.is_filter = False
+        self.drop_unused_index(data_index)
+        if commit:
+            db.session.commit()
+
+    def remove_all_join_key_indexes(self, commit=True):
+        for data_index in db.session.query(DataIndex).filter(DataIndex.dataset_name == self.dataset_name, DataIndex.is_join_key).all():
+            data_index.is_join_key = False
+            self.drop_unused_index(data_index)
+        if commit:
+            db.session.commit()
+
+    def remove_all_indexes(self, commit=True):
+        for data_index in db.session.query(DataIndex).filter(DataIndex.dataset_name == self.dataset_name).all():
+            data_index.is_join_key = False
+            data_index.is_filter = False
+            self.drop_unused_index(data_index)
+        if commit:
+            db.session.commit()
+
+    def drop_unused_index(self, data_index):
+        if data_index.is_join_key or data_index.is_filter:
+            return
+        with self.data_writer.lock:
+            self.data_conn.cursor().execute(f'DROP INDEX IF EXISTS {data_index.index_name};')
+            self.data_conn.commit()
+        db.session.delete(data_index)
+        logging.info(f'Dropped index {data_index.index_name}')
+
+
+class DBProfiler():
+    # Computes ColumnStats in SQL, or in pandas a column at a time for Arrow datasets, approximately with sketches for big tables
+    def __init__(self, dataset_name, data_conn, exact=False):
+        self.dataset_name = dataset_name
+        self.prefix, self.storage = db.session.query(DatasetMetadata.prefix, DatasetMetadata.storage).filter(DatasetMetadata.dataset_name == self.dataset_name).first()
+        self.data_conn = data_conn
+        self.exact = exact
+        self.row_counts = {}
+        self.arrow_column = (None, None)
+
+    def get_column_stats(self, table, column):
+        return db.session.query(ColumnStats).filter(ColumnStats.dataset_name == self.dataset_name, ColumnStats.table_name == table, ColumnStats.column_source_name == column).first()
+
+    def add_column_stats(self, table, column, commit=True):
+        column_stats = self.compute_column_stats(table, column)
+        db.session.add(column_stats)
+        if commit:
+            db.session.commit()
+        return column_stats
+
+    def refresh_column_stats(self):
+        logging.info(f'Refreshing column stats for {self.dataset_name}')
+        db.session.query(ColumnStats).filter(ColumnStats.dataset_name == self.dataset_name).delete()
+        columns = db.session.query(ColumnMetadata.table_name, ColumnMetadata.column_source_name).filter(ColumnMetadata.dataset_name == self.dataset_name).all()
+        for table, column in columns:
+            self.add_column_stats(table, column, commit=False)
+        db.session.commit()
+        return len(columns)
+
+    def refresh_column_signatures(self):
+        # For datasets imported before column signatures existed, or to build them with another COLUMN_SIGNATURE_SIZE
+        if flask_app.config['COLUMN_SIGNATURE_SIZE'] is None:
+            e = 'COLUMN_SIGNATURE_SIZE is None, so there are no column signatures to refresh'
+            logging.error(e)
+            raise ValueError(e)
+        logging.info(f'Refreshing column signatures for {self.dataset_name}')
+        db.session.query(ColumnSignature).filter(ColumnSignature.dataset_name == self.dataset_name).delete()
+        columns = db.session.query(ColumnMetadata.table_name, ColumnMetadata.column_source_name).filter(ColumnMetadata.dataset_name == self.dataset_name).all()
+        for table, column in columns:
+            signature_tracker = ColumnSignatureTracker(flask_app.config['COLUMN_SIGNATURE_SIZE'])
+            for values in self.iterate_column_values(f'{self.prefix}_{table}', column):
+                signature_tracker.update(values)
+            db.session.add(signature_tracker.get_column_signature(self.dataset_name, table, column))
+        db.session.commit()
+        return len(columns)
+
+    def use_sketches(self, db_location):
+        approximate_min_rows = flask_app.config['COLUMN_STATS_APPROXIMATE_MIN_ROWS']
+        if self.exact or approximate_min_rows is None:
+            return False
+        if db_location not in self.row_counts:
+            if self.storage == c.STORAGE_ARROW:
+                self.row_counts[db_location] = arrow_storage.get_row_count(db_location)
+            else:
+                self.row_counts[db_location] = self.data_conn.execute(f'SELECT COUNT(*) FROM "{db_location}";').fetchone()[0]
+        return self.row_counts[db_location] >= approximate_min_rows
+
+    def read_arrow_column(self, db_location, column):
+        # The last column read is kept, since profiling it reads it more than once
+        if self.arrow_column[0] != (db_location, column):
+            self.arrow_column = ((db_location, column), arrow_storage.read_columns(db_location, [column])[column])
+        return self.arrow_column[1]
+
+    def get_column_summary(self, db_location, column, use_sketches):
+        # (null_count, distinct_count, value_count, text_count, real_count, min, max, mean), where text_count and real_count are how
+        # many values are text and floats, and distinct_count is None when use_sketches
+        if self.storage == c.STORAGE_ARROW:
+            series = self.read_arrow_column(db_location, column)
+            values = series.dropna()
+            distinct_count = None if use_sketches else values.nunique()
+            if len(values) == 0 or not is_numeric_dtype(values):
+                # Arrow columns have a single type, so a column is either all text or all numbers
+                return len(series) - len(values), distinct_count, len(values), len(values), 0, None, None, None
+            real_count = 0 if is_integer_dtype(values) else len(values)
+            return len(series) - len(values), distinct_count, len(values), 0, real_count, values.min().item(), values.max().item(), float(values.mean())
+
+        distinct_count_sql = 'NULL' if use_sketches else f'COUNT(DISTINCT "{column}")'
+        sql_statement = f'''SELECT
+            COUNT(*) - COUNT("{column}"),
+            {distinct_count_sql},
+            COUNT("{column}"),
+            SUM(typeof("{column}") IN ('text', 'blob')),
+            SUM(typeof("{column}") = 'real'),
+            MIN("{column}"),
+            MAX("{column}"),
+            AVG("{column}")
+            FROM "{db_location}";'''
+        return self.data_conn.execute(sql_statement).fetchone()
+
+    def get_distinct_values(self, db_location, column, limit):
+        # The first limit distinct values, ignoring case
+        if self.storage == c.STORAGE_ARROW:
+            values = self.read_arrow_column(db_location, column).dropna().unique().tolist()
+            return sorted(values, key=lambda x: str(x).upper())[:limit]
+
+        sql_statement = f'SELECT DISTINCT "{column}" FROM "{db_location}" WHERE "{column}" IS NOT NULL ORDER BY UPPER("{column}") LIMIT ?;'
+        return [x[0] for x in self.data_conn.execute(sql_statement, (limit, )).fetchall()]
+
+    def compute_column_stats(self, table, column):
+        # Exact stats are the same as reading the column into pandas, where it is numeric only if every value is a number and ints
+        # only stay ints when there are no nulls
+        db_location = f'{self.prefix}_{table}'
+        use_sketches = self.use_sketches(db_location)
+        null_count, distinct_count, value_count, text_count, real_count, min, max, mean = self.get_column_summary(db_location, column, use_sketches)
+
+        column_stats = ColumnStats(
+            dataset_name=self.dataset_name,
+            table_name=table,
+            column_source_name=column,
+            null_count=null_count,
+            distinct_count=distinct_count,
+            is_integer=False,
+            is_approximate=False,
+            distinct_values_truncated=False
+        )
+        max_distinct_values = flask_app.config['COLUMN_STATS_MAX_DISTINCT_VALUES']
+
+        if value_count > 0 and text_count == 0:
+            column_stats.column_type = c.COLUMN_TYPE_NUMERIC
+            column_stats.is_integer = real_count == 0 and null_count == 0
+            column_stats.min = min
+            column_stats.max = max
+            column_stats.mean = mean
+
+            if use_sketches:
+                quantile_sketch = sketches.QuantileSketch()
+                hyper_log_log = sketches.HyperLogLog()
+                for values in self.iterate_column_values(db_location, column):
+                    quantile_sketch.update(values)
+                    hyper_log_log.update(values)
+                column_stats.percentile_25, column_stats.median, column_stats.percentile_75 = [quantile_sketch.quantile(q) for q in [0.25, 0.5, 0.75]]
+                column_stats.distinct_count = hyper_log_log.estimate()
+                column_stats.is_approximate = True
+            else:
+                column_stats.percentile_25, column_stats.median, column_stats.percentile_75 = self.get_exact_quartiles(db_location, column, value_count)
+        else:
+            column_stats.column_type = c.COLUMN_TYPE_TEXT
+
+            if use_sketches:
+                heavy_hitters = sketches.HeavyHitters(k=max_distinct_values)
+                hyper_log_log = sketches.HyperLogLog()
+                for values in self.iterate_column_values(db_location, column):
+                    heavy_hitters.update(values)
+                    hyper_log_log.update(values)
+                # If there were no more distinct values than the heavy hitters keep, they're all there and so the counts are exact
+                distinct_values = heavy_hitters.top()
+                if heavy_hitters.is_complete:
+                    column_stats.distinct_count = len(distinct_values)
+                else:
+                    column_stats.distinct_count = hyper_log_log.estimate()
+                    column_stats.distinct_values_truncated = True
+                    column_stats.is_approximate = True
+            else:
+                distinct_values = self.get_distinct_values(db_location, column, max_distinct_values)
+                column_stats.distinct_values_truncated = distinct_count > max_distinct_values
+            column_stats.distinct_values = json.dumps(sorted(distinct_values, key=lambda x: str(x).upper()))
+
+        return column_stats
+
+    def iterate_column_values(self, db_location, column):
+        if self.storage == c.STORAGE_ARROW:
+            for df in arrow_storage.iterate_columns(db_location, [column]):
+                yield df[column].dropna().tolist()
+            return
+
+        cursor = self.data_conn.execute(f'SELECT "{column}" FROM "{db_location}" WHERE "{column}" IS NOT NULL;')
+        while True:
+            rows = cursor.fetchmany(flask_app.config['INGEST_CHUNK_SIZE'])
+            if len(rows) == 0:
+                break
+            yield [x[0] for x in rows]
+
+    def get_exact_quartiles(self, db_location, column, value_count):
+        if self.storage == c.STORAGE_ARROW:
+            return self.read_arrow_column(db_location, column).quantile([0.25, 0.5, 0.75]).tolist()
+
+        # Interpolated the way pandas does, with a single sort to find the values on either side of each quartile
+        positions = [(value_count - 1) * q for q in [0.25, 0.5, 0.75]]
+        row_numbers = sorted(set(itertools.chain.from_iterable((int(x), int(x) + (x % 1 > 0)) for x in positions)))
+        sql_statement = f'''SELECT row_number, value FROM (
+            SELECT "{column}" AS value, ROW_NUMBER() OVER (ORDER BY "{column}") - 1 AS row_number FROM "{db_location}" WHERE "{column}" IS NOT NULL
+            ) WHERE row_number IN ({', '.join('?' for _ in row_numbers)});'''
+        values = dict(self.data_conn.execute(sql_statement, row_numbers).fetchall())
+
+        quartiles = []
+        for position in positions:
+            below, above, fraction = values[int(position)], values[int(position) + (position % 1 > 0)], position % 1
+            if fraction == 0.5:
+                quartiles.append((below + above) / 2)
+            elif fraction < 0.5:
+                quartiles.append(below + (above - below) * fraction)
+            else:
+                quartiles.append(above - (above - below) * (1 - fraction))
+        return quartiles
+
+
+def customize_columns(custom_column_names, exclude_column_ids, include_column_ids):
+    # Renames, hides and shows columns of any dataset in one transaction. Returns the sorted ids that don't exist
+    all_column_ids = set(custom_column_names) | set(exclude_column_ids) | set(include_column_ids)
+    int_column_ids = {}
+    for column_id in all_column_ids:
+        try:
+            int_column_ids[column_id] = int(column_id)
+        except (TypeError, ValueError):
+            pass
+
+    dataset_names = {}
+    int_ids = sorted(set(int_column_ids.values()))
+    for i in range(0, len(int_ids), SQL_IN_BATCH_SIZE):
+        dataset_names.update(db.session.query(ColumnMetadata.id, ColumnMetadata.dataset_name).filter(ColumnMetadata.id.in_(int_ids[i:i + SQL_IN_BATCH_SIZE])).all())
+    missing_column_ids = sorted([x for x in all_column_ids if int_column_ids.get(x) not in dataset_names], key=str)
+    if len(missing_column_ids) > 0:
+        logging.warning(f'Could not find columns with ids {missing_column_ids}')
+
+    renames = [{'id': int_column_ids[k], 'column_custom_name': v} for k, v in custom_column_names.items() if int_column_ids.get(k) in dataset_names]
+    include_ids = set(int_column_ids[x] for x in include_column_ids if int_column_ids.get(x) in dataset_names)
+    exclude_ids = set(int_column_ids[x] for x in exclude_column_ids if int_column_ids.get(x) in dataset_names) - include_ids
+    try:
+        db.session.bulk_update_mappings(ColumnMetadata, renames)
+        for visible, column_ids in [(False, sorted(exclude_ids)), (True, sorted(include_ids))]:
+            for i in range(0, len(column_ids), SQL_IN_BATCH_SIZE):
+                db.session.query(ColumnMetadata).filter(ColumnMetadata.id.in_(column_ids[i:i + SQL_IN_BATCH_SIZE])).update({'visible': visible}, synchronize_session=False)
+        changed_ids = set(x['id'] for x in renames) | include_ids | exclude_ids
+        for dataset_name in sorted(set(dataset_names[x] for x in changed_ids)):
+            cache.invalidate_dataset(dataset_name)
+            bump_dataset_generation(dataset_name)
         db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(e)
+        raise Exception(e)
+    return missing_column_ids
 
 
 class DBCustomizer():
@@ -276,6 +1261,8 @@ class DBCustomizer():
                 logging.error(e)
                 raise AttributeError(e)
 
+        cache.invalidate_dataset(self.dataset_name)
+        bump_dataset_generation(self.dataset_name)
         db.session.commit()
 
     def get_custom_column_name(self, reference_table, original_name):
@@ -294,90 +1281,98 @@ class DBCustomizer():
         pass
 
 
-class DBExtractor():
-    def __init__(self, dataset_name):
-        # path-finding, get data out
+class RelationshipGraph():
+    # Adjacency lists of a dataset's TableRelationships, shared through get_relationship_graph()
+    def __init__(self, dataset_name, load_paths=True):
         self.dataset_name = dataset_name
-        self.prefix = db.session.query(DatasetMetadata.prefix).filter(DatasetMetadata.dataset_name == self.dataset_name).first()[0]
-        self.data_conn = sqlite3.connect(flask_app.config['DATA_DB'])
-    
-    def find_table_all_connectable_tables(self, table):
-        # Return children and siblings, e.g. tables that I can go to next from this table
-
-        return sorted([x[0] for x in db.session.query(TableRelationship.other_table).filter(
-            TableRelationship.dataset_name == self.dataset_name,
-            TableRelationship.reference_table == table,
-            (TableRelationship.is_parent | TableRelationship.is_sibling)
-        ).all()], key=lambda x: x.upper())
-
-    def find_table_children(self, table):
-        return sorted([x[0] for x in db.session.query(TableRelationship.other_table).filter(
-            TableRelationship.dataset_name == self.dataset_name,
-            TableRelationship.reference_table == table,
-            TableRelationship.is_parent
-        ).all()], key=lambda x: x.upper())
-
-    def find_table_siblings(self, table):
-        return sorted([x[0] for x in db.session.query(TableRelationship.other_table).filter(
-            TableRelationship.dataset_name == self.dataset_name,
-            TableRelationship.reference_table == table,
-            TableRelationship.is_sibling
-        ).all()], key=lambda x: x.upper())
-
-    def find_table_parents(self, table):
-        return sorted([x[0] for x in db.session.query(TableRelationship.other_table).filter(
-            TableRelationship.dataset_name == self.dataset_name,
-            TableRelationship.reference_table == table,
-            TableRelationship.is_child
-        ).all()], key=lambda x: x.upper())
-
-    def find_multi_tables_still_accessible_tables(self, include_tables, fix_first=False):
-        # Given a list of include_tables that must be in a valid path (not necessarily in order), iterate through the rest of the tables to figure out if there are paths between include_tables and each of those
-        
-        # In order for a table to be potentially connectable, it must have is_child, is_sibling or is_parent = True for all of the include_tables
+        self.parents = defaultdict(list)
+        self.children = defaultdict(list)
+        self.siblings = defaultdict(list)
+        self.step_siblings = defaultdict(list)
+        self.joining_keys = {}  # {(reference_table, other_table): (reference_key, other_key)}
+        self.paths = {}  # {(start_table, destination_table): paths}, precomputed by DBLinker.update_table_paths
+
+        relationships = db.session.query(TableRelationship).filter(TableRelationship.dataset_name == self.dataset_name).order_by(TableRelationship.id).all()
+        for x in relationships:
+            if x.is_parent:
+                self.children[x.reference_table].append(x.other_table)
+            if x.is_child:
+                self.parents[x.reference_table].append(x.other_table)
+            if x.is_sibling:
+                self.siblings[x.reference_table].append(x.other_table)
+            if x.is_step_sibling:
+                self.step_siblings[x.reference_table].append(x.other_table)
+            if (x.reference_table, x.other_table) not in self.joining_keys:
+                self.joining_keys[(x.reference_table, x.other_table)] = (x.reference_key, x.other_key)
+
+        for adjacency in [self.parents, self.children, self.siblings, self.step_siblings]:
+            for table, other_tables in adjacency.items():
+                adjacency[table] = sorted(other_tables, key=lambda x: x.upper())
+
+        if load_paths:
+            for x in db.session.query(TablePath).filter(TablePath.dataset_name == self.dataset_name).all():
+                self.paths[(x.start_table, x.destination_table)] = json.loads(x.paths)
+
+    def get_parents(self, table):
+        return self.parents.get(table, [])
+
+    def get_children(self, table):
+        return self.children.get(table, [])
+
+    def get_siblings(self, table):
+        return self.siblings.get(table, [])
+
+    def get_step_siblings(self, table):
+        return self.step_siblings.get(table, [])
+
+    def get_connectable(self, table):
+        # children and siblings, e.g. tables that I can go to next from this table
+        return sorted(self.get_children(table) + self.get_siblings(table), key=lambda x: x.upper())
+
+    def get_related(self, table):
+        # Any table that this table has a parent, child or sibling relationship with
+        return set(self.get_parents(table) + self.get_children(table) + self.get_siblings(table))
 
-        # First verify that this is a valid path that has been put forward
-        if len(self.find_paths_multi_tables(include_tables, fix_first=fix_first)) == 0:
-            return []
-
-        connectable_relationships = db.session.query(TableRelationship).filter(
-            TableRelationship.other_table.in_(include_tables),
-            ((TableRelationship.is_parent) | (TableRelationship.is_sibling) | (TableRelationship.is_child))
-        ).all()
-
-        possible_tables = list(set([x.reference_table for x in connectable_relationships]))
-        accessible_tables = []
-        for table in possible_tables:
-            related_include_tables = set()
-            for x in connectable_relationships:
-                if x.reference_table == table and x.other_table in include_tables:
-                    related_include_tables.add(x.other_table)
-            if len(related_include_tables) == len(include_tables):
-                accessible_tables.append(table)
-        
-        return accessible_tables
-
-    def find_paths_between_tables(self, start_table, destination_table, current_path=[]):
+    def get_joining_keys(self, table_1, table_2):
+        # order matters here
+        return self.joining_keys.get((table_1, table_2))
+
+    def get_connected_tables(self, table):
+        # All tables reachable from this table through parent, child or sibling links in either direction, including itself
+        connected_tables = set()
+        tables_to_visit = [table]
+        while len(tables_to_visit) > 0:
+            current_table = tables_to_visit.pop()
+            if current_table not in connected_tables:
+                connected_tables.add(current_table)
+                tables_to_visit.extend(self.get_related(current_table))
+        return connected_tables
+
+    def get_paths(self, start_table, destination_table):
+        # Returns None if the paths between these two tables were never precomputed
+        return self.paths.get((start_table, destination_table))
+
+    def search_paths_between_tables(self, start_table, destination_table, current_path=[]):
         if start_table == destination_table:
             return [start_table]
 
         all_paths = []
         
         current_path = current_path.copy() + [start_table]
-        if (destination_table in self.find_table_all_connectable_tables(start_table)):  # immediately return valid path rather than going through children/siblings
+        if (destination_table in self.get_connectable(start_table)):  # immediately return valid path rather than going through children/siblings
             all_paths.append(current_path.copy() + [destination_table])
             return all_paths
 
-        elif len(self.find_table_children(start_table)) == 0 and len(self.find_table_siblings(start_table)) == 0:  # destination table wasn't found and this path has nowhere else to go
+        elif len(self.get_children(start_table)) == 0 and len(self.get_siblings(start_table)) == 0:  # destination table wasn't found and this path has nowhere else to go
             return []
 
-        elif destination_table in self.find_table_parents(start_table):
+        elif destination_table in self.get_parents(start_table):
             # if found in parents, then if parent is not a sibling of any of this tables siblings, then there's no path to get up to that parent
             # if it is a sibling of a sibling, then return that sibling + destination table appended to current_path
             found_sibling_of_sibling = False
-            start_table_siblings = self.find_table_siblings(start_table)
+            start_table_siblings = self.get_siblings(start_table)
             for start_table_sibling in start_table_siblings:
-                sibling_siblings = self.find_table_siblings(start_table_sibling)
+                sibling_siblings = self.get_siblings(start_table_sibling)
                 if destination_table in sibling_siblings:
                     found_sibling_of_sibling = True
                     all_paths.append(current_path.copy() + [start_table_sibling] + [destination_table])
@@ -386,80 +1381,758 @@ class DBExtractor():
             else:
                 return []
 
-        for child_table in self.find_table_children(start_table):
-            for path in self.find_paths_between_tables(start_table=child_table, destination_table=destination_table, current_path=current_path):
+        for child_table in self.get_children(start_table):
+            for path in self.search_paths_between_tables(start_table=child_table, destination_table=destination_table, current_path=current_path):
                 all_paths.append(path)
         
-        for sibling_table in self.find_table_siblings(start_table):
+        for sibling_table in self.get_siblings(start_table):
             if sibling_table not in current_path:  # prevents just looping across siblings forever
-                for path in self.find_paths_between_tables(start_table=sibling_table, destination_table=destination_table, current_path=current_path):
+                for path in self.search_paths_between_tables(start_table=sibling_table, destination_table=destination_table, current_path=current_path):
                     all_paths.append(path)
 
         return all_paths
 
-    def find_paths_multi_tables(self, list_of_tables, fix_first=False):
-        '''
-        Given a list of tables in any order, find a path that traverses all of them.
 
-        If fix_first is True, then the first element will remain constant (useful when wanting to break down a specific outcome by various other variables)
+class MultiTablePathFinder():
+    # Finds every path that traverses all of list_of_tables, depth-first with a memo of dead ends, within max_tables and timeout
+    def __init__(self, find_paths_between_tables, list_of_tables, fix_first=False, max_tables=None, timeout=None):
+        self.find_paths_between_tables = find_paths_between_tables
+        self.list_of_tables = list(list_of_tables)
+        self.fix_first = fix_first
+        self.max_tables = max_tables
+        self.timeout = timeout
+        self.pair_paths = {}
+        self.can_complete_memo = {}
+        self.deadline = None
+        self.timed_out = False
+
+    def get_pair_paths(self, start_table, destination_table):
+        key = (start_table, destination_table)
+        if key not in self.pair_paths:
+            self.pair_paths[key] = self.find_paths_between_tables(start_table=start_table, destination_table=destination_table)
+        return self.pair_paths[key]
+
+    def start_clock(self):
+        if self.timeout is not None:
+            self.deadline = time.monotonic() + self.timeout
+
+    def out_of_time(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            if not self.timed_out:
+                logging.warning(f'Timed out after {self.timeout}s finding paths between {self.list_of_tables}. Returning paths found so far')
+            self.timed_out = True
+        return self.timed_out
+
+    def can_complete(self, remaining, current_index):
+        # remaining is a frozenset of indices into list_of_tables that still need to be visited after current_index
+        if len(remaining) == 0:
+            return True
+
+        key = (remaining, current_index)
+        if key not in self.can_complete_memo:
+            current_table = self.list_of_tables[current_index]
+            self.can_complete_memo[key] = any(
+                len(self.get_pair_paths(current_table, self.list_of_tables[i])) > 0 and self.can_complete(remaining - {i}, i)
+                for i in sorted(remaining)
+            )
+        return self.can_complete_memo[key]
+
+    def get_start_indices(self):
+        if self.fix_first:
+            return [0]
+        return range(len(self.list_of_tables))
+
+    def too_many_tables(self):
+        return self.max_tables is not None and len(self.list_of_tables) > self.max_tables
+
+    def iterate_valid_orders(self):
+        all_indices = frozenset(range(len(self.list_of_tables)))
+        if self.too_many_tables():
+            logging.warning(f'{len(self.list_of_tables)} tables is over the limit of {self.max_tables}. Only trying the order given: {self.list_of_tables}')
+            if all(len(self.get_pair_paths(pair[0], pair[1])) > 0 for pair in u.pairwise(self.list_of_tables)):
+                yield list(range(len(self.list_of_tables)))
+            return
+
+        def extend(order, remaining):
+            if len(remaining) == 0:
+                yield order
+                return
+            for i in sorted(remaining):
+                if self.out_of_time():
+                    return
+                if len(self.get_pair_paths(self.list_of_tables[order[-1]], self.list_of_tables[i])) > 0 and self.can_complete(remaining - {i}, i):
+                    yield from extend(order + [i], remaining - {i})
+
+        for start_index in self.get_start_indices():
+            if self.can_complete(all_indices - {start_index}, start_index):
+                yield from extend([start_index], all_indices - {start_index})
+
+    def is_connectable(self):
+        # Cheaper than find_paths when only need to know whether at least one path exists
+        if len(self.list_of_tables) == 1:
+            return True
+        self.start_clock()
+        if self.too_many_tables():
+            return any(True for _ in self.iterate_valid_orders())
+        all_indices = frozenset(range(len(self.list_of_tables)))
+        return any(self.can_complete(all_indices - {i}, i) for i in self.get_start_indices())
+
+    def find_paths(self):
+        if len(self.list_of_tables) == 1:
+            return [self.list_of_tables]
+
+        self.start_clock()
+        flattened_valid_complete_paths = []
+        for order in self.iterate_valid_orders():
+            tables_in_order = [self.list_of_tables[i] for i in order]
+            path_possibilities_pairwise = [self.get_pair_paths(pair[0], pair[1]) for pair in u.pairwise(tables_in_order)]
+            for combo in itertools.product(*path_possibilities_pairwise):
+                flattened_valid_complete_paths.append(list(u.flatten(combo)))
+                if self.out_of_time():
+                    break
+            if self.out_of_time():
+                break
+
+        return u.remove_adjacent_repeats(flattened_valid_complete_paths)
+
+
+class SQLAggregator():
+    # Does what aggregate_df does to the join inside the db, so only one row per group comes back. read_sql is (sql_statement, params) -> DataFrame
+    def __init__(self, base_sql, base_columns, read_sql):
+        self.base_sql = base_sql
+        self.base_columns = base_columns
+        self.read_sql = read_sql
+        # Of every base column, once aggregate has profiled the join
+        self.column_dtypes = {}
+
+    def run(self, sql_statement, params=[], ctes=[]):
+        with_clause = ', '.join([f'base AS ({self.base_sql})'] + ctes)
+        sql_statement = f'WITH {with_clause} {sql_statement}'
+        logging.info(sql_statement)
+        return self.read_sql(sql_statement, params)
+
+    def get_column_dtypes(self, columns):
+        # Returns {column: 'int' | 'float' | 'text'}, matching the dtype pandas would give the column if the whole join was read in
+        return self.profile(columns, {})[0]
+
+    def profile(self, columns, min_max_conditions):
+        # get_column_dtypes(columns), and {column: 1x2 frame of its min and max} over the rows matching the (where_sql, params) given
+        # for it in min_max_conditions, all from one pass over base
+        if len(columns) == 0 and len(min_max_conditions) == 0:
+            return {}, {}
+
+        selects = []
+        params = []
+        for column in columns:
+            selects.extend(self.get_column_type_sql(column))
+            selects.append(f'COUNT(*) > COUNT({column})')
+            selects.append(f'COUNT({column})')
+        for column, (where_sql, where_params) in min_max_conditions.items():
+            selects.append(f'MIN(CASE WHEN {where_sql} THEN {column} END)')
+            selects.append(f'MAX(CASE WHEN {where_sql} THEN {column} END)')
+            params.extend(where_params * 2)
+        result = self.run(f'SELECT {", ".join(selects)} FROM base', params)
+        row = result.iloc[0]
+
+        column_dtypes = {}
+        for i, column in enumerate(columns):
+            has_text, has_real, has_null, non_null_count = row.iloc[i * 4:(i + 1) * 4]
+            if non_null_count == 0 or has_text:
+                column_dtypes[column] = 'text'
+            elif has_real or has_null:
+                column_dtypes[column] = 'float'
+            else:
+                column_dtypes[column] = 'int'
+        min_maxes = {column: result.iloc[:, len(columns) * 4 + i * 2:len(columns) * 4 + (i + 1) * 2] for i, column in enumerate(min_max_conditions)}
+        return column_dtypes, min_maxes
+
+    def get_column_type_sql(self, column):
+        # Whether any value of column is text, and whether any is a float
+        return f"MAX(typeof({column}) IN ('text', 'blob'))", f"MAX(typeof({column}) = 'real')"
+
+    def get_sum_sql(self, aggregate_column):
+        return f'SUM({aggregate_column})'
+
+    def get_median_sql(self, groupby_columns, aggregate_column):
+        # The middle row, or the mean of the two middle rows, of each group
+        groupby_sql = ', '.join(groupby_columns)
+        return f'''
+            SELECT {groupby_sql}, AVG({aggregate_column}) AS {aggregate_column} FROM (
+                SELECT {groupby_sql}, {aggregate_column},
+                    ROW_NUMBER() OVER (PARTITION BY {groupby_sql} ORDER BY {aggregate_column}) AS group_row,
+                    COUNT(*) OVER (PARTITION BY {groupby_sql}) AS group_size
+                FROM labeled
+            ) WHERE group_row IN ((group_size + 1) / 2, (group_size + 2) / 2) GROUP BY {groupby_sql}
         '''
-        # first get all combos, these are candidate incomplete paths (missing intermediary tables)
-        if len(list_of_tables) == 1:
-            return [list_of_tables]
 
-        permutations = itertools.permutations(list_of_tables)
-        if fix_first:
-            permutations = [x for x in permutations if x[0] == list_of_tables[0]]
-        
-        valid_incomplete_paths = []
-        for permutation in permutations:
-            is_valid = True
-            for pair in u.pairwise(permutation):
-                if len(self.find_paths_between_tables(start_table=pair[0], destination_table=pair[1])) == 0:
-                    is_valid = False
-            if is_valid:
-                valid_incomplete_paths.append(permutation)
-        
-        unflattened_valid_complete_paths = []
-        for valid_incomplete_path in valid_incomplete_paths:
-            path_possibilities_pairwise = []
-            for pair in u.pairwise(valid_incomplete_path):
-                path_possibilities_pairwise.append(self.find_paths_between_tables(start_table=pair[0], destination_table=pair[1]))
-            combos = itertools.product(*path_possibilities_pairwise)
-            for combo in combos:
-                unflattened_valid_complete_paths.append(list(combo))
+    def aggregate(self, groupby_columns, filters, aggregate_column=None, aggregate_fxn='Count'):
+        # Returns (grouped, filter_filters, range_columns) for DBExtractor.aggregate_grouped_df
+        # The labels of an unfiltered column only see the list filters of the columns before it, so the rows they're taken from
+        # are worked out first, and the dtypes and numeric labels then all come from one pass over the join
+        conditions = [f'{column} IS NOT NULL' for column in self.base_columns]
+        condition_params = []
+        label_conditions = {}
+        for column in groupby_columns:
+            filter = filters.get(column, None)
+            if filter is None:
+                label_conditions[column] = (' AND '.join(conditions), list(condition_params))
+            elif filter['type'] == 'list':
+                conditions.append(f'{column} IN ({", ".join(["?"] * len(filter["filter"]))})')
+                condition_params.extend(filter['filter'])
+        self.column_dtypes, min_maxes = self.profile(self.base_columns, label_conditions)
 
-        flattened_valid_complete_paths = []
-        for l in unflattened_valid_complete_paths:
-            flattened_valid_complete_paths.append(list(u.flatten(l)))
+        selects = []
+        select_params = []
+        filter_filters = []
+        range_columns = {}
+        # {index in filter_filters: column} of text labels taken from the grouped rows, which see the same rows when no list
+        # filter comes after the column
+        grouped_labels = {}
+        for column in groupby_columns:
+            filter = filters.get(column, None)
+            if filter is None:
+                where_sql, where_params = label_conditions[column]
+                if self.column_dtypes[column] == 'text':
+                    if where_params == condition_params and where_sql == ' AND '.join(conditions):
+                        grouped_labels[len(filter_filters)] = column
+                        filter_filters.append(None)
+                    else:
+                        values = self.run(f'SELECT DISTINCT {column} FROM base WHERE {where_sql}', where_params).iloc[:, 0]
+                        filter_filters.append(sorted(values, key=lambda x: x.upper()))
+                    selects.append(column)
+                else:
+                    min_max = min_maxes[column]
+                    if self.column_dtypes[column] == 'float' or min_max.isna().any(axis=None):
+                        min_max = min_max.astype('float64')
+                    min = u.reduce_precision(min_max.iloc[0, 0], 2)
+                    max = u.reduce_precision(min_max.iloc[0, 1], 2)
+
+                    label = f'({min}, {max})'
+                    selects.append(f'? AS {column}')
+                    select_params.append(label)
+                    filter_filters.append([label])
+            elif filter['type'] == 'list':
+                filter_filters.append(filter['filter'])
+                selects.append(column)
+            elif filter['type'] == 'range':
+                bin_cuts = get_bin_cuts(filter['filter']['min'], filter['filter']['max'], filter['filter']['bins'])
+                bin_labels = get_bin_labels(bin_cuts)
+                # Same intervals as pd.cut(right=True, include_lowest=True). Values outside every bin become NULL
+                cases = [f'WHEN {column} = ? THEN ?']
+                select_params.extend([bin_cuts[0], bin_labels[0]])
+                for (bin_min, bin_max), bin_label in zip(u.pairwise(bin_cuts), bin_labels):
+                    cases.append(f'WHEN {column} > ? AND {column} <= ? THEN ?')
+                    select_params.extend([bin_min, bin_max, bin_label])
+                selects.append(f'CASE {" ".join(cases)} END AS {column}')
+                filter_filters.append(bin_labels)
+                range_columns[column] = bin_labels
+
+        if aggregate_column is not None:
+            selects.append(aggregate_column)
+        labeled_cte = f'labeled AS (SELECT {", ".join(selects)} FROM base WHERE {" AND ".join(conditions)})'
+        params = select_params + condition_params
+
+        groupby_sql = ', '.join(groupby_columns)
+        if aggregate_column is None:
+            sql_statement = f'SELECT {groupby_sql}, COUNT(*) AS {GROUPED_COUNT_COLUMN} FROM labeled GROUP BY {groupby_sql}'
+        elif aggregate_fxn in ['Count', 'Percents']:
+            sql_statement = f'SELECT {groupby_sql}, {aggregate_column}, COUNT(*) AS {GROUPED_COUNT_COLUMN} FROM labeled GROUP BY {groupby_sql}, {aggregate_column}'
+        elif aggregate_fxn == 'Sum':
+            sql_statement = f'SELECT {groupby_sql}, {self.get_sum_sql(aggregate_column)} AS {aggregate_column} FROM labeled GROUP BY {groupby_sql}'
+        elif aggregate_fxn == 'Mean':
+            sql_statement = f'SELECT {groupby_sql}, AVG({aggregate_column}) AS {aggregate_column} FROM labeled GROUP BY {groupby_sql}'
+        elif aggregate_fxn == 'Median':
+            sql_statement = self.get_median_sql(groupby_columns, aggregate_column)
+        else:
+            e = f'Unknown aggregate function {aggregate_fxn}'
+            logging.error(e)
+            raise ValueError(e)
+
+        grouped = self.run(sql_statement, params, ctes=[labeled_cte])
+        for i, column in grouped_labels.items():
+            filter_filters[i] = sorted(grouped[column].unique(), key=lambda x: x.upper())
+        if len(grouped) == 0:
+            # aggregate_df passes its filtered, still unaggregated frame through when nothing is left, so mirror its columns
+            grouped = pd.DataFrame({x: pd.Series(dtype='object' if self.column_dtypes[x] == 'text' else 'float64') for x in self.base_columns})
+        return grouped, filter_filters, range_columns
+
+
+class DuckDBAggregator(SQLAggregator):
+    # SQLAggregator for DuckDB, where a column's type comes from its schema
+    def get_column_type_sql(self, column):
+        return f"MAX(typeof({column}) IN ('VARCHAR', 'BLOB'))", f"MAX(typeof({column}) IN ('FLOAT', 'DOUBLE') OR typeof({column}) LIKE 'DECIMAL%')"
+
+    def get_sum_sql(self, aggregate_column):
+        # DuckDB adds integers up as a HUGEINT, which pandas gets as floats, so a column pandas would read as ints is cast back
+        if self.column_dtypes[aggregate_column] == 'int':
+            return f'CAST(SUM({aggregate_column}) AS BIGINT)'
+        return f'SUM({aggregate_column})'
+
+    def get_median_sql(self, groupby_columns, aggregate_column):
+        # MEDIAN interpolates between the two middle values the way pandas does
+        groupby_sql = ', '.join(groupby_columns)
+        return f'SELECT {groupby_sql}, MEDIAN({aggregate_column}) AS {aggregate_column} FROM labeled GROUP BY {groupby_sql}'
+
+
+class ChunkedAggregator():
+    # Does what aggregate_df does to one batch of the join at a time, keeping only a running state per group. Medians are exact
+    # until a state holds max_median_values distinct values and approximate from sketches after
+    def __init__(self, groupby_columns, filters, column_dtypes, aggregate_column=None, aggregate_fxn='Count', max_median_values=None):
+        if aggregate_column is not None and aggregate_fxn not in ['Count', 'Percents', 'Sum', 'Mean', 'Median']:
+            e = f'Unknown aggregate function {aggregate_fxn}'
+            logging.error(e)
+            raise ValueError(e)
+
+        self.groupby_columns = groupby_columns
+        self.filters = filters
+        self.column_dtypes = column_dtypes
+        self.aggregate_column = aggregate_column
+        self.aggregate_fxn = aggregate_fxn
+        self.max_median_values = max_median_values
+        self.columns = groupby_columns + ([] if aggregate_column is None else [aggregate_column])
+
+        # What the labels of unfiltered columns are made from: their distinct values if text, otherwise their [min, max]
+        self.unfiltered_values = {}
+        self.range_columns = {}
+        for column in groupby_columns:
+            filter = filters.get(column, None)
+            if filter is None:
+                self.unfiltered_values[column] = set() if column_dtypes[column] == 'text' else [None, None]
+            elif filter['type'] == 'range':
+                self.range_columns[column] = get_bin_labels(get_bin_cuts(filter['filter']['min'], filter['filter']['max'], filter['filter']['bins']))
+
+        self.state = None
+        self.median_sketches = None
+
+    def update(self, chunk):
+        for column in self.columns:
+            if self.column_dtypes[column] == 'float' and chunk[column].dtype != 'float64':
+                chunk[column] = chunk[column].astype('float64')
+            elif self.column_dtypes[column] == 'text' and chunk[column].dtype != 'object':
+                chunk[column] = chunk[column].astype('object')
+
+        keep_rows = np.ones(len(chunk), dtype=bool)
+        for column in self.columns:
+            keep_rows &= chunk[column].notna().to_numpy()
+
+        # As in aggregate_df, each groupby column only sees the list filters of the columns before it
+        for column in self.groupby_columns:
+            filter = self.filters.get(column, None)
+            if filter is None:
+                values = chunk[column][keep_rows]
+                if self.column_dtypes[column] == 'text':
+                    self.unfiltered_values[column].update(values.unique())
+                elif len(values) > 0:
+                    min_max = self.unfiltered_values[column]
+                    min_max[0] = values.min() if min_max[0] is None else min(min_max[0], values.min())
+                    min_max[1] = values.max() if min_max[1] is None else max(min_max[1], values.max())
+            elif filter['type'] == 'list':
+                keep_rows &= chunk[column].isin(filter['filter']).to_numpy()
+
+        chunk = chunk[self.columns].take(np.flatnonzero(keep_rows))
+        if len(chunk) == 0:
+            return
+
+        for column in self.groupby_columns:
+            filter = self.filters.get(column, None)
+            if filter is None and self.column_dtypes[column] != 'text':
+                # Replaced by the label once the whole join has been seen
+                chunk[column] = 0
+            elif column in self.range_columns:
+                # Rows outside every bin are kept as a group of their own, as SQLAggregator does, since pandas would still count them
+                # as rows that survived the filters. '' can't be a bin label
+                bin_cuts = get_bin_cuts(filter['filter']['min'], filter['filter']['max'], filter['filter']['bins'])
+                chunk[column] = pd.cut(chunk[column], bin_cuts, include_lowest=True, labels=self.range_columns[column]).astype('object').fillna('')
+
+        if self.aggregate_column is None:
+            partial = chunk.groupby(self.groupby_columns).size()
+        elif self.aggregate_fxn in ['Count', 'Percents', 'Median']:
+            partial = chunk.groupby(self.columns).size()
+        elif self.aggregate_fxn == 'Sum':
+            partial = chunk.groupby(self.groupby_columns)[self.aggregate_column].sum()
+        elif self.aggregate_fxn == 'Mean':
+            partial = chunk.groupby(self.groupby_columns)[self.aggregate_column].agg(['sum', 'count'])
+        self.merge(partial)
+
+    def merge(self, partial):
+        if self.median_sketches is not None:
+            self.update_median_sketches(partial)
+            return
+
+        if self.state is None:
+            self.state = partial
+        else:
+            self.state = pd.concat([self.state, partial]).groupby(level=list(range(partial.index.nlevels))).sum()
+
+        if self.aggregate_fxn == 'Median' and self.aggregate_column is not None and self.max_median_values is not None and len(self.state) > self.max_median_values:
+            logging.warning(f'More than {self.max_median_values} distinct values of {self.aggregate_column}, the medians will be approximate')
+            self.median_sketches = {}
+            self.update_median_sketches(self.state)
+            self.state = None
+
+    def update_median_sketches(self, value_counts):
+        for group, counts in value_counts.groupby(level=list(range(len(self.groupby_columns)))):
+            group = group if isinstance(group, tuple) else (group, )
+            median_sketch = self.median_sketches.setdefault(group, sketches.QuantileSketch())
+            median_sketch.update_counts(counts.index.get_level_values(-1), counts.to_numpy())
+
+    def get_medians(self):
+        # {group: median}, for the median of an even number of values being the mean of the middle two as in pandas
+        medians = {}
+        if self.median_sketches is not None:
+            for group, median_sketch in self.median_sketches.items():
+                medians[group] = median_sketch.quantile(0.5)
+            return medians
+
+        for group, counts in self.state.groupby(level=list(range(len(self.groupby_columns)))):
+            group = group if isinstance(group, tuple) else (group, )
+            counts = counts.sort_index(level=-1)
+            values = counts.index.get_level_values(-1)
+            cumulative_counts = np.cumsum(counts.to_numpy())
+            positions = [(cumulative_counts[-1] - 1) // 2, cumulative_counts[-1] // 2]
+            medians[group] = np.mean([values[np.searchsorted(cumulative_counts, x, side='right')] for x in positions])
+        return medians
+
+    def result(self):
+        # Returns (grouped, filter_filters, range_columns), like SQLAggregator.aggregate
+        filter_filters = []
+        labels = {}
+        for column in self.groupby_columns:
+            filter = self.filters.get(column, None)
+            if filter is None:
+                if self.column_dtypes[column] == 'text':
+                    filter_filters.append(sorted(self.unfiltered_values[column], key=lambda x: x.upper()))
+                else:
+                    min, max = [np.nan if x is None else x for x in self.unfiltered_values[column]]
+                    if self.column_dtypes[column] == 'float':
+                        min, max = float(min), float(max)
+                    labels[column] = f'({u.reduce_precision(min, 2)}, {u.reduce_precision(max, 2)})'
+                    filter_filters.append([labels[column]])
+            elif filter['type'] == 'list':
+                filter_filters.append(filter['filter'])
+            elif filter['type'] == 'range':
+                filter_filters.append(self.range_columns[column])
+
+        if self.state is None and self.median_sketches is None:
+            # aggregate_df passes its filtered, still unaggregated frame through when nothing is left, so mirror its columns
+            grouped = pd.DataFrame({x: pd.Series(dtype='object' if self.column_dtypes[x] == 'text' else 'float64') for x in self.columns})
+            return grouped, filter_filters, self.range_columns
+
+        if self.aggregate_column is None or self.aggregate_fxn in ['Count', 'Percents']:
+            grouped = self.state.rename(GROUPED_COUNT_COLUMN).reset_index()
+        elif self.aggregate_fxn == 'Sum':
+            grouped = self.state.reset_index()
+        elif self.aggregate_fxn == 'Mean':
+            grouped = (self.state['sum'] / self.state['count']).rename(self.aggregate_column).reset_index()
+        elif self.aggregate_fxn == 'Median':
+            medians = self.get_medians()
+            grouped = pd.DataFrame(list(medians.keys()), columns=self.groupby_columns)
+            grouped[self.aggregate_column] = list(medians.values())
+
+        for column, label in labels.items():
+            grouped[column] = label
+        for column in self.range_columns:
+            grouped[column] = grouped[column].where(grouped[column] != '', None)
+        return grouped, filter_filters, self.range_columns
+
+
+class DBExtractor():
+    def __init__(self, dataset_name):
+        # path-finding, get data out
+        self.dataset_name = dataset_name
+        self.prefix, self.storage = db.session.query(DatasetMetadata.prefix, DatasetMetadata.storage).filter(DatasetMetadata.dataset_name == self.dataset_name).first()
+        self._data_conn = None
+        self._duckdb_conn = None
+        self._path_selection_stats = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def data_conn(self):
+        # Borrowed from the shared pool the first time it's needed, and held until close(), or in offload's pool threads only until
+        # the offloaded call returns
+        if self._data_conn is None:
+            self._data_conn = data_db.get_pool().acquire()
+            offload.release_after_call(self.release_data_conn)
+        return self._data_conn
+
+    @property
+    def duckdb_conn(self):
+        # An in-process DuckDB db that sees the dataset's tables under the same names as DATA_DB, opened the first time it's needed
+        # and held until close(). Arrow files are scanned where they are, while DATA_DB is read through DuckDB's sqlite extension
+        if self._duckdb_conn is None:
+            if duckdb is None:
+                e = 'duckdb is needed for the duckdb aggregation engine'
+                logging.error(e)
+                raise ImportError(e)
+
+            conn = duckdb.connect()
+            if flask_app.config['DUCKDB_THREADS'] is not None:
+                conn.execute(f'SET threads = {int(flask_app.config["DUCKDB_THREADS"])};')
+            try:
+                if self.storage == c.STORAGE_ARROW:
+                    db_locations = [x[0] for x in db.session.query(TableMetadata.db_location).filter(TableMetadata.dataset_name == self.dataset_name).all()]
+                    for db_location in db_locations:
+                        # Chunks can type a column differently, so they're put back together by name, widening types as needed
+                        part_names = []
+                        for i, path in enumerate(arrow_storage.get_part_paths(db_location)):
+                            part_names.append(f'{db_location}_part{i}')
+                            conn.register(part_names[-1], arrow_storage.open_part(path))
+                        conn.execute(f'CREATE VIEW "{db_location}" AS ' + ' UNION ALL BY NAME '.join(f'SELECT * FROM "{x}"' for x in part_names))
+                else:
+                    conn.execute(f"ATTACH '{flask_app.config['DATA_DB']}' AS data_db (TYPE sqlite, READ_ONLY);")
+                    conn.execute('USE data_db;')
+            except Exception:
+                conn.close()
+                raise
+            self._duckdb_conn = conn
+        return self._duckdb_conn
+
+    def release_data_conn(self):
+        if self._data_conn is not None:
+            data_db.get_pool().release(self._data_conn)
+            self._data_conn = None
+
+    def close(self):
+        self.release_data_conn()
+        if self._duckdb_conn is not None:
+            self._duckdb_conn.close()
+            self._duckdb_conn = None
+
+    @property
+    def graph(self):
+        # Looked up on every access so that links added after this extractor was created are still picked up
+        return get_relationship_graph(self.dataset_name)
+    
+    def find_table_all_connectable_tables(self, table):
+        # Return children and siblings, e.g. tables that I can go to next from this table
+        return self.graph.get_connectable(table)
+
+    def find_table_children(self, table):
+        return self.graph.get_children(table)
+
+    def find_table_siblings(self, table):
+        return self.graph.get_siblings(table)
+
+    def find_table_parents(self, table):
+        return self.graph.get_parents(table)
+
+    @offload.offloaded
+    def find_multi_tables_still_accessible_tables(self, include_tables, fix_first=False):
+        # Given a list of include_tables that must be in a valid path (not necessarily in order), iterate through the rest of the tables to figure out if there are paths between include_tables and each of those
         
-        flattened_valid_complete_paths = u.remove_adjacent_repeats(flattened_valid_complete_paths)
+        # In order for a table to be potentially connectable, it must have is_child, is_sibling or is_parent = True for all of the include_tables
+
+        # First verify that this is a valid path that has been put forward
+        if not self.get_multi_table_path_finder(include_tables, fix_first=fix_first).is_connectable():
+            return []
+
+        graph = self.graph
+        accessible_tables = []
+        for table in sorted(set(itertools.chain.from_iterable(graph.get_related(x) for x in include_tables))):
+            if all(include_table in graph.get_related(table) for include_table in include_tables):
+                accessible_tables.append(table)
         
-        return flattened_valid_complete_paths
+        return accessible_tables
+
+    def find_paths_between_tables(self, start_table, destination_table, current_path=[]):
+        if len(current_path) == 0:
+            paths = self.graph.get_paths(start_table, destination_table)
+            if paths is not None:
+                return [path.copy() for path in paths]
+        return self.graph.search_paths_between_tables(start_table, destination_table, current_path=current_path)
+
+    @offload.offloaded
+    def find_paths_multi_tables(self, list_of_tables, fix_first=False):
+        '''
+        Given a list of tables in any order, find a path that traverses all of them.
+
+        If fix_first is True, then the first element will remain constant (useful when wanting to break down a specific outcome by various other variables)
+        '''
+        return self.get_multi_table_path_finder(list_of_tables, fix_first=fix_first).find_paths()
+
+    def get_multi_table_path_finder(self, list_of_tables, fix_first=False):
+        return MultiTablePathFinder(
+            self.find_paths_between_tables,
+            list_of_tables,
+            fix_first=fix_first,
+            max_tables=flask_app.config['MULTI_TABLE_PATH_MAX_TABLES'],
+            timeout=flask_app.config['MULTI_TABLE_PATH_TIMEOUT']
+        )
 
     def get_joining_keys(self, table_1, table_2):
         # order matters here
-        return db.session.query(TableRelationship.reference_key, TableRelationship.other_key).filter(
-            TableRelationship.reference_table == table_1,
-            TableRelationship.other_table == table_2
-        ).first()
+        return self.graph.get_joining_keys(table_1, table_2)
 
+    @offload.offloaded
     def get_biggest_df_from_paths(self, paths, table_columns_of_interest):
-        if len(paths) == 1:
-            return self.get_df_from_path(paths[0], table_columns_of_interest)
+        return self.get_df_from_path(self.get_biggest_path(paths), table_columns_of_interest)
 
-        dfs = []
-        for path in paths:
-            dfs.append(self.get_df_from_path(path, table_columns_of_interest))
-        biggest_df = dfs[0]
+    def get_biggest_path(self, paths):
+        # The path whose join has the most rows, counting exactly only the paths whose estimate is within PATH_SELECTION_ESTIMATE_MARGIN
+        if len(paths) == 1:
+            return paths[0]
 
-        for df in dfs[1:]:
-            if len(df) > len(biggest_df):
-                biggest_df = df
+        estimate_margin = flask_app.config['PATH_SELECTION_ESTIMATE_MARGIN']
+        estimates = [self.estimate_row_count_from_path(path) for path in paths]
+        if estimate_margin is None or None in estimates:
+            candidates = list(range(len(paths)))
+        else:
+            biggest_estimate = max(estimates)
+            candidates = [i for i, estimate in enumerate(estimates) if estimate * estimate_margin >= biggest_estimate]
+
+        row_counts = {}
+        if len(candidates) > 1:
+            for i in candidates:
+                row_counts[i] = self.get_row_count_from_path(paths[i])
+            chosen = max(candidates, key=lambda i: row_counts[i])
+        else:
+            chosen = candidates[0]
+
+        path_summaries = []
+        for i, path in enumerate(paths):
+            path_summary = f'{path}: estimated {"?" if estimates[i] is None else round(estimates[i])}'
+            if i in row_counts:
+                path_summary += f', counted {row_counts[i]}'
+            path_summaries.append(path_summary)
+        logging.info(f'Chose {paths[chosen]} out of {len(paths)} paths in {self.dataset_name} by {"counting" if len(row_counts) > 0 else "estimate"}. ' + '; '.join(path_summaries))
+        return paths[chosen]
+
+    def estimate_row_count_from_path(self, path):
+        # The textbook join size estimate, |left| * |right| / max(distinct left keys, distinct right keys), leaving out rows with a
+        # null key. None if a table or join key has no stats, e.g. for datasets imported before they were kept
+        table_row_counts, key_stats = self.get_path_selection_stats()
+        row_count = table_row_counts.get(path[0])
+        if row_count is None:
+            return None
 
+        for previous_table, current_table in zip(path, path[1:]):
+            left_key, right_key = self.get_joining_keys(previous_table, current_table)
+            previous_row_count = table_row_counts.get(previous_table)
+            current_row_count = table_row_counts.get(current_table)
+            left_stats = key_stats.get((previous_table, left_key))
+            right_stats = key_stats.get((current_table, right_key))
+            if None in [previous_row_count, current_row_count, left_stats, right_stats]:
+                return None
+
+            left_distinct_count, left_null_count = left_stats
+            right_distinct_count, right_null_count = right_stats
+            if None in [left_distinct_count, right_distinct_count]:
+                return None
+            left_row_count = row_count * (1 - left_null_count / max(previous_row_count, 1))
+            right_row_count = current_row_count - right_null_count
+            row_count = left_row_count * right_row_count / max(min(left_distinct_count, left_row_count), right_distinct_count, 1)
+
+        return row_count
+
+    def get_path_selection_stats(self):
+        # ({table: row_count}, {(table, column): (distinct_count, null_count)}), read from the metadata db once per extractor
+        if self._path_selection_stats is None:
+            table_row_counts = dict(db.session.query(TableMetadata.table_name, TableMetadata.row_count).filter(TableMetadata.dataset_name == self.dataset_name).all())
+            key_stats = {}
+            for table, column, distinct_count, null_count in db.session.query(ColumnStats.table_name, ColumnStats.column_source_name, ColumnStats.distinct_count, ColumnStats.null_count).filter(ColumnStats.dataset_name == self.dataset_name).all():
+                key_stats[(table, column)] = (distinct_count, null_count)
+            self._path_selection_stats = (table_row_counts, key_stats)
+        return self._path_selection_stats
+
+    def get_row_count_from_path(self, path):
+        if self.storage == c.STORAGE_ARROW:
+            return self.get_row_count_from_arrow_path(path)
+        sql_statement = f'SELECT COUNT(*) FROM ({self.get_sql_from_path(path, [(path[0], "rowid")])})'
+        return self.data_conn.cursor().execute(sql_statement).fetchone()[0]
+
+    @offload.offloaded
+    def get_df_from_path(self, path, table_columns_of_interest):
+        # Served from the join cache when the same path was joined before with these columns, or more. The df may be shared, so
+        # it must not be modified
+        df = self.get_cached_df_from_path(path, table_columns_of_interest)
+        if df is not None:
+            return df
+
+        join_cache = cache.get_join_cache()
+        columns = [f'{table}_{column}' for table, column in table_columns_of_interest]
+        generation = join_cache.generation(self.dataset_name)
+        if self.storage == c.STORAGE_ARROW:
+            df = self.get_df_from_arrow_path(path, table_columns_of_interest)
+        else:
+            sql_statement = self.get_sql_from_path(path, table_columns_of_interest)
+            logging.info(sql_statement)
+            df = pd.read_sql(sql_statement, con=self.data_conn)
+        join_cache.put(join_cache.get_key(self.dataset_name, path, columns), df, generation)
         return df
 
-    def get_df_from_path(self, path, table_columns_of_interest):
+    def get_cached_df_from_path(self, path, table_columns_of_interest):
+        # What get_df_from_path would return if the join cache has it, otherwise None
+        check_dataset_generation(self.dataset_name)
+        columns = [f'{table}_{column}' for table, column in table_columns_of_interest]
+        return cache.get_join_cache().find(self.dataset_name, path, columns)
+
+    def get_df_from_arrow_path(self, path, table_columns_of_interest):
+        # The joins get_sql_from_path would run, done in pandas on the Arrow files of a dataset stored as them. Only the columns of
+        # interest and the join keys are read from each table
+        table_columns = {table: [] for table in path}
+        joining_keys = self.get_path_joining_keys(path)
+        for (previous_table, current_table), keys in zip(zip(path, path[1:]), joining_keys):
+            table_columns[previous_table].append(keys[0])
+            table_columns[current_table].append(keys[1])
+        for table, column in table_columns_of_interest:
+            table_columns[table].append(column)
+
+        def read_table(table):
+            columns = list(dict.fromkeys(table_columns[table]))
+            return arrow_storage.read_columns(f'{self.prefix}_{table}', columns).rename(columns={x: f'{table}_{x}' for x in columns})
+
+        logging.info(f'Joining {path} from Arrow files')
+        df = read_table(path[0])
+        for (previous_table, current_table), (left_key, right_key) in zip(zip(path, path[1:]), joining_keys):
+            # Unlike SQL, pandas matches null keys to each other
+            current_df = read_table(current_table).dropna(subset=[f'{current_table}_{right_key}'])
+            df = df.merge(current_df, left_on=f'{previous_table}_{left_key}', right_on=f'{current_table}_{right_key}')
+        return df[[f'{table}_{column}' for table, column in table_columns_of_interest]]
+
+    def get_row_count_from_arrow_path(self, path):
+        # What len(get_df_from_arrow_path(path, [])) would be, without joining anything. Each table's rows are weighted by how many
+        # rows of the join up to that table each would be joined to, so only the join keys of one table are read at a time
+        joining_keys = self.get_path_joining_keys(path)
+        if len(joining_keys) == 0:
+            return arrow_storage.get_row_count(f'{self.prefix}_{path[0]}')
+
+        # {key value: rows of the join so far with it}, from the first table, where each row counts once
+        left_key = joining_keys[0][0]
+        key_weights = arrow_storage.read_columns(f'{self.prefix}_{path[0]}', [left_key])[left_key].value_counts()
+        for i, table in enumerate(path[1:]):
+            right_key = joining_keys[i][1]
+            left_key = joining_keys[i + 1][0] if i + 1 < len(joining_keys) else None
+            df = arrow_storage.read_columns(f'{self.prefix}_{table}', list(dict.fromkeys(x for x in [right_key, left_key] if x is not None)))
+            # Null keys match nothing, as in get_df_from_arrow_path, since value_counts and groupby leave them out of key_weights
+            weights = df[right_key].map(key_weights).fillna(0).astype(np.int64)
+            if left_key is None:
+                return int(weights.sum())
+            key_weights = weights.groupby(df[left_key]).sum()
+
+    def get_path_joining_keys(self, path):
+        # [(left key, right key)] joining each table of path to the next
+        joining_keys = []
+        for previous_table, current_table in zip(path, path[1:]):
+            keys = self.get_joining_keys(previous_table, current_table)
+            if keys is None:
+                e = f'Path {path} is invalid. Unable to join {previous_table} to {current_table}'
+                logging.error(e)
+                raise TypeError(e)
+            joining_keys.append(keys)
+        return joining_keys
+
+    def iterate_df_from_path(self, path, table_columns_of_interest, chunksize):
+        # The same join as get_df_from_path, read chunksize rows at a time
+        sql_statement = self.get_sql_from_path(path, table_columns_of_interest)
+        logging.info(sql_statement)
+        return pd.read_sql(sql_statement, con=self.data_conn, chunksize=chunksize)
+
+    def get_sql_from_path(self, path, table_columns_of_interest):
         # table_columns of interest is a list of (table, column)
         sql_statement = f'SELECT '
         for table, column in table_columns_of_interest:
@@ -481,130 +2154,125 @@ class DBExtractor():
             sql_statement += f'JOIN {current_table_db} ON {previous_table_db}.{left_key} = {current_table_db}.{right_key} '
             previous_table = current_table
 
-        logging.info(sql_statement)
-        df = pd.read_sql(sql_statement, con=self.data_conn)
-        return df
-
-    def aggregate_df(self, df_original, groupby_columns, filters, aggregate_column=None, aggregate_fxn='Count'):
-        df = df_original.copy(deep=True)
-        df = df.dropna()
+        return sql_statement
+
+    @offload.offloaded
+    def aggregate_paths(self, paths, table_columns_of_interest, groupby_columns, filters, aggregate_column=None, aggregate_fxn='Count', engine=None):
+        # Join along the biggest of paths and aggregate it with engine, or AGGREGATION_ENGINE. Arrow datasets use 'pandas' for 'sqlite' and 'chunked'
+        if engine is None:
+            engine = flask_app.config['AGGREGATION_ENGINE']
+        if self.storage == c.STORAGE_ARROW and engine in ['sqlite', 'chunked']:
+            engine = 'pandas'
+
+        if engine in ['sqlite', 'chunked', 'duckdb']:
+            path = self.get_biggest_path(paths)
+            df = self.get_cached_df_from_path(path, table_columns_of_interest)
+            if df is not None:
+                return self.aggregate_df(df, groupby_columns, filters, aggregate_column, aggregate_fxn)
+
+        if engine == 'sqlite':
+            return self.aggregate_path(path, table_columns_of_interest, groupby_columns, filters, aggregate_column, aggregate_fxn)
+        elif engine == 'pandas':
+            df = self.get_biggest_df_from_paths(paths, table_columns_of_interest)
+            return self.aggregate_df(df, groupby_columns, filters, aggregate_column, aggregate_fxn)
+        elif engine == 'chunked':
+            return self.aggregate_path_in_chunks(path, table_columns_of_interest, groupby_columns, filters, aggregate_column, aggregate_fxn)
+        elif engine == 'duckdb':
+            return self.aggregate_path_in_duckdb(path, table_columns_of_interest, groupby_columns, filters, aggregate_column, aggregate_fxn)
+        else:
+            e = f'Unknown aggregation engine {engine}'
+            logging.error(e)
+            raise ValueError(e)
+
+    def aggregate_path(self, path, table_columns_of_interest, groupby_columns, filters, aggregate_column=None, aggregate_fxn='Count'):
+        # Same output as aggregate_df(get_df_from_path(...), ...) when table_columns_of_interest are exactly the groupby and aggregate
+        # columns (as get_graph_data asks for), but only the aggregated rows leave SQLite. SQLite adds floats up
+        # in a different order than pandas, so a Sum or Mean that lands exactly on a rounding boundary can differ in the last digit
+        sql_aggregator = SQLAggregator(
+            base_sql=self.get_sql_from_path(path, table_columns_of_interest),
+            base_columns=[f'{table}_{column}' for table, column in table_columns_of_interest],
+            read_sql=lambda sql_statement, params: pd.read_sql(sql_statement, con=self.data_conn, params=params)
+        )
+        grouped, filter_filters, range_columns = sql_aggregator.aggregate(groupby_columns, filters, aggregate_column, aggregate_fxn)
+        return self.aggregate_grouped_df(grouped, groupby_columns, filter_filters, range_columns, aggregate_column, aggregate_fxn)
+
+    def aggregate_path_in_duckdb(self, path, table_columns_of_interest, groupby_columns, filters, aggregate_column=None, aggregate_fxn='Count'):
+        # Same output as aggregate_path, with the same SQL run by DuckDB instead of SQLite. Sums and means are added up in parallel,
+        # so they can differ from aggregate_df in the last digit too
+        duckdb_aggregator = DuckDBAggregator(
+            base_sql=self.get_sql_from_path(path, table_columns_of_interest),
+            base_columns=[f'{table}_{column}' for table, column in table_columns_of_interest],
+            read_sql=lambda sql_statement, params: self.duckdb_conn.execute(sql_statement, params).df()
+        )
+        grouped, filter_filters, range_columns = duckdb_aggregator.aggregate(groupby_columns, filters, aggregate_column, aggregate_fxn)
+        return self.aggregate_grouped_df(grouped, groupby_columns, filter_filters, range_columns, aggregate_column, aggregate_fxn)
+
+    def aggregate_path_in_chunks(self, path, table_columns_of_interest, groupby_columns, filters, aggregate_column=None, aggregate_fxn='Count', chunksize=None):
+        # Same output as aggregate_df(get_df_from_path(...), ...), but reading AGGREGATION_CHUNK_SIZE rows of the join at a time,
+        # so memory depends on the number of groups rather than the size of the join. Sums and means are added up in batches, so
+        # like aggregate_path they can differ from aggregate_df in the last digit, and medians are exact unless there are more than
+        # AGGREGATION_MAX_MEDIAN_VALUES distinct values (see ChunkedAggregator)
+        sql_aggregator = SQLAggregator(
+            base_sql=self.get_sql_from_path(path, table_columns_of_interest),
+            base_columns=[f'{table}_{column}' for table, column in table_columns_of_interest],
+            read_sql=lambda sql_statement, params: pd.read_sql(sql_statement, con=self.data_conn, params=params)
+        )
+        columns = groupby_columns + ([] if aggregate_column is None else [aggregate_column])
+        chunked_aggregator = ChunkedAggregator(
+            groupby_columns,
+            filters,
+            sql_aggregator.get_column_dtypes(columns),
+            aggregate_column,
+            aggregate_fxn,
+            max_median_values=flask_app.config['AGGREGATION_MAX_MEDIAN_VALUES']
+        )
+        for chunk in self.iterate_df_from_path(path, table_columns_of_interest, chunksize or flask_app.config['AGGREGATION_CHUNK_SIZE']):
+            chunked_aggregator.update(chunk)
+        grouped, filter_filters, range_columns = chunked_aggregator.result()
+        return self.aggregate_grouped_df(grouped, groupby_columns, filter_filters, range_columns, aggregate_column, aggregate_fxn)
 
-        # Code to generate filter perumutations and do actual filtering
-        filter_filters = []
-        for column in groupby_columns:
-            filter = filters.get(column, None)
-            if filter is None:
-                series = df.loc[:, column]
-                if is_numeric_dtype(series):
-                    min = u.reduce_precision(series.min(), 2)
-                    max = u.reduce_precision(series.max(), 2)
+    def aggregate_grouped_df(self, grouped, groupby_columns, filter_filters, range_columns, aggregate_column=None, aggregate_fxn='Count'):
+        # Finish an aggregation grouped outside of pandas, e.g. by SQLAggregator, with the same pandas calls as aggregate_df
+        for column, bin_labels in range_columns.items():
+            grouped[column] = pd.Categorical(grouped[column], categories=bin_labels)
 
-                    label = f'({min}, {max})'
-                    df[column] = label
-                    filter_filters.append([label])
-                else:
-                    filter_filters.append(sorted(series.unique(), key=lambda x: x.upper()))
-            elif filter['type'] == 'list':
-                filter_filters.append(filter['filter'])
-                df = df[df[column].isin(filter['filter'])]
-            elif filter['type'] == 'range':
-                bin_cuts = self.get_bin_cuts(filter['filter']['min'], filter['filter']['max'], filter['filter']['bins'])
-                bin_labels = [str(x) for x in u.pairwise(bin_cuts)]
-                bin_labels = [x.replace(')', ']') for x in bin_labels]
-                df[column] = pd.cut(df[column], bin_cuts, include_lowest=True, labels=bin_labels).dropna()
-                filter_filters.append(bin_labels)
-        
-        groupby_label_options = []
-        for filter_combo in itertools.product(*filter_filters):
-            label = ''
-            for i in filter_combo:
-                label += str(i) + '_'
-            label = label[:-1]
-            groupby_label_options.append(label)
-        
-        if len(df) > 0:
+        if len(grouped) > 0:
             if aggregate_column is None:
-                # just get the counts then
-                df = df.groupby(groupby_columns).size()
+                df = grouped.groupby(groupby_columns)[GROUPED_COUNT_COLUMN].sum()
                 if len(groupby_columns) > 1:
                     df = df.unstack(fill_value=0).sort_index(axis=1).stack()
                 df = df.reset_index(name='Count')
-            else:
-                g = df.groupby(groupby_columns, observed=True)
-
+            elif aggregate_fxn in ['Count', 'Percents']:
+                counts = grouped.groupby(groupby_columns + [aggregate_column], observed=True)[GROUPED_COUNT_COLUMN].sum()
+                counts.name = aggregate_column
                 if aggregate_fxn == 'Count':
-                    df = g[aggregate_column].value_counts().unstack(fill_value=0).sort_index(axis=1).reset_index()
-                elif aggregate_fxn == 'Percents':
-                    df = (g[aggregate_column].value_counts(normalize=True) * 100).round(1).unstack(fill_value=0).sort_index(axis=1).reset_index()
-                elif aggregate_fxn == 'Sum':
+                    df = counts.unstack(fill_value=0).sort_index(axis=1).reset_index()
+                else:
+                    group_totals = counts.groupby(level=list(range(len(groupby_columns))), observed=True).transform('sum')
+                    df = (counts / group_totals * 100).round(1).unstack(fill_value=0).sort_index(axis=1).reset_index()
+            else:
+                g = grouped.groupby(groupby_columns, observed=True)[[aggregate_column]]
+                if aggregate_fxn == 'Sum':
                     df = g.sum().reset_index()
-                    df[aggregate_column] = df[aggregate_column].fillna(0)
-                elif aggregate_fxn == 'Mean':
-                    df = (g.mean()).round(2).reset_index()
-                    df[aggregate_column] = df[aggregate_column].fillna(0)
-                elif aggregate_fxn == 'Median':
-                    df = (g.median()).round(2).reset_index()
-                    df[aggregate_column] = df[aggregate_column].fillna(0)
-
-            def get_breakdown_label(row, ind_variables):
-                return_str = ''
-                for x in ind_variables:
-                    return_str += str(row[x]) + '_'
-                return_str = return_str[:-1]  # remove trailing underscore
-                return return_str
-
-            df['groupby_labels'] = df.apply(lambda x: get_breakdown_label(x, groupby_columns), axis=1)
+                else:
+                    df = g.first().round(2).reset_index()
+                df[aggregate_column] = df[aggregate_column].fillna(0)
         else:
-            df['groupby_labels'] = None
+            df = grouped
 
-        df = df.drop(columns=groupby_columns)
-        
-        # Some groupbys will have 0 patients, but I still want to display 0
-        found_labels = list(df['groupby_labels'].value_counts().index)
-        missing_labels = [x for x in groupby_label_options if x not in found_labels]
-        if len(missing_labels) > 0:
-            for missing_label in missing_labels:
-                df = df.append({'groupby_labels': missing_label}, ignore_index=True)
-            df = df.fillna(0)
-
-        def find_sort_order(row):
-            return groupby_label_options.index(row['groupby_labels'])
-
-        df['sort_order'] = df.apply(lambda x: find_sort_order(x), axis=1)
-        df = df.sort_values(by='sort_order')
-        df = df.drop(columns=['sort_order'])
-        
-        return df
+        return finalize_aggregated_df(df, groupby_columns, filter_filters)
 
-    def get_bin_cuts(self, min, max, num_bins):
-        min = D(min)
-        max = D(max)
-        num_bins = D(num_bins)
-        
-        step_size = (max - min) / num_bins
-        current_cut = min
-        bin_cuts = []
-        while len(bin_cuts) < num_bins:
-            current_cut = u.reduce_precision(current_cut, precision=2)
-            bin_cuts.append(float(current_cut))
-            current_cut += step_size
-        bin_cuts.append(float(max))  # added in case there are rounding errors, and planning for choosing inclusive right-non-inclusive intervals
+    @offload.offloaded
+    def aggregate_df(self, df, groupby_columns, filters, aggregate_column=None, aggregate_fxn='Count'):
+        return aggregate_df(df, groupby_columns, filters, aggregate_column, aggregate_fxn)
 
-        return bin_cuts
+    def get_bin_cuts(self, min, max, num_bins):
+        return get_bin_cuts(min, max, num_bins)
 
+    @offload.offloaded
     def analyze_column(self, table, column):
-        sql_statement = f'SELECT {column} from {self.prefix}_{table}'
-        series = pd.read_sql(sql_statement, con=self.data_conn).loc[:, column].dropna()
-        if is_numeric_dtype(series):
-            return {
-                'type': c.COLUMN_TYPE_NUMERIC,
-                'min': series.min(),
-                'mean': series.mean(),
-                'max': series.max(),
-                'median': series.median()
-            }
-        else:
-            return {
-                'type': c.COLUMN_TYPE_TEXT,
-                'possible_vals': sorted(list(series.unique()), key=lambda x: x.upper())
-            }
+        column_stats = db.session.query(ColumnStats).filter(ColumnStats.dataset_name == self.dataset_name, ColumnStats.table_name == table, ColumnStats.column_source_name == column).first()
+        if column_stats is None:
+            # Imported before column stats existed
+            column_stats = DBProfiler(self.dataset_name, self.data_conn).add_column_stats(table, column)
+        return column_stats.get_column_info()
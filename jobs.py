@@ -0,0 +1,219 @@
+import logging
+import multiprocessing
+import threading
+import time
+import traceback
+import uuid
+import constants as c
+import data_db
+
+from collections import OrderedDict
+from web import db, flask_app
+
+# Long-running graph queries are run as jobs in worker processes forked from the server, so that sqlite3 and pandas holding on to
+# the CPU can't stall other requests (which under gevent all share one thread). A worker runs one job after another, keeping its
+# connections and caches (e.g. the relationship graphs and the join cache) warm for the next, and is only replaced when a job it
+# is running gets cancelled. Jobs live in the server process that created them, so their status has to be asked of that same
+# process.
+_job_queue = None
+_lock = threading.Lock()
+
+
+def get_job_queue():
+    global _job_queue
+    with _lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(flask_app.config['GRAPH_JOBS_MAX_RUNNING'], flask_app.config['GRAPH_JOBS_MAX_RUNNING_PER_USER'], flask_app.config['GRAPH_JOBS_RESULT_TTL'])
+        return _job_queue
+
+
+def run_worker(conn):
+    # The target of a worker's process. Runs every (fxn, args) it's sent, sending back (c.JOB_DONE, what fxn returned) or
+    # (c.JOB_FAILED, the traceback), until the server closes its end. Nothing inherited from the server that talks to a db may be
+    # used here, so the worker opens connections of its own, which then last as long as it does
+    data_db.forget_connections()
+    db.session.remove()
+    db.engine.dispose()
+    while True:
+        try:
+            fxn, args = conn.recv()
+        except EOFError:
+            break
+        try:
+            with flask_app.app_context():
+                result = fxn(*args)
+            conn.send((c.JOB_DONE, result))
+        except Exception:
+            conn.send((c.JOB_FAILED, traceback.format_exc()))
+    conn.close()
+
+
+class Worker():
+    # A process running jobs for a JobQueue, one at a time
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=run_worker, args=(child_conn, ), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def run(self, fxn, args):
+        self.conn.send((fxn, args))
+
+    def get_result(self):
+        # (status, value) once the job it's running has finished, otherwise None
+        if self.conn.poll():
+            try:
+                return self.conn.recv()
+            except EOFError:
+                pass
+        if self.process.exitcode is not None:
+            return (c.JOB_FAILED, f'The job process exited with code {self.process.exitcode}')
+        return None
+
+    def stop(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class Job():
+    def __init__(self, user_id, key, fxn, args, on_done=None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.key = key
+        self.fxn = fxn
+        self.args = args
+        self.on_done = on_done
+        self.status = c.JOB_QUEUED
+        self.result = None
+        self.error = None
+        self.worker = None
+        self.finished_time = None
+
+    @property
+    def is_finished(self):
+        return self.status in [c.JOB_DONE, c.JOB_FAILED, c.JOB_CANCELLED]
+
+    def get_info(self):
+        # What the owner of the job gets to see, so not the traceback of a failed job, which is only logged
+        return {'job_id': self.id, 'status': self.status}
+
+
+class JobQueue():
+    '''
+    Runs at most max_running jobs at once, and at most max_running_per_user for any one user, starting queued jobs first come
+    first served as slots free up. A job is a call to fxn(*args), where fxn, args and the result must all be picklable;
+    on_done(result) is then called in this process, e.g. to cache it.
+
+    Jobs run in worker processes that are kept for the jobs after, up to max_running of them. Each job belongs to a key, such as
+    the chart it draws, and submitting a job for a user and key cancels that user's previous job for it, killing its worker if it
+    had started. Finished jobs are forgotten result_ttl seconds after they finish.
+
+    There's no thread watching the jobs. Their progress is picked up whenever the queue is used, which the clients polling for
+    their jobs' status do often enough.
+    '''
+
+    def __init__(self, max_running, max_running_per_user, result_ttl):
+        self.max_running = max_running
+        self.max_running_per_user = max_running_per_user
+        self.result_ttl = result_ttl
+        self.jobs = OrderedDict()
+        self.latest_jobs = {}
+        self.idle_workers = []
+        self.context = multiprocessing.get_context('fork')
+        self.lock = threading.Lock()
+
+    def submit(self, user_id, key, fxn, args, on_done=None, result=None):
+        # With a result, e.g. from a cache, the job is done already but still replaces the previous job for key
+        job = Job(user_id, key, fxn, args, on_done)
+        with self.lock:
+            previous_job = self.jobs.get(self.latest_jobs.get((user_id, key)))
+            if previous_job is not None and not previous_job.is_finished:
+                self.cancel_job(previous_job)
+            self.jobs[job.id] = job
+            self.latest_jobs[(user_id, key)] = job.id
+            if result is not None:
+                self.finish_job(job, c.JOB_DONE, result)
+            self.refresh()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            self.refresh()
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and not job.is_finished:
+                self.cancel_job(job)
+            self.refresh()
+            return job
+
+    def refresh(self):
+        # With the lock held. Collects what the running jobs have sent back, forgets expired jobs and starts whatever can start
+        for job in [x for x in self.jobs.values() if x.status == c.JOB_RUNNING]:
+            result = job.worker.get_result()
+            if result is not None:
+                self.finish_job(job, *result)
+
+        now = time.monotonic()
+        for job in [x for x in self.jobs.values() if x.is_finished and now - x.finished_time > self.result_ttl]:
+            del self.jobs[job.id]
+            if self.latest_jobs.get((job.user_id, job.key)) == job.id:
+                del self.latest_jobs[(job.user_id, job.key)]
+
+        running_count = 0
+        user_running_counts = {}
+        for job in self.jobs.values():
+            if job.status == c.JOB_RUNNING:
+                running_count += 1
+                user_running_counts[job.user_id] = user_running_counts.get(job.user_id, 0) + 1
+        for job in [x for x in self.jobs.values() if x.status == c.JOB_QUEUED]:
+            if running_count >= self.max_running:
+                break
+            if user_running_counts.get(job.user_id, 0) >= self.max_running_per_user:
+                continue
+            self.start_job(job)
+            running_count += 1
+            user_running_counts[job.user_id] = user_running_counts.get(job.user_id, 0) + 1
+
+    def start_job(self, job):
+        job.worker = self.idle_workers.pop() if len(self.idle_workers) > 0 else Worker(self.context)
+        job.worker.run(job.fxn, job.args)
+        job.status = c.JOB_RUNNING
+        logging.debug(f'Started job {job.id} for user {job.user_id} in process {job.worker.process.pid}')
+
+    def cancel_job(self, job):
+        if job.status == c.JOB_RUNNING:
+            # The only way to stop it, so the worker goes too and another takes its place when needed
+            job.worker.stop()
+            job.worker = None
+        self.finish_job(job, c.JOB_CANCELLED, None)
+        logging.debug(f'Cancelled job {job.id} for user {job.user_id}')
+
+    def finish_job(self, job, status, value):
+        if job.worker is not None:
+            if job.worker.process.exitcode is None:
+                self.idle_workers.append(job.worker)
+            else:
+                job.worker.stop()
+            job.worker = None
+        job.status = status
+        job.finished_time = time.monotonic()
+        if status == c.JOB_DONE:
+            job.result = value
+            if job.on_done is not None:
+                job.on_done(value)
+        elif status == c.JOB_FAILED:
+            job.error = value
+            logging.error(f'Job {job.id} for user {job.user_id} failed: {value}')
+
+    def get_stats(self):
+        with self.lock:
+            self.refresh()
+            stats = {status: 0 for status in [c.JOB_QUEUED, c.JOB_RUNNING, c.JOB_DONE, c.JOB_FAILED, c.JOB_CANCELLED]}
+            for job in self.jobs.values():
+                stats[job.status] += 1
+            stats['idle_workers'] = len(self.idle_workers)
+            return stats
@@ -0,0 +1,102 @@
+import logging
+import os
+import queue
+import threading
+
+from functools import wraps
+from web import db, flask_app
+
+try:
+    import gevent.monkey
+    from gevent.threadpool import ThreadPool
+except ImportError:
+    gevent = None
+
+# Under gevent (see run_application.py) every request is a greenlet on the same thread, so a sqlite3 query or pandas operation,
+# neither of which ever yields, stalls the whole server for as long as it runs. The DBExtractor calls that can take long are
+# decorated with offloaded, which runs them on a pool of OFFLOAD_THREADS real threads instead while the request's greenlet waits.
+# sqlite3 and much of pandas release the GIL as they work, and when they don't the interpreter still switches threads every few
+# ms, so the hub keeps serving other requests. Without gevent's patches, e.g. under the Flask dev server, calls run where they're
+# made.
+#
+# Anything the pool threads share with the hub is synchronized with Lock and SimpleQueue below rather than with the threading and
+# queue modules, whose locks gevent patches into ones meant for greenlets: a pool thread waiting on one for something the hub
+# releases may never wake up. Lock is a real lock, so it must only be held briefly and never across anything that yields.
+_threadpool = None
+_pool_thread = None if gevent is None else gevent.monkey.get_original('threading', 'local')()
+Lock = threading.Lock if gevent is None else gevent.monkey.get_original('threading', 'Lock')
+_lock = Lock()
+
+
+def is_enabled():
+    # Whether offloaded calls go to the pool threads
+    return gevent is not None and gevent.monkey.is_module_patched('threading') and flask_app.config['OFFLOAD_THREADS'] > 0
+
+
+def SimpleQueue():
+    # A queue for handing things between the hub and the pool threads: a real one while calls are offloaded, and otherwise one the
+    # hub's greenlets can wait on. Blocking gets must go through wait_off_hub, so that the hub never waits on a real one
+    if is_enabled():
+        return gevent.monkey.get_original('queue', 'SimpleQueue')()
+    return queue.SimpleQueue()
+
+
+def get_threadpool():
+    global _threadpool
+    if not is_enabled():
+        return None
+    with _lock:
+        if _threadpool is None:
+            # The pool threads log too, through handlers whose locks came from the patched threading module
+            RLock = gevent.monkey.get_original('_thread', 'RLock')
+            for handler in logging.getLogger().handlers:
+                handler.lock = RLock()
+            _threadpool = ThreadPool(flask_app.config['OFFLOAD_THREADS'])
+        return _threadpool
+
+
+def forget_threadpool():
+    # In a forked process, which has none of its parent's threads
+    global _threadpool
+    _threadpool = None
+
+
+os.register_at_fork(after_in_child=forget_threadpool)
+
+
+def call_in_pool_thread(fxn, args, kwargs):
+    # A pool thread has a db session of its own, which is removed after every call so that it holds nothing open in between, and
+    # whatever else the call registered with release_after_call is released then too
+    _pool_thread.active = True
+    _pool_thread.releases = []
+    try:
+        return fxn(*args, **kwargs)
+    finally:
+        for release in _pool_thread.releases:
+            release()
+        _pool_thread.active = False
+        db.session.remove()
+
+
+def release_after_call(release):
+    # When called from a pool thread, release is called once the offloaded call running there returns, e.g. to give back a shared
+    # connection, so that a pool thread never waits on something held by a request that is itself waiting for a pool thread
+    if getattr(_pool_thread, 'active', False):
+        _pool_thread.releases.append(release)
+
+
+def offloaded(fxn):
+    @wraps(fxn)
+    def wrapper(*args, **kwargs):
+        threadpool = get_threadpool()
+        # Offloaded calls made by an offloaded call are already off the hub
+        if threadpool is None or getattr(_pool_thread, 'active', False):
+            return fxn(*args, **kwargs)
+        return threadpool.apply(call_in_pool_thread, (fxn, args, kwargs))
+    return wrapper
+
+
+@offloaded
+def wait_off_hub(fxn, *args, **kwargs):
+    # For a call that blocks until a pool thread or the hub wakes it, e.g. getting from a SimpleQueue
+    return fxn(*args, **kwargs)
@@ -0,0 +1,185 @@
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch():
+    '''
+    Streaming quantiles in bounded memory (a KLL-style stack of compactors).
+
+    Each level holds at most k values, and a value at level h stands in for 2**h of the original values. When a level fills up it
+    is sorted and every other value, starting at a random offset, is promoted to the next level. The rank error of quantile() is
+    around 1 / k of the number of values seen.
+    '''
+
+    def __init__(self, k=2048, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.random = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+
+    def update_counts(self, values, counts):
+        # Each value seen counts times. A value at level h weighs 2**h, so it goes in at every level where counts has a 1 bit
+        values = np.asarray(values, dtype=float)
+        counts = np.asarray(counts, dtype=np.int64)
+        self.count += int(counts.sum())
+        level = 0
+        while (counts > 0).any():
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], values[(counts & 1) == 1]])
+            counts = counts >> 1
+            level += 1
+        self.compress()
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) <= self.k:
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+
+            values = np.sort(self.levels[level])
+            if len(values) % 2 == 1:
+                # Keep one value back so that an even number of values is halved
+                self.levels[level] = values[-1:]
+                values = values[:-1]
+            else:
+                self.levels[level] = np.empty(0)
+            offset = self.random.integers(2)
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], values[offset::2]])
+            level += 1
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(x), 2 ** level) for level, x in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        cumulative_weights = np.cumsum(weights[order])
+        idx = np.searchsorted(cumulative_weights, q * cumulative_weights[-1], side='left')
+        return float(values[order][min(idx, len(values) - 1)])
+
+
+class HyperLogLog():
+    '''
+    Estimates the number of distinct values with 2**precision small registers. The standard error is about
+    1.04 / sqrt(2**precision), so within 1-2% for the default precision of 14.
+    '''
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = np.zeros(2 ** precision, dtype=np.uint8)
+
+    def update(self, values):
+        hashes = hash_values(values)
+        register_idx = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        remaining_bits = 64 - self.precision
+        remainder = hashes & np.uint64((1 << remaining_bits) - 1)
+        # 1 + the number of leading zeros in the remaining bits. frexp gives the bit length exactly since remainder < 2**53
+        bit_lengths = np.frexp(remainder.astype(float))[1]
+        ranks = (remaining_bits - bit_lengths + 1).astype(np.uint8)
+        np.maximum.at(self.registers, register_idx, ranks)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw_estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(float)))
+        empty_registers = np.count_nonzero(self.registers == 0)
+        if raw_estimate <= 2.5 * m and empty_registers > 0:
+            # Linear counting is more accurate while few registers have been touched
+            return int(round(m * np.log(m / empty_registers)))
+        return int(round(raw_estimate))
+
+
+class HeavyHitters():
+    '''
+    Misra-Gries summary keeping at most k values. Any value making up more than 1 / (k + 1) of everything seen is guaranteed to be
+    kept, and if there were never more than k distinct values, all of them are kept with exact counts (is_complete).
+    '''
+
+    def __init__(self, k=1000):
+        self.k = k
+        self.counts = Counter()
+        self.is_complete = True
+
+    def update(self, values):
+        self.counts.update(values)
+        if len(self.counts) > self.k:
+            self.is_complete = False
+            # Subtracting the (k + 1)th largest count from every counter leaves at most k positive ones
+            threshold = sorted(self.counts.values(), reverse=True)[self.k]
+            self.counts = Counter({value: count - threshold for value, count in self.counts.items() if count > threshold})
+
+    def top(self, n=None):
+        return [value for value, count in self.counts.most_common(n)]
+
+
+class MinHash():
+    '''
+    Bottom-k MinHash of a set of values: the k smallest distinct hashes among them (see hash_values). Since every sketch hashes
+    the same way, two sketches hold every value of their sets hashing below the smaller of their largest hashes, which makes those
+    values a sample shared by both, from which containment estimates how much of one set is in the other. With fewer than k
+    distinct values a sketch holds all of them (is_complete), and everything estimated from it is exact.
+
+    Containment of a set n times smaller than the other is estimated from around n / k values, so it can't be estimated at all
+    for sets much more than k times smaller.
+    '''
+
+    def __init__(self, k=2048, hashes=None):
+        self.k = k
+        self.hashes = np.empty(0, dtype=np.uint64) if hashes is None else hashes
+
+    def update(self, values):
+        hashes = hash_values(values)
+        if len(self.hashes) == self.k:
+            hashes = hashes[hashes < self.hashes[-1]]
+        self.hashes = np.unique(np.concatenate([self.hashes, hashes]))[:self.k]
+
+    @property
+    def is_complete(self):
+        return len(self.hashes) < self.k
+
+    def get_threshold(self):
+        # Every value of the set hashing at or below this is in the sketch
+        return np.iinfo(np.uint64).max if self.is_complete else self.hashes[-1]
+
+    def distinct_count(self):
+        if self.is_complete:
+            return len(self.hashes)
+        return int(round((self.k - 1) / ((float(self.hashes[-1]) + 1) / 2 ** 64)))
+
+    def containment(self, other):
+        # (estimated fraction of this set's values that are also in other's, number of values it was estimated from), with an
+        # estimate of None when none of this set's values could be sampled
+        threshold = min(self.get_threshold(), other.get_threshold())
+        sample = self.hashes[self.hashes <= threshold]
+        if len(sample) == 0:
+            return None, 0
+        idx = np.minimum(np.searchsorted(other.hashes, sample), len(other.hashes) - 1)
+        return np.count_nonzero(other.hashes[idx] == sample) / len(sample), len(sample)
+
+    def to_bytes(self):
+        return self.hashes.astype('<u8').tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, k):
+        return cls(k, np.frombuffer(data, dtype='<u8').astype(np.uint64))
+
+
+def hash_values(values):
+    # 64-bit hashes that agree for equal values the way SQLite compares them, i.e. 1 and 1.0 hash the same
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        values = values.astype(float)
+    else:
+        values = values.astype(str)
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
@@ -1,9 +1,32 @@
+import arrow_storage
+import cache
+import constants as c
+import data_db
 import db_structure
+import jobs
+import json
 import logging
+import offload
 import os
+import numpy as np
+import pandas as pd
+import queue
+import shutil
+import sketches
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import utilities as u
 import unittest
 
+from flask import get_flashed_messages
+from sqlalchemy import event
+from web import db, flask_app, routes
+from web.models import ColumnMetadata, ColumnStats, DataIndex, DatasetMetadata, Group, TableMetadata, TablePath, TableRelationship, User, UserGroups
+
 logger = logging.getLogger()
 formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s', '%Y-%m-%d %H:%M:%S')
 logger.setLevel(logging.DEBUG)
@@ -39,6 +62,7 @@ class TestPathFinding(unittest.TestCase):
     @classmethod
     def tearDownClass(self):
         print('Removing db')
+        self.db_extractor.close()
         self.db_maker.remove_db()
 
     def test_two_tables(self):
@@ -85,6 +109,826 @@ class TestPathFinding(unittest.TestCase):
         x = self.db_extractor.find_paths_multi_tables(['D', 'C', 'F'], fix_first=True)
         self.assertEqual([['D', 'C', 'F']], x)
 
+    def test_multi_limits(self):
+        # Over the table limit only the given order is tried, so ['C', 'D', 'C', 'F'] is no longer found
+        path_finder = db_structure.MultiTablePathFinder(self.db_extractor.find_paths_between_tables, ['D', 'C', 'F'], max_tables=2)
+        self.assertEqual([['D', 'C', 'F']], path_finder.find_paths())
+
+        path_finder = db_structure.MultiTablePathFinder(self.db_extractor.find_paths_between_tables, ['F', 'C', 'D'], max_tables=2)
+        self.assertEqual([], path_finder.find_paths())
+        self.assertFalse(path_finder.is_connectable())
+
+        path_finder = db_structure.MultiTablePathFinder(self.db_extractor.find_paths_between_tables, ['A', 'D', 'C', 'F'], timeout=0)
+        self.assertEqual([], path_finder.find_paths())
+        self.assertTrue(path_finder.timed_out)
+
+    def test_path_selection(self):
+        paths = self.db_extractor.find_paths_between_tables('A', 'F')
+        row_counts = [self.db_extractor.get_row_count_from_path(path) for path in paths]
+        self.assertEqual([4, 4, 6], [round(self.db_extractor.estimate_row_count_from_path(path)) for path in paths])
+        self.assertEqual(max(row_counts), row_counts[paths.index(self.db_extractor.get_biggest_path(paths))])
+        self.assertEqual(max(row_counts), len(self.db_extractor.get_biggest_df_from_paths(paths, [('A', 'col2')])))
+
+    def test_sql_aggregation(self):
+        # Aggregating inside SQLite has to give exactly what aggregate_df gives on the joined DataFrame
+        path = ['A', 'C', 'F']
+        test_cases = [
+            (['A_col2', 'F_col8'], {}, None, 'Count'),
+            (['A_col2', 'C_col6'], {'C_col6': {'type': 'range', 'filter': {'min': 7, 'max': 10, 'bins': 3}}}, None, 'Count'),
+            (['A_col2'], {'A_col2': {'type': 'list', 'filter': ['A', 'C', 'D']}}, 'F_col8', 'Count'),
+            (['C_col6'], {}, 'F_col8', 'Percents'),
+            (['F_col8'], {}, 'A_col3', 'Sum'),
+            (['A_col2', 'F_col8'], {'F_col8': {'type': 'list', 'filter': ['a']}}, 'A_col3', 'Mean'),
+            (['A_col2'], {}, 'C_col6', 'Median'),
+            (['A_col2'], {'A_col2': {'type': 'list', 'filter': ['D']}}, 'C_col6', 'Median'),
+            (['A_col2', 'C_col6'], {'A_col2': {'type': 'list', 'filter': ['C', 'D']}}, None, 'Count'),
+        ]
+        for groupby_columns, filters, aggregate_column, aggregate_fxn in test_cases:
+            columns = groupby_columns + ([] if aggregate_column is None else [aggregate_column])
+            table_columns_of_interest = [tuple(x.split('_', 1)) for x in columns]
+            df = self.db_extractor.get_df_from_path(path, table_columns_of_interest)
+            expected = self.db_extractor.aggregate_df(df, groupby_columns, filters, aggregate_column, aggregate_fxn)
+            x = self.db_extractor.aggregate_path(path, table_columns_of_interest, groupby_columns, filters, aggregate_column, aggregate_fxn)
+            pd.testing.assert_frame_equal(expected, x)
+            # And so does aggregating the join a few rows at a time
+            x = self.db_extractor.aggregate_path_in_chunks(path, table_columns_of_interest, groupby_columns, filters, aggregate_column, aggregate_fxn, chunksize=3)
+            pd.testing.assert_frame_equal(expected, x)
+
+    @unittest.skipIf(db_structure.duckdb is None, 'duckdb is not installed')
+    def test_duckdb(self):
+        # DATA_DB is read through DuckDB's sqlite extension, which DuckDB may have to download first
+        db_extractor = db_structure.DBExtractor(dataset_name='sample2')
+        try:
+            try:
+                duckdb_conn = db_extractor.duckdb_conn
+            except db_structure.duckdb.Error as e:
+                self.skipTest(f'Unable to attach DATA_DB to DuckDB: {e}')
+
+            # The SQL of the joins runs as it is, and so does the SQL aggregating them
+            path = ['A', 'C', 'F']
+            table_columns_of_interest = [('A', 'col2'), ('C', 'col6'), ('F', 'col8')]
+            columns = [f'{table}_{column}' for table, column in table_columns_of_interest]
+            expected = pd.read_sql(db_extractor.get_sql_from_path(path, table_columns_of_interest), db_extractor.data_conn).sort_values(columns, ignore_index=True)
+            x = duckdb_conn.execute(db_extractor.get_sql_from_path(path, table_columns_of_interest)).df().sort_values(columns, ignore_index=True)
+            pd.testing.assert_frame_equal(expected, x)
+
+            test_cases = [
+                (['A_col2', 'F_col8'], {}, None, 'Count'),
+                (['A_col2', 'C_col6'], {'C_col6': {'type': 'range', 'filter': {'min': 7, 'max': 10, 'bins': 3}}}, None, 'Count'),
+                (['C_col6'], {}, 'F_col8', 'Percents'),
+                (['A_col2'], {}, 'C_col6', 'Median'),
+            ]
+            for groupby_columns, filters, aggregate_column, aggregate_fxn in test_cases:
+                table_columns_of_interest = [tuple(x.split('_', 1)) for x in groupby_columns + ([] if aggregate_column is None else [aggregate_column])]
+                expected = db_extractor.aggregate_path(path, table_columns_of_interest, groupby_columns, filters, aggregate_column, aggregate_fxn)
+                x = db_extractor.aggregate_path_in_duckdb(path, table_columns_of_interest, groupby_columns, filters, aggregate_column, aggregate_fxn)
+                pd.testing.assert_frame_equal(expected, x)
+        finally:
+            db_extractor.close()
+
+    def test_relationship_graph_cache(self):
+        graph = db_structure.get_relationship_graph('sample2')
+        self.assertIs(graph, db_structure.get_relationship_graph('sample2'))
+        self.assertEqual(['C', 'D'], graph.get_children('A'))
+        self.assertEqual(['B'], graph.get_siblings('A'))
+        self.assertEqual(('col3', 'col3'), graph.get_joining_keys('A', 'B'))
+
+        # Paths between every linked pair are precomputed when the links are added
+        self.assertEqual(len(graph.get_paths('A', 'F')), 3)
+        self.assertEqual([], graph.get_paths('E', 'B'))
+        self.assertEqual(graph.search_paths_between_tables('B', 'F'), graph.get_paths('B', 'F'))
+
+        # Re-adding an existing link is a no-op, but it still has to drop the cached graph
+        self.db_linker.add_fk('A', 'col3', 'B', 'col3')
+        self.assertIsNot(graph, db_structure.get_relationship_graph('sample2'))
+
+    def test_column_stats(self):
+        x = self.db_extractor.analyze_column('C', 'col6')
+        self.assertEqual({
+            'type': 'NUMERIC', 'min': 7, 'mean': 9.5, 'max': 12, 'median': 9.5, 'percentile_25': 8.25, 'percentile_75': 10.75,
+            'null_count': 0, 'distinct_count': 6, 'is_approximate': False
+        }, x)
+
+        x = self.db_extractor.analyze_column('A', 'col2')
+        self.assertEqual(['A', 'B', 'C'], x['possible_vals'])
+        self.assertFalse(x['possible_vals_truncated'])
+
+    def test_approximate_column_stats(self):
+        # Tables of at least COLUMN_STATS_APPROXIMATE_MIN_ROWS rows get their quartiles from a sketch, which picks values that are in
+        # the column rather than interpolating between them. The text column has too few distinct values for anything to be missed
+        approximate_min_rows = flask_app.config['COLUMN_STATS_APPROXIMATE_MIN_ROWS']
+        flask_app.config['COLUMN_STATS_APPROXIMATE_MIN_ROWS'] = 1
+        try:
+            db_structure.DBProfiler('sample2', self.db_extractor.data_conn).refresh_column_stats()
+            x = self.db_extractor.analyze_column('C', 'col6')
+            self.assertEqual({
+                'type': 'NUMERIC', 'min': 7, 'mean': 9.5, 'max': 12, 'median': 9, 'percentile_25': 8, 'percentile_75': 11,
+                'null_count': 0, 'distinct_count': 6, 'is_approximate': True
+            }, x)
+
+            x = self.db_extractor.analyze_column('A', 'col2')
+            self.assertEqual((['A', 'B', 'C'], 3, False), (x['possible_vals'], x['distinct_count'], x['is_approximate']))
+        finally:
+            flask_app.config['COLUMN_STATS_APPROXIMATE_MIN_ROWS'] = approximate_min_rows
+            db_structure.DBProfiler('sample2', self.db_extractor.data_conn).refresh_column_stats()
+        self.assertFalse(self.db_extractor.analyze_column('C', 'col6')['is_approximate'])
+
+    def test_graph_data_cache(self):
+        graph_data_cache = cache.ByteLRUCache(max_bytes=10)
+        graph_data_cache.put(('sample2', 1), b'12345', 0)
+        graph_data_cache.put(('sample2', 2), b'12345', 0)
+        self.assertEqual(b'12345', graph_data_cache.get(('sample2', 1)))
+        # Over max_bytes, so the least recently used entry goes
+        graph_data_cache.put(('other', 3), b'123', 0)
+        self.assertIsNone(graph_data_cache.get(('sample2', 2)))
+        self.assertEqual({'hits': 1, 'misses': 1, 'evictions': 1, 'entries': 2, 'size_bytes': 8}, {k: v for k, v in graph_data_cache.get_stats().items() if k not in ['hit_rate', 'max_bytes']})
+
+        # Values computed before an invalidation aren't kept
+        generation = graph_data_cache.generation('sample2')
+        graph_data_cache.invalidate('sample2')
+        self.assertIsNone(graph_data_cache.get(('sample2', 1)))
+        graph_data_cache.put(('sample2', 1), b'12345', generation)
+        self.assertIsNone(graph_data_cache.get(('sample2', 1)))
+        self.assertEqual(b'123', graph_data_cache.get(('other', 3)))
+
+        # Changing the links of a dataset invalidates its graph data
+        generation = cache.get_graph_data_cache().generation('sample2')
+        self.db_linker.add_fk('A', 'col3', 'B', 'col3')
+        self.assertNotEqual(generation, cache.get_graph_data_cache().generation('sample2'))
+
+    def test_link_summary(self):
+        # Every table with col1 is linked already, so linking it again skips each pair
+        table_count = len(db.session.query(ColumnMetadata).filter(ColumnMetadata.dataset_name == 'sample2', ColumnMetadata.column_source_name == 'col1').all())
+        summary = self.db_linker.add_global_fks(['col1'])
+        self.assertEqual([], summary['created'])
+        self.assertEqual(table_count * (table_count - 1) // 2, len(summary['skipped']))
+        self.assertEqual({'already linked'}, set(x['reason'] for x in summary['skipped']))
+
+    def test_customize_columns(self):
+        columns = db.session.query(ColumnMetadata).filter(ColumnMetadata.dataset_name == 'sample2', ColumnMetadata.table_name == 'A').order_by(ColumnMetadata.id).all()
+        column_ids = [x.id for x in columns]
+        original = [(x.column_custom_name, x.visible) for x in columns]
+        generation = cache.get_graph_data_cache().generation('sample2')
+        missing_column_ids = db_structure.customize_columns({str(column_ids[0]): 'renamed', '-1': 'nothing'}, [column_ids[0], column_ids[1], 'x'], [column_ids[1]])
+        self.assertEqual(['-1', 'x'], missing_column_ids)
+        self.assertNotEqual(generation, cache.get_graph_data_cache().generation('sample2'))
+
+        db.session.expire_all()
+        columns = db.session.query(ColumnMetadata).filter(ColumnMetadata.id.in_(column_ids[:2])).order_by(ColumnMetadata.id).all()
+        self.assertEqual([('renamed', False), (original[1][0], True)], [(x.column_custom_name, x.visible) for x in columns])
+
+        db_structure.customize_columns({str(column_ids[0]): original[0][0]}, [], [column_ids[0]])
+
+    def test_join_cache(self):
+        path = self.db_extractor.find_paths_multi_tables(['A', 'B'])[0]
+        df = self.db_extractor.get_df_from_path(path, [('A', 'col2'), ('B', 'col3'), ('A', 'col1')])
+        # Fewer columns along the same path come out of the join already cached
+        hits = cache.get_join_cache().get_stats()['hits']
+        subset_df = self.db_extractor.get_df_from_path(path, [('B', 'col3'), ('A', 'col2')])
+        self.assertEqual(hits + 1, cache.get_join_cache().get_stats()['hits'])
+        pd.testing.assert_frame_equal(df[['B_col3', 'A_col2']], subset_df)
+
+        db_structure.invalidate_dataset_caches('sample2')
+        db.session.commit()
+        self.assertIsNone(cache.get_join_cache().find('sample2', path, ['A_col2']))
+
+    def test_join_cache_engines(self):
+        # The SQL engines, 'sqlite' by default, leave the join cache alone, but aggregate a join it already has rather than run it
+        db_structure.invalidate_dataset_caches('sample2')
+        db.session.commit()
+        paths = self.db_extractor.find_paths_multi_tables(['A', 'F'])
+        path = self.db_extractor.get_biggest_path(paths)
+        args = ([('A', 'col2'), ('F', 'col8')], ['A_col2', 'F_col8'], {})
+        expected = self.db_extractor.aggregate_paths(paths, *args)
+        self.assertIsNone(cache.get_join_cache().find('sample2', path, ['A_col2', 'F_col8']))
+
+        self.db_extractor.get_df_from_path(path, [('F', 'col8'), ('A', 'col2'), ('A', 'col3')])
+        for engine in [None, 'chunked', 'duckdb'] if db_structure.duckdb is not None else [None, 'chunked']:
+            hits = cache.get_join_cache().get_stats()['hits']
+            pd.testing.assert_frame_equal(expected, self.db_extractor.aggregate_paths(paths, *args, engine=engine))
+            self.assertEqual(hits + 1, cache.get_join_cache().get_stats()['hits'])
+
+    def test_cache_generation(self):
+        def get_cache_generation():
+            return db.session.query(DatasetMetadata.cache_generation).filter(DatasetMetadata.dataset_name == 'sample2').scalar()
+
+        # Changing the links of a dataset changes its generation in the metadata db along with them
+        cache_generation = get_cache_generation()
+        self.db_linker.add_fk('A', 'col3', 'B', 'col3')
+        self.assertNotEqual(cache_generation, get_cache_generation())
+
+        # Which is all another process sees of the change, and drops its caches for the dataset the next time it reads them
+        check_seconds = db_structure.CACHE_GENERATION_CHECK_SECONDS
+        db_structure.CACHE_GENERATION_CHECK_SECONDS = 0
+        try:
+            graph = db_structure.get_relationship_graph('sample2')
+            graph_data_generation = cache.get_graph_data_cache().generation('sample2')
+            self.assertIs(graph, db_structure.get_relationship_graph('sample2'))
+            db.session.query(DatasetMetadata).filter(DatasetMetadata.dataset_name == 'sample2').update({DatasetMetadata.cache_generation: 'changed elsewhere'}, synchronize_session=False)
+            db.session.commit()
+            self.assertIsNot(graph, db_structure.get_relationship_graph('sample2'))
+            self.assertNotEqual(graph_data_generation, cache.get_graph_data_cache().generation('sample2'))
+        finally:
+            db_structure.CACHE_GENERATION_CHECK_SECONDS = check_seconds
+
+    def test_data_connection_pool(self):
+        pool = data_db.DataConnectionPool(flask_app.config['DATA_DB'], size=2, timeout=0.1)
+        conn_1, conn_2 = pool.acquire(), pool.acquire()
+        self.assertRaises(TimeoutError, pool.acquire)
+        pool.release(conn_1)
+        self.assertIs(conn_1, pool.acquire())
+        # Lent connections can only read
+        self.assertRaises(sqlite3.OperationalError, conn_2.execute, 'CREATE TABLE not_allowed (x INTEGER);')
+
+    def test_data_indexes(self):
+        def get_index_names():
+            return [x[0] for x in self.db_extractor.data_conn.cursor().execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()]
+
+        db_indexer = db_structure.DBIndexer('sample2')
+        # Both sides of every link get an index when the link is added
+        self.assertIn(db_indexer.get_index_name('A', 'col3'), get_index_names())
+        self.assertIn(db_indexer.get_index_name('B', 'col3'), get_index_names())
+        self.assertTrue(db_indexer.get_index('A', 'col3').is_join_key)
+
+        db_indexer.add_filter_index('F', 'col8')
+        self.assertIn(db_indexer.get_index_name('F', 'col8'), get_index_names())
+        db_indexer.remove_filter_index('F', 'col8')
+        self.assertNotIn(db_indexer.get_index_name('F', 'col8'), get_index_names())
+        self.assertIsNone(db_indexer.get_index('F', 'col8'))
+
+        # A filter index on a join key is only marked, and removing it leaves the join key index alone
+        db_indexer.add_filter_index('A', 'col3')
+        db_indexer.remove_filter_index('A', 'col3')
+        self.assertIn(db_indexer.get_index_name('A', 'col3'), get_index_names())
+
+
+class TestLinking(unittest.TestCase):
+    # On a dataset of its own, since TestPathFinding's is linked already
+    def setUp(self):
+        self.db_maker = db_structure.DBMaker(dataset_name='sample2', directory_path=os.path.join('datasets', 'sample2'))
+        self.db_maker.create_db()
+        self.db_linker = db_structure.DBLinker(dataset_name='sample2')
+
+    def tearDown(self):
+        self.db_maker.remove_db()
+
+    def get_rows(self):
+        relationships = db.session.query(TableRelationship).filter(TableRelationship.dataset_name == 'sample2').all()
+        table_paths = db.session.query(TablePath).filter(TablePath.dataset_name == 'sample2').all()
+        data_indexes = db.session.query(DataIndex).filter(DataIndex.dataset_name == 'sample2').all()
+        return (
+            sorted((x.reference_table, x.reference_key, x.other_table, x.other_key, [k for k in ['is_parent', 'is_child', 'is_sibling', 'is_step_sibling'] if getattr(x, k)]) for x in relationships),
+            sorted((x.start_table, x.destination_table) for x in table_paths),
+            sorted((x.table_name, x.column_name, x.is_join_key) for x in data_indexes)
+        )
+
+    def test_add_fks(self):
+        commits = []
+        count_commits = lambda session: commits.append(session)
+        event.listen(db.session, 'after_commit', count_commits)
+        try:
+            summary = self.db_linker.add_fks([
+                # The table whose column repeats is the parent, whichever way round the link is given, so C is F's parent
+                ('A', 'col1', 'C', 'col1'),
+                ('A', 'col3', 'B', 'col3'),
+                ('A', 'col1', 'E', 'col7'),
+                ('C', 'col1', 'A', 'col1'),
+                ('F', 'col5', 'C', 'col5')
+            ])
+        finally:
+            event.remove(db.session, 'after_commit', count_commits)
+        self.assertEqual(1, len(commits))
+
+        self.assertEqual([
+            {'table_1': 'A', 'column_1': 'col1', 'table_2': 'C', 'column_2': 'col1', 'link': 'parent_child'},
+            {'table_1': 'A', 'column_1': 'col3', 'table_2': 'B', 'column_2': 'col3', 'link': 'sibling'},
+            {'table_1': 'A', 'column_1': 'col1', 'table_2': 'E', 'column_2': 'col7', 'link': 'step_sibling'},
+            {'table_1': 'C', 'column_1': 'col5', 'table_2': 'F', 'column_2': 'col5', 'link': 'parent_child'}
+        ], summary['created'])
+        self.assertEqual([{'table_1': 'C', 'column_1': 'col1', 'table_2': 'A', 'column_2': 'col1', 'reason': 'already linked'}], summary['skipped'])
+
+        relationships, table_paths, data_indexes = self.get_rows()
+        self.assertEqual([
+            ('A', 'col1', 'C', 'col1', ['is_parent']),
+            ('A', 'col1', 'E', 'col7', ['is_step_sibling']),
+            ('A', 'col3', 'B', 'col3', ['is_sibling']),
+            ('B', 'col3', 'A', 'col3', ['is_sibling']),
+            ('C', 'col1', 'A', 'col1', ['is_child']),
+            ('C', 'col5', 'F', 'col5', ['is_parent']),
+            ('E', 'col7', 'A', 'col1', ['is_step_sibling']),
+            ('F', 'col5', 'C', 'col5', ['is_child'])
+        ], relationships)
+        # Paths between every pair of the linked tables, which leaves out D
+        self.assertEqual([(x, y) for x in 'ABCEF' for y in 'ABCEF' if x != y], table_paths)
+        self.assertEqual([
+            ('A', 'col1', True), ('A', 'col3', True), ('B', 'col3', True), ('C', 'col1', True), ('C', 'col5', True), ('E', 'col7', True), ('F', 'col5', True)
+        ], data_indexes)
+
+        # Linking the same tables again adds nothing
+        summary = self.db_linker.add_fks([('A', 'col1', 'C', 'col1'), ('B', 'col3', 'A', 'col3')])
+        self.assertEqual(([], 2), (summary['created'], len(summary['skipped'])))
+        self.assertEqual((relationships, table_paths, data_indexes), self.get_rows())
+
+    def test_add_fks_rolls_back(self):
+        # The links, paths and index rows are written together or not at all
+        update_table_paths = self.db_linker.update_table_paths
+        self.db_linker.update_table_paths = lambda *args, **kwargs: 1 / 0
+        try:
+            with self.assertRaises(Exception):
+                self.db_linker.add_fks([('A', 'col1', 'C', 'col1'), ('A', 'col3', 'B', 'col3')])
+        finally:
+            self.db_linker.update_table_paths = update_table_paths
+        self.assertEqual(([], [], []), self.get_rows())
+
+
+@unittest.skipIf(arrow_storage.pa is None, 'pyarrow is not installed')
+class TestArrowStorage(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.db_maker = db_structure.DBMaker(dataset_name='sample2', directory_path=os.path.join('datasets', 'sample2'), storage=c.STORAGE_ARROW)
+        self.db_maker.create_db()
+        self.db_linker = db_structure.DBLinker(dataset_name='sample2')
+        for column in ['col1', 'col2', 'col3', 'col4', 'col5', 'col6', 'col7', 'col8']:
+            self.db_linker.add_global_fk(column)
+        self.db_extractor = db_structure.DBExtractor(dataset_name='sample2')
+
+    @classmethod
+    def tearDownClass(self):
+        self.db_extractor.close()
+        self.db_maker.remove_db()
+
+    def test_column_stats(self):
+        # The same as for the dataset stored in SQLite
+        x = self.db_extractor.analyze_column('C', 'col6')
+        self.assertEqual({
+            'type': 'NUMERIC', 'min': 7, 'mean': 9.5, 'max': 12, 'median': 9.5, 'percentile_25': 8.25, 'percentile_75': 10.75,
+            'null_count': 0, 'distinct_count': 6, 'is_approximate': False
+        }, x)
+
+        x = self.db_extractor.analyze_column('A', 'col2')
+        self.assertEqual(['A', 'B', 'C'], x['possible_vals'])
+
+    def test_row_counts(self):
+        # Counted from the join keys without joining, but the same as the size of the join
+        paths = [['A']] + self.db_extractor.find_paths_between_tables('A', 'F') + self.db_extractor.find_paths_between_tables('B', 'F')
+        self.assertEqual(7, len(paths))
+        for path in paths:
+            self.assertEqual(len(self.db_extractor.get_df_from_arrow_path(path, [])), self.db_extractor.get_row_count_from_path(path))
+
+    def test_aggregation(self):
+        path = ['A', 'C', 'F']
+        a, c_, f = [pd.read_csv(os.path.join('datasets', 'sample2', f'{x}.csv')).add_prefix(f'{x}_') for x in path]
+        joined_df = a.merge(c_, left_on='A_col1', right_on='C_col1').merge(f, left_on='C_col5', right_on='F_col5')
+        self.assertEqual(len(joined_df), self.db_extractor.get_row_count_from_path(path))
+
+        test_cases = [
+            (['A_col2', 'F_col8'], {}, None, 'Count'),
+            (['A_col2', 'C_col6'], {'C_col6': {'type': 'range', 'filter': {'min': 7, 'max': 10, 'bins': 3}}}, None, 'Count'),
+            (['F_col8'], {}, 'A_col3', 'Sum'),
+            (['A_col2'], {}, 'C_col6', 'Median'),
+        ]
+        for groupby_columns, filters, aggregate_column, aggregate_fxn in test_cases:
+            columns = groupby_columns + ([] if aggregate_column is None else [aggregate_column])
+            table_columns_of_interest = [tuple(x.split('_', 1)) for x in columns]
+            expected = db_structure.aggregate_df(joined_df[columns], groupby_columns, filters, aggregate_column, aggregate_fxn)
+            x = self.db_extractor.aggregate_paths([path], table_columns_of_interest, groupby_columns, filters, aggregate_column, aggregate_fxn, engine='pandas')
+            pd.testing.assert_frame_equal(expected, x)
+            if db_structure.duckdb is not None:
+                x = self.db_extractor.aggregate_paths([path], table_columns_of_interest, groupby_columns, filters, aggregate_column, aggregate_fxn, engine='duckdb')
+                pd.testing.assert_frame_equal(expected, x)
+
+
+class TestLinkDiscovery(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        random = np.random.default_rng(0)
+        self.directory = tempfile.mkdtemp()
+        tables = {
+            'PATIENTS': {'PatientID': np.arange(300), 'Age': random.integers(0, 100, 300)},
+            'VISITS': {'PatientID': random.choice(300, 600), 'VisitCode': [f'V{x:04d}' for x in range(600)]},
+            'LABS': {'SampleID': np.arange(1000, 1300), 'Age': random.integers(0, 100, 300)}
+        }
+        for table, columns in tables.items():
+            pd.DataFrame(columns).to_csv(os.path.join(self.directory, f'{table}.csv'), index=False)
+        self.db_maker = db_structure.DBMaker(dataset_name='link_discovery', directory_path=self.directory)
+        self.db_maker.create_db()
+
+    @classmethod
+    def tearDownClass(self):
+        self.db_maker.remove_db()
+        shutil.rmtree(self.directory)
+
+    def test_find_links(self):
+        # Only the patient ids link anything: the ages of LABS and PATIENTS both repeat, and span too little of PatientID's range
+        db_link_finder = db_structure.DBLinkFinder('link_discovery')
+        links = db_link_finder.find_links()
+        self.assertEqual([('VISITS', 'PatientID', 'PATIENTS', 'PatientID', 1.0)], [(x['table_1'], x['column_1'], x['table_2'], x['column_2'], x['containment']) for x in links])
+        self.assertEqual(1, len(db_link_finder.add_links(links)['created']))
+        self.assertEqual([], db_link_finder.find_links())
+
+
+class TestChunkedImport(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        # Read 5 rows at a time, the first chunk types code and value as whole numbers, and later ones as text and floats
+        self.directory = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory, 'CODES.csv')
+        with open(self.file_path, 'w') as f:
+            f.write('id,code,value\n' + ''.join(f'{i},{x},{y}\n' for i, (x, y) in enumerate(zip(['0', '1', '2', '3', '4', '007', 'A1'], [1, 2, 3, 4, 5, 6.5, 7]))))
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.directory)
+
+    def check_import(self, storage):
+        db_maker = db_structure.DBMaker(dataset_name='chunked_import', directory_path=self.directory, chunksize=5, storage=storage)
+        db_maker.create_db()
+        try:
+            with db_structure.DBExtractor('chunked_import') as db_extractor:
+                df = db_extractor.get_df_from_path(['CODES'], [('CODES', 'id'), ('CODES', 'code'), ('CODES', 'value')])
+            pd.testing.assert_frame_equal(pd.read_csv(self.file_path).add_prefix('CODES_'), df)
+            self.assertEqual(7, db_maker.import_report['CODES.csv']['rows'])
+        finally:
+            db_maker.remove_db()
+
+    def test_sqlite(self):
+        self.check_import(c.STORAGE_SQLITE)
+
+    @unittest.skipIf(arrow_storage.pa is None, 'pyarrow is not installed')
+    def test_arrow(self):
+        self.check_import(c.STORAGE_ARROW)
+
+    def test_widened_dtypes(self):
+        declared_dtypes = pd.Series({'a': np.dtype('int64'), 'b': np.dtype('int64'), 'c': np.dtype('float64'), 'd': np.dtype('float64'), 'e': np.dtype(object)})
+        dtypes = pd.Series({'a': np.dtype('int64'), 'b': np.dtype('float64'), 'c': np.dtype('int64'), 'd': np.dtype(object), 'e': np.dtype('int64')})
+        self.assertEqual({'b': np.dtype('float64'), 'd': np.dtype(object), 'e': np.dtype(object)}, db_structure.get_widened_dtypes(declared_dtypes, dtypes))
+
+
+class TestParallelImport(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.directory = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.directory)
+
+    def make_directory(self, name, files):
+        # A dataset directory with the sample2 files and files ({file name: content}) of its own
+        directory = os.path.join(self.directory, name)
+        shutil.copytree(os.path.join('datasets', 'sample2'), directory)
+        for file_name, content in files.items():
+            with open(os.path.join(directory, file_name), 'w') as f:
+                f.write(content)
+        return directory
+
+    def get_dataset(self, dataset_name):
+        # Everything an import writes, whatever the dataset is called
+        tables = db.session.query(TableMetadata).filter(TableMetadata.dataset_name == dataset_name).order_by(TableMetadata.table_name).all()
+        with data_db.get_pool().connection() as data_conn:
+            data = {x.table_name: pd.read_sql(f'SELECT * FROM "{x.db_location}"', data_conn) for x in tables}
+        columns = db.session.query(ColumnMetadata).filter(ColumnMetadata.dataset_name == dataset_name).all()
+        column_stats = db.session.query(ColumnStats).filter(ColumnStats.dataset_name == dataset_name).all()
+        return (
+            [(x.table_name, x.file, x.row_count) for x in tables],
+            data,
+            sorted((x.table_name, x.column_source_name, x.is_many) for x in columns),
+            sorted((x.table_name, x.column_source_name, x.column_type, x.min, x.max, x.median, x.distinct_count, x.distinct_values) for x in column_stats)
+        )
+
+    def test_same_as_serial(self):
+        # With a few rows per chunk, chunks of different files reach the writer interleaved
+        files = {'G.csv': 'col1,col9\n' + ''.join(f'{x % 7},{x}\n' for x in range(100))}
+        datasets = []
+        for workers in [1, 2]:
+            db_maker = db_structure.DBMaker(dataset_name=f'import_{workers}', directory_path=self.make_directory(f'import_{workers}', files), chunksize=3, workers=workers)
+            db_maker.create_db()
+            try:
+                datasets.append(self.get_dataset(f'import_{workers}'))
+            finally:
+                db_maker.remove_db()
+
+        self.assertEqual(7, len(datasets[0][0]))
+        self.assertEqual(datasets[0][0], datasets[1][0])
+        for table, df in datasets[0][1].items():
+            pd.testing.assert_frame_equal(df, datasets[1][1][table])
+        self.assertEqual(datasets[0][2:], datasets[1][2:])
+
+    def test_errors(self):
+        # A file that can't be read fails the import, and cancels the worker still reading the big file, which would otherwise
+        # wait forever for the writer to take its chunks. Nothing of the import is left behind
+        files = {
+            'BAD.csv': 'col1,col9\n1,2\n1,2,3\n',
+            'BIG.csv': 'col1,col9\n' + ''.join(f'{x},{x}\n' for x in range(20000))
+        }
+        db_maker = db_structure.DBMaker(dataset_name='bad_import', directory_path=self.make_directory('bad_import', files), chunksize=10, workers=2)
+        start_time = time.monotonic()
+        with self.assertRaisesRegex(Exception, 'Unable to read BAD.csv'):
+            db_maker.create_db()
+        self.assertLess(time.monotonic() - start_time, 30)
+        self.assertIsNone(db.session.query(DatasetMetadata).filter(DatasetMetadata.dataset_name == 'bad_import').first())
+        with data_db.get_pool().connection() as data_conn:
+            self.assertEqual([], data_conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'bad_import%';").fetchall())
+
+    def test_put_csv_for_db(self):
+        file_path = os.path.join('datasets', 'sample2', 'A.csv')
+        message_queue = queue.Queue()
+        cancelled = threading.Event()
+        db_structure.put_csv_for_db(message_queue, cancelled, 'A.csv', file_path, 'x_A', 2, 10)
+        messages = [message_queue.get() for _ in range(message_queue.qsize())]
+        self.assertEqual({'A.csv'}, set(x[0] for x in messages))
+        self.assertEqual(['create', 'rows', 'rows', 'rows', 'done'], [x[1][0] for x in messages])
+
+        # Once cancelled, a worker stops without handing anything else over
+        cancelled.set()
+        db_structure.put_csv_for_db(message_queue, cancelled, 'A.csv', file_path, 'x_A', 2, 10)
+        self.assertTrue(message_queue.empty())
+
+        # and errors are handed over rather than raised
+        cancelled.clear()
+        db_structure.put_csv_for_db(message_queue, cancelled, 'A.csv', os.path.join(self.directory, 'missing.csv'), 'x_A', 2, 10)
+        self.assertEqual('error', message_queue.get()[1][0])
+
+
+class TestJobQueue(unittest.TestCase):
+    def test_jobs(self):
+        job_queue = jobs.JobQueue(max_running=2, max_running_per_user=1, result_ttl=60)
+        slow_job = job_queue.submit(1, 'chart', time.sleep, (60, ))
+        queued_job = job_queue.submit(1, 'other chart', sum, ([1, 2], ))
+        other_user_job = job_queue.submit(2, 'chart', sum, ([3, 4], ))
+        self.assertEqual([c.JOB_RUNNING, c.JOB_QUEUED, c.JOB_RUNNING], [x.status for x in [slow_job, queued_job, other_user_job]])
+
+        # A newer job for the same chart kills the slow one, which lets the user's queued job start
+        failing_job = job_queue.submit(1, 'chart', int, ('x', ))
+        self.assertEqual(c.JOB_CANCELLED, slow_job.status)
+        self.assertEqual(c.JOB_RUNNING, queued_job.status)
+
+        start_time = time.monotonic()
+        while not all(x.is_finished for x in [queued_job, other_user_job, failing_job]) and time.monotonic() - start_time < 30:
+            time.sleep(0.01)
+            job_queue.get(None)
+        self.assertEqual([3, 7], [queued_job.result, other_user_job.result])
+        self.assertEqual(c.JOB_FAILED, failing_job.status)
+
+    def test_workers(self):
+        job_queue = jobs.JobQueue(max_running=1, max_running_per_user=1, result_ttl=60)
+
+        def run(fxn, args):
+            job = job_queue.submit(1, 'chart', fxn, args)
+            start_time = time.monotonic()
+            while not job.is_finished and time.monotonic() - start_time < 30:
+                time.sleep(0.01)
+                job_queue.get(None)
+            return job
+
+        # Jobs after the first run in the same worker, with its connections and caches warm, even after one of them failed
+        pid = run(os.getpid, ()).result
+        self.assertNotEqual(os.getpid(), pid)
+        self.assertEqual(c.JOB_FAILED, run(int, ('x', )).status)
+        self.assertEqual(pid, run(os.getpid, ()).result)
+        self.assertEqual(1, job_queue.get_stats()['idle_workers'])
+
+        # Cancelling a job kills its worker, and the next job gets a new one
+        slow_job = job_queue.submit(1, 'chart', time.sleep, (60, ))
+        self.assertEqual(0, job_queue.get_stats()['idle_workers'])
+        job_queue.cancel(slow_job.id)
+        self.assertEqual(c.JOB_CANCELLED, slow_job.status)
+        self.assertNotIn(run(os.getpid, ()).result, [os.getpid(), pid])
+
+
+# Run by TestOffload under gevent's patches, which can't be undone in the test process. Prints what every greenlet got, as JSON
+OFFLOAD_SCRIPT = '''
+from gevent import monkey
+monkey.patch_all()
+import gevent
+import json
+import db_structure
+import offload
+from web import flask_app
+
+# Fewer connections than greenlets, so that pool threads have to wait for connections given back on the hub
+flask_app.config.update(OFFLOAD_THREADS=4, DATA_DB_POOL_SIZE=2, DATA_DB_POOL_TIMEOUT=10)
+
+
+def get_graph_data(i):
+    with flask_app.app_context():
+        with db_structure.DBExtractor('sample2') as db_extractor:
+            paths = db_extractor.find_paths_multi_tables(['A', 'F'])
+            df = db_extractor.aggregate_paths(paths, [('A', 'col2'), ('F', 'col8')], ['A_col2', 'F_col8'], {})
+            column_info = db_extractor.analyze_column('C', 'col6')
+    return df.to_json(), column_info
+
+
+greenlets = [gevent.spawn(get_graph_data, i) for i in range(16)]
+gevent.joinall(greenlets, timeout=30)
+print(json.dumps({
+    'is_enabled': offload.is_enabled(),
+    'results': [x.value for x in greenlets],
+    'errors': [repr(x.exception) for x in greenlets if x.exception is not None]
+}))
+'''
+
+
+@unittest.skipIf(offload.gevent is None, 'gevent is not installed')
+class TestOffload(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.db_maker = db_structure.DBMaker(dataset_name='sample2', directory_path=os.path.join('datasets', 'sample2'))
+        self.db_maker.create_db()
+        db_structure.DBLinker(dataset_name='sample2').add_global_fks(['col1', 'col2', 'col3', 'col4', 'col5', 'col6', 'col7', 'col8'])
+
+    @classmethod
+    def tearDownClass(self):
+        self.db_maker.remove_db()
+
+    def test_concurrent_calls(self):
+        # Every greenlet's calls run in the pool threads, sharing the data db connections and the caches with the hub
+        with db_structure.DBExtractor('sample2') as db_extractor:
+            paths = db_extractor.find_paths_multi_tables(['A', 'F'])
+            df = db_extractor.aggregate_paths(paths, [('A', 'col2'), ('F', 'col8')], ['A_col2', 'F_col8'], {})
+            expected = [df.to_json(), db_extractor.analyze_column('C', 'col6')]
+
+        process = subprocess.run([sys.executable, '-c', OFFLOAD_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=120)
+        self.assertEqual(0, process.returncode, process.stderr)
+        output = json.loads(process.stdout.strip().splitlines()[-1])
+        self.assertTrue(output['is_enabled'])
+        self.assertEqual([], output['errors'])
+        self.assertEqual([expected] * 16, output['results'])
+
+
+class TestUserCache(unittest.TestCase):
+    def test_roles(self):
+        flask_app.config['WTF_CSRF_ENABLED'] = False
+        for group_name in ['Basic', 'Admin']:
+            if db.session.query(Group).filter(Group.group_name == group_name).first() is None:
+                db.session.add(Group(group_name=group_name))
+        user = User(username='test_user_cache')
+        user.set_password('test_password')
+        db.session.add(user)
+        db.session.commit()
+        user.assign_group('Admin')
+        user_id = user.id
+
+        statements = []
+        count_statements = lambda *args: statements.append(args[2])
+        client = flask_app.test_client()
+        try:
+            client.post('/login', data={'username': 'test_user_cache', 'password': 'test_password'})
+            self.assertEqual(200, client.get('/cache_stats').status_code)
+
+            # Once cached, who the user is and what they may do takes no queries
+            event.listen(db.engine, 'before_cursor_execute', count_statements)
+            self.assertEqual(200, client.get('/cache_stats').status_code)
+            self.assertEqual([], statements)
+            event.remove(db.engine, 'before_cursor_execute', count_statements)
+
+            db.session.query(UserGroups).filter(UserGroups.user_id == user_id).delete()
+            db.session.commit()
+            self.assertEqual(200, client.get('/cache_stats').status_code)
+            cache.invalidate_user(user_id)
+            self.assertNotEqual(200, client.get('/cache_stats').status_code)
+        finally:
+            if event.contains(db.engine, 'before_cursor_execute', count_statements):
+                event.remove(db.engine, 'before_cursor_execute', count_statements)
+            db.session.query(UserGroups).filter(UserGroups.user_id == user_id).delete()
+            db.session.query(User).filter(User.id == user_id).delete()
+            db.session.commit()
+            cache.invalidate_user(user_id)
+            flask_app.config['WTF_CSRF_ENABLED'] = True
+
+
+class TestManageUsers(unittest.TestCase):
+    def setUp(self):
+        flask_app.config['WTF_CSRF_ENABLED'] = False
+        for group_name in ['Basic', 'Admin']:
+            if db.session.query(Group).filter(Group.group_name == group_name).first() is None:
+                db.session.add(Group(group_name=group_name))
+        self.users = [User(username=f'test_manage_users_{i}', first_name='First', last_name='Last') for i in range(3)]
+        for user in self.users:
+            user.set_password('test_password')
+        db.session.add_all(self.users)
+        db.session.commit()
+        self.user_ids = [x.id for x in self.users]
+        self.usernames = [x.username for x in self.users]
+        for user, group_names in zip(self.users, [['Basic'], ['Basic', 'Admin'], ['Admin']]):
+            for group_name in group_names:
+                user.assign_group(group_name)
+
+    def tearDown(self):
+        db.session.query(UserGroups).filter(UserGroups.user_id.in_(self.user_ids)).delete(synchronize_session=False)
+        db.session.query(User).filter(User.id.in_(self.user_ids)).delete(synchronize_session=False)
+        db.session.commit()
+        for user_id in self.user_ids:
+            cache.invalidate_user(user_id)
+        flask_app.config['WTF_CSRF_ENABLED'] = True
+
+    def get_users(self):
+        # (last name, first name, roles) of each test user
+        db.session.expire_all()
+        users = []
+        for user_id in self.user_ids:
+            user = db.session.query(User).get(user_id)
+            roles = sorted(x.group_name for x in db.session.query(Group).join(UserGroups).filter(UserGroups.user_id == user_id))
+            users.append((user.last_name, user.first_name, roles))
+        return users
+
+    def test_update_permissions(self):
+        group_count = db.session.query(Group).count()
+        with flask_app.test_request_context():
+            routes.update_permissions([
+                {'user': 'test_manage_users_0', 'name': 'Doe, Jane', 'Basic': 'false', 'Admin': 'true', 'Unknown': 'true'},
+                {'user': 'test_manage_users_1', 'name': 'Last, First', 'Basic': True, 'Admin': False},
+                {'user': 'unknown_user', 'name': 'Nobody, No', 'Admin': 'true'},
+                # A row edited twice counts as its last edit
+                {'user': 'test_manage_users_1', 'name': 'None, Ann', 'Basic': 'false', 'Admin': 'true'},
+                # Roles left out, or already as they are, stay
+                {'user': 'test_manage_users_2', 'name': 'Last, First', 'Admin': 'true'}
+            ])
+            self.assertEqual(['Could not find user unknown_user'], get_flashed_messages())
+        self.assertEqual([('Doe', 'Jane', ['Admin']), (None, 'Ann', ['Admin']), ('Last', 'First', ['Admin'])], self.get_users())
+        self.assertEqual(group_count, db.session.query(Group).count())
+        self.assertIsNone(db.session.query(User).filter(User.username == 'unknown_user').first())
+
+    def test_page_queries(self):
+        statements = []
+        count_statements = lambda *args: statements.append(args[2])
+        client = flask_app.test_client()
+        try:
+            client.post('/login', data={'username': 'test_manage_users_2', 'password': 'test_password'})
+            self.assertEqual(200, client.get('/manage_users').status_code)
+
+            # The logged in user comes from the user cache, and the page takes one query for the users and one for the groups
+            event.listen(db.engine, 'before_cursor_execute', count_statements)
+            response = client.get('/manage_users')
+            event.remove(db.engine, 'before_cursor_execute', count_statements)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(2, len(statements))
+            for username in self.usernames:
+                self.assertIn(username, response.get_data(as_text=True))
+
+            client.post('/manage_users', data={
+                'submit': 'Submit User Changes',
+                'password': 'test_password',
+                'data': json.dumps({'updated_permissions': [{'user': 'test_manage_users_0', 'name': 'Last, First', 'Admin': 'true'}]})
+            })
+            self.assertEqual(('Last', 'First', ['Admin', 'Basic']), self.get_users()[0])
+        finally:
+            if event.contains(db.engine, 'before_cursor_execute', count_statements):
+                event.remove(db.engine, 'before_cursor_execute', count_statements)
+
+
+class TestSketches(unittest.TestCase):
+    def test_quantile_sketch(self):
+        # The rank of each quantile is off by about 1 / k of the values at most, however they're fed in
+        values = np.random.default_rng(0).normal(size=200000)
+        sorted_values = np.sort(values)
+        quantile_sketch = sketches.QuantileSketch(k=256)
+        for chunk in np.array_split(values, 40):
+            quantile_sketch.update(chunk)
+        self.assertEqual(len(values), quantile_sketch.count)
+        self.assertLess(sum(len(x) for x in quantile_sketch.levels), 2 * 256 * np.log2(len(values) / 256))
+        for q in [0.01, 0.25, 0.5, 0.75, 0.99]:
+            rank = np.searchsorted(sorted_values, quantile_sketch.quantile(q)) / len(values)
+            self.assertLess(abs(rank - q), 2 / 256)
+
+        # Values with counts, as the distinct values of a column come out of a GROUP BY
+        quantile_sketch = sketches.QuantileSketch(k=256)
+        quantile_sketch.update_counts(np.arange(1000), np.arange(1000) + 1)
+        self.assertEqual(1000 * 1001 // 2, quantile_sketch.count)
+        self.assertLess(abs(quantile_sketch.quantile(0.5) - 1000 / np.sqrt(2)), 1000 * 2 / 256)
+        self.assertIsNone(sketches.QuantileSketch().quantile(0.5))
+
+    def test_hyper_log_log(self):
+        # Within a few standard errors (0.8% with the default precision), and closer still while few registers are used
+        hyper_log_log = sketches.HyperLogLog()
+        for chunk in np.array_split(np.arange(100000) * 7919, 10):
+            hyper_log_log.update(chunk)
+            hyper_log_log.update(chunk)
+        self.assertLess(abs(hyper_log_log.estimate() / 100000 - 1), 0.03)
+
+        hyper_log_log = sketches.HyperLogLog()
+        hyper_log_log.update([f'value {x}' for x in range(1000)] * 5)
+        self.assertLess(abs(hyper_log_log.estimate() - 1000), 20)
+        self.assertEqual(0, sketches.HyperLogLog().estimate())
+
+    def test_heavy_hitters(self):
+        # Every value making up more than 1 / (k + 1) of those seen is kept, among noise of values seen once
+        random = np.random.default_rng(0)
+        values = np.concatenate([np.repeat([-1, -2, -3], [15000, 10000, 8000]), random.permutation(40000)])
+        heavy_hitters = sketches.HeavyHitters(k=10)
+        for chunk in np.array_split(random.permutation(values), 20):
+            heavy_hitters.update(chunk.tolist())
+        self.assertFalse(heavy_hitters.is_complete)
+        self.assertEqual({-1, -2, -3}, set(heavy_hitters.top(3)))
+
+        # No more distinct values than k, so they're all kept with their exact counts
+        heavy_hitters = sketches.HeavyHitters(k=10)
+        heavy_hitters.update(['a', 'b', 'a', 'c'])
+        heavy_hitters.update(['a', 'c'])
+        self.assertTrue(heavy_hitters.is_complete)
+        self.assertEqual({'a': 3, 'c': 2, 'b': 1}, dict(heavy_hitters.counts))
+        self.assertEqual(['a', 'c', 'b'], heavy_hitters.top())
+
 
 class TestUtilities(unittest.TestCase):
     def test_duplicate_handling(self):
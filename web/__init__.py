@@ -18,6 +18,34 @@ class Config(object):
     'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     FLASK_APP = os.environ.get('FLASK_APP')
+    MULTI_TABLE_PATH_MAX_TABLES = 10  # tables past which only the chosen order is tried
+    MULTI_TABLE_PATH_TIMEOUT = 5  # seconds
+    PATH_SELECTION_ESTIMATE_MARGIN = 2  # factor, None to count every path
+    AGGREGATION_ENGINE = os.environ.get('AGGREGATION_ENGINE') or 'sqlite'  # 'sqlite', 'pandas', 'chunked' or 'duckdb'
+    AGGREGATION_CHUNK_SIZE = 100000  # rows
+    AGGREGATION_MAX_MEDIAN_VALUES = 1000000  # distinct values kept for exact medians
+    DUCKDB_THREADS = None  # None for one per core
+    DATA_STORAGE = os.environ.get('DATA_STORAGE') or 'sqlite'  # 'sqlite' or 'arrow'
+    OFFLOAD_THREADS = int(os.environ.get('OFFLOAD_THREADS') or 4)  # 0 to run on the gevent hub
+    INGEST_CHUNK_SIZE = 100000  # rows
+    INGEST_MAX_TRACKED_VALUES = 1000000  # distinct values per column
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS') or 1)  # processes, 1 to parse in-process
+    COLUMN_STATS_MAX_DISTINCT_VALUES = 1000  # text values per column
+    COLUMN_STATS_APPROXIMATE_MIN_ROWS = 10000000  # rows, None to always be exact
+    COLUMN_SIGNATURE_SIZE = 2048  # hashes per column, None to not keep any
+    LINK_DISCOVERY_MIN_CONTAINMENT = 0.95  # fraction of a column's values
+    LINK_DISCOVERY_MIN_DISTINCT = 10  # distinct values
+    LINK_DISCOVERY_MIN_RANGE_COVERAGE = 0.5  # fraction of the other column's range
+    DATA_DB_POOL_SIZE = int(os.environ.get('DATA_DB_POOL_SIZE') or 8)  # read-only connections
+    DATA_DB_POOL_TIMEOUT = 30  # seconds
+    GRAPH_JOBS_MAX_RUNNING = int(os.environ.get('GRAPH_JOBS_MAX_RUNNING') or os.cpu_count() or 1)  # worker processes
+    GRAPH_JOBS_MAX_RUNNING_PER_USER = int(os.environ.get('GRAPH_JOBS_MAX_RUNNING_PER_USER') or 2)
+    GRAPH_JOBS_RESULT_TTL = 300  # seconds
+    GRAPH_DATA_CACHE_MAX_BYTES = int(os.environ.get('GRAPH_DATA_CACHE_MAX_BYTES') or 67108864)  # per process, 0 to turn it off
+    JOIN_CACHE_MAX_BYTES = int(os.environ.get('JOIN_CACHE_MAX_BYTES') or 536870912)  # per process, 0 to turn it off
+    JOIN_CACHE_SPILL_DIRECTORY = os.environ.get('JOIN_CACHE_SPILL_DIRECTORY')  # None to drop evicted joins
+    JOIN_CACHE_SPILL_MAX_BYTES = int(os.environ.get('JOIN_CACHE_SPILL_MAX_BYTES') or 4294967296)
+    USER_CACHE_TTL = 60  # seconds, 0 to not cache
 
 
 class CustomJSONEncoder(JSONEncoder):
@@ -50,6 +78,7 @@ flask_app = Flask(__name__)
 flask_app.json_encoder = CustomJSONEncoder
 flask_app.config.from_object(Config)
 flask_app.config['DATA_DB'] = os.path.join(basedir, 'data.db')
+flask_app.config['DATA_ARROW_DIRECTORY'] = os.path.join(basedir, 'data_arrow')
 bootstrap = Bootstrap(flask_app)
 csrf = CSRFProtect(flask_app)
 db = SQLAlchemy(flask_app)
@@ -58,4 +87,4 @@ login = LoginManager(flask_app)
 login.session_protection = 'basic'
 login.login_view = 'login'
 
-from web import routes, models  # noqa: E402, F401
+from web import routes, models, commands  # noqa: E402, F401
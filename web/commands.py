@@ -0,0 +1,47 @@
+import click
+import data_db
+import db_structure
+from web import flask_app, db
+from web.models import DatasetMetadata
+
+
+@flask_app.cli.command('refresh-column-stats')
+@click.argument('dataset_names', nargs=-1)
+@click.option('--exact', is_flag=True, help='Compute exact stats even for tables big enough to be profiled with sketches.')
+def refresh_column_stats(dataset_names, exact):
+    '''Recompute the stored column stats for the given datasets, or for every dataset if none are given.'''
+    if len(dataset_names) == 0:
+        dataset_names = [x[0] for x in db.session.query(DatasetMetadata.dataset_name).all()]
+
+    with data_db.get_pool().connection() as data_conn:
+        for dataset_name in dataset_names:
+            column_count = db_structure.DBProfiler(dataset_name, data_conn, exact=exact).refresh_column_stats()
+            click.echo(f'{dataset_name}: refreshed stats for {column_count} columns')
+
+
+@flask_app.cli.command('refresh-column-signatures')
+@click.argument('dataset_names', nargs=-1)
+def refresh_column_signatures(dataset_names):
+    '''Rebuild the column signatures used to find links for the given datasets, or for every dataset if none are given.'''
+    if len(dataset_names) == 0:
+        dataset_names = [x[0] for x in db.session.query(DatasetMetadata.dataset_name).all()]
+
+    with data_db.get_pool().connection() as data_conn:
+        for dataset_name in dataset_names:
+            column_count = db_structure.DBProfiler(dataset_name, data_conn).refresh_column_signatures()
+            click.echo(f'{dataset_name}: refreshed signatures for {column_count} columns')
+
+
+@flask_app.cli.command('find-links')
+@click.argument('dataset_name')
+@click.option('--min-containment', type=float, help='Fraction of a column\'s values that must be in another\'s, LINK_DISCOVERY_MIN_CONTAINMENT by default.')
+@click.option('--add', is_flag=True, help='Add the links found rather than only listing them.')
+def find_links(dataset_name, min_containment, add):
+    '''List the links between the tables of a dataset that its column signatures suggest, and add them with --add.'''
+    db_link_finder = db_structure.DBLinkFinder(dataset_name)
+    links = db_link_finder.find_links(min_containment)
+    for link in links:
+        click.echo(f'{link["table_1"]}.{link["column_1"]} -> {link["table_2"]}.{link["column_2"]}: {link["containment"]:.0%} of {link["sample_size"]} sampled values, {link["link"]}')
+    if add:
+        summary = db_link_finder.add_links(links)
+        click.echo(f'Added {len(summary["created"])} links, skipped {len(summary["skipped"])}')
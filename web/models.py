@@ -1,4 +1,8 @@
+import cache
+import constants as c
+import json
 import logging
+import sketches
 from web import db, login
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
@@ -6,7 +10,22 @@ from flask_login import UserMixin
 
 @login.user_loader
 def load_user(id):
-	return User.query.get(int(id))
+	# The user and their roles come from the user cache when they can. The cached user is merged into the session without loading
+	# it again, so that routes can still change and commit current_user
+	user_id = int(id)
+	cached = cache.get_user_cache().get(user_id)
+	if cached is None:
+		user = User.query.get(user_id)
+		if user is None:
+			return None
+		roles = user.get_roles()
+		db.session.expunge(user)
+		cache.get_user_cache().put(user_id, user, roles)
+	else:
+		user, roles = cached
+	user = db.session.merge(user, load=False)
+	user._roles = roles
+	return user
 
 
 class User(UserMixin, db.Model):
@@ -24,12 +43,16 @@ class User(UserMixin, db.Model):
 		user_group_rel = UserGroups(user_id=self.id, group_id=group_id)
 		db.session.add(user_group_rel)
 		db.session.commit()
+		cache.invalidate_user(self.id)
 
 	def get_roles(self):
-		# Returns list of roles
+		# Returns list of roles, looked up once per instance (and for current_user, taken from the user cache by load_user)
+		if getattr(self, '_roles', None) is not None:
+			return self._roles
 		db_results = db.session.query(UserGroups, Group).join(Group).filter(UserGroups.user_id == self.id).all()
 		group_names = [x.Group.group_name for x in db_results]
 		logging.debug(f'User {self.username} has roles: {group_names}')
+		self._roles = group_names
 		return group_names
 
 	def set_password(self, password):
@@ -59,6 +82,8 @@ class DatasetMetadata(db.Model):
 	dataset_name = db.Column(db.String(), unique=True, index=True)
 	folder = db.Column(db.String(), unique=True)
 	prefix = db.Column(db.String(), unique=True)
+	storage = db.Column(db.String(), default=c.STORAGE_SQLITE, server_default=c.STORAGE_SQLITE)  # c.STORAGE_SQLITE or c.STORAGE_ARROW
+	cache_generation = db.Column(db.String())  # changed along with anything the processes' caches hold about the dataset
 
 
 class TableMetadata(db.Model):
@@ -67,6 +92,7 @@ class TableMetadata(db.Model):
 	table_name = db.Column(db.String(), index=True)
 	db_location = db.Column(db.String(), unique=True)
 	file = db.Column(db.String())
+	row_count = db.Column(db.Integer())  # None for tables imported before it was recorded
 
 
 class ColumnMetadata(db.Model):
@@ -90,3 +116,84 @@ class TableRelationship(db.Model):
 	is_step_sibling = db.Column(db.Boolean(), index=True, default=False)
 	reference_key = db.Column(db.String(), index=True)
 	other_key = db.Column(db.String(), index=True)
+
+
+class TablePath(db.Model):
+	# Precomputed results of path-finding between two tables, stored as a JSON list of paths
+	id = db.Column(db.Integer, primary_key=True)
+	dataset_name = db.Column(db.String(), index=True)
+	start_table = db.Column(db.String(), index=True)
+	destination_table = db.Column(db.String(), index=True)
+	paths = db.Column(db.Text())
+
+
+class DataIndex(db.Model):
+	# Indexes that have been created on data tables in DATA_DB, so that they can be dropped along with the dataset
+	id = db.Column(db.Integer, primary_key=True)
+	dataset_name = db.Column(db.String(), index=True)
+	table_name = db.Column(db.String(), index=True)
+	column_name = db.Column(db.String())
+	index_name = db.Column(db.String(), unique=True)
+	is_join_key = db.Column(db.Boolean(), default=False)
+	is_filter = db.Column(db.Boolean(), default=False)
+
+
+class ColumnSignature(db.Model):
+	# A sketches.MinHash of a data column's distinct values, computed when the dataset is imported, for DBLinkFinder
+	id = db.Column(db.Integer, primary_key=True)
+	dataset_name = db.Column(db.String(), index=True)
+	table_name = db.Column(db.String(), index=True)
+	column_source_name = db.Column(db.String(), index=True)
+	value_type = db.Column(db.String())  # c.VALUE_TYPE_INTEGER, c.VALUE_TYPE_REAL or c.VALUE_TYPE_TEXT
+	size = db.Column(db.Integer())  # the k of the MinHash
+	distinct_count = db.Column(db.Integer())  # estimated, unless the MinHash holds every value
+	hashes = db.Column(db.LargeBinary())
+
+	def get_min_hash(self):
+		return sketches.MinHash.from_bytes(self.hashes, self.size)
+
+
+class ColumnStats(db.Model):
+	# Summary of a data column, computed when the dataset is imported so that the visualization page doesn't have to read the column
+	id = db.Column(db.Integer, primary_key=True)
+	dataset_name = db.Column(db.String(), index=True)
+	table_name = db.Column(db.String(), index=True)
+	column_source_name = db.Column(db.String(), index=True)
+	column_type = db.Column(db.String())
+	is_integer = db.Column(db.Boolean(), default=False)
+	min = db.Column(db.Float())
+	max = db.Column(db.Float())
+	mean = db.Column(db.Float())
+	median = db.Column(db.Float())
+	percentile_25 = db.Column(db.Float())
+	percentile_75 = db.Column(db.Float())
+	null_count = db.Column(db.Integer())
+	distinct_count = db.Column(db.Integer())
+	distinct_values = db.Column(db.Text())  # JSON list, sorted, of at most COLUMN_STATS_MAX_DISTINCT_VALUES values
+	distinct_values_truncated = db.Column(db.Boolean(), default=False)
+	is_approximate = db.Column(db.Boolean(), default=False)  # percentiles, distinct_count and distinct_values were estimated with sketches
+
+	def get_column_info(self):
+		if self.column_type == c.COLUMN_TYPE_NUMERIC:
+			convert = int if self.is_integer else float
+			return {
+				'type': self.column_type,
+				'min': convert(self.min),
+				'mean': self.mean,
+				'max': convert(self.max),
+				'median': self.median,
+				'percentile_25': self.percentile_25,
+				'percentile_75': self.percentile_75,
+				'null_count': self.null_count,
+				'distinct_count': self.distinct_count,
+				'is_approximate': self.is_approximate
+			}
+		else:
+			return {
+				'type': self.column_type,
+				'possible_vals': json.loads(self.distinct_values),
+				'possible_vals_truncated': self.distinct_values_truncated,
+				'null_count': self.null_count,
+				'distinct_count': self.distinct_count,
+				'is_approximate': self.is_approximate
+			}
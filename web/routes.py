@@ -1,4 +1,6 @@
+import cache
 import db_structure
+import jobs
 from web import flask_app, db
 from web.forms import LoginForm, ChangePWForm, AddUserForm, PermissionChangeForm
 from web.models import ColumnMetadata, DatasetMetadata, TableMetadata, Group, User, UserGroups
@@ -6,7 +8,7 @@ from flask import flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_user, logout_user, fresh_login_required
 from sqlalchemy.exc import IntegrityError
 from functools import wraps
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import json
 import logging
 
@@ -81,6 +83,7 @@ def change_pw():
 			if current_user.check_password(form.old_password.data):
 				current_user.set_password(form.new_password.data)
 				db.session.commit()
+				cache.invalidate_user(current_user.id)
 				flash('Password successfully changed')
 				return redirect(url_for('change_pw'))
 			else:
@@ -110,33 +113,119 @@ def visualization():
 def get_column_info():
     column_id = request.args.get('column_id')
     found_row = db.session.query(ColumnMetadata).filter(ColumnMetadata.id == column_id).first()
-    db_extractor = db_structure.DBExtractor(found_row.dataset_name)
-    col_info = db_extractor.analyze_column(table=found_row.table_name, column=found_row.column_source_name)
+    with db_structure.DBExtractor(found_row.dataset_name) as db_extractor:
+        col_info = db_extractor.analyze_column(table=found_row.table_name, column=found_row.column_source_name)
 
     return jsonify(col_info)
 
 
-@flask_app.route('/get_graph_data')
-@login_required(roles=PAGE_ACCESS['visualization'])
-def get_graph_data():
-    return_data = {}
+def get_graph_query():
+    # The arguments of a graph data request, as (chosen_dataset, chosen_ind_column_ids, chosen_outcome_column_id, aggregate_fxn,
+    # filters with {column_id: filter data})
     chosen_dataset = request.args.get('chosen_dataset')
     chosen_ind_column_ids = request.args.getlist('chosen_ind_column_ids[]', None)
     chosen_ind_column_ids = [int(x) for x in chosen_ind_column_ids]
-    if len(chosen_ind_column_ids) == 0:
-        return jsonify({})
-    
+
     chosen_outcome_column_id = request.args.get('chosen_outcome_column_id', None)
-    if chosen_outcome_column_id == '':
+    if chosen_outcome_column_id == '' or chosen_outcome_column_id is None:
         chosen_outcome_column_id = None
     else:
         chosen_outcome_column_id = int(chosen_outcome_column_id)
 
     aggregate_fxn = request.args.get('aggregate_fxn')
+    filters_with_id_keys = json.loads(request.args.get('filters', '{}'))
+    return chosen_dataset, chosen_ind_column_ids, chosen_outcome_column_id, aggregate_fxn, filters_with_id_keys
+
+
+def get_graph_data_cache_key(chosen_dataset, chosen_ind_column_ids, chosen_outcome_column_id, aggregate_fxn, filters_with_id_keys):
+    # The groupby columns come out in the order of column_metadata whatever order they were chosen in, so that doesn't matter
+    return (chosen_dataset, tuple(sorted(chosen_ind_column_ids)), chosen_outcome_column_id, aggregate_fxn, json.dumps(filters_with_id_keys, sort_keys=True))
+
+
+@flask_app.route('/get_graph_data')
+@login_required(roles=PAGE_ACCESS['visualization'])
+def get_graph_data():
+    graph_query = get_graph_query()
+    if len(graph_query[1]) == 0:
+        return jsonify({})
+
+    db_structure.check_dataset_generation(graph_query[0])
+    graph_data_cache = cache.get_graph_data_cache()
+    cache_key = get_graph_data_cache_key(*graph_query)
+    graph_data = graph_data_cache.get(cache_key)
+    if graph_data is None:
+        cache_generation = graph_data_cache.generation(graph_query[0])
+        graph_data = compute_graph_data(*graph_query)
+        graph_data_cache.put(cache_key, graph_data, cache_generation)
+    return flask_app.response_class(graph_data, mimetype='application/json')
+
+
+@flask_app.route('/submit_graph_data_job')
+@login_required(roles=PAGE_ACCESS['visualization'])
+def submit_graph_data_job():
+    '''
+    Takes the same arguments as /get_graph_data, plus the chart the data is for, and returns a job (see jobs.JobQueue) computing
+    the data in another process rather than the data itself. Its status is polled with /graph_data_job_status until it's done,
+    then the data is fetched with /graph_data_job_result. A newer job for the same chart cancels this one.
+    '''
+    graph_query = get_graph_query()
+    chart = request.args.get('chart', '')
+    job_queue = jobs.get_job_queue()
+    if len(graph_query[1]) == 0:
+        return jsonify(job_queue.submit(current_user.id, chart, None, (), result=jsonify({}).get_data()).get_info())
+
+    db_structure.check_dataset_generation(graph_query[0])
+    graph_data_cache = cache.get_graph_data_cache()
+    cache_key = get_graph_data_cache_key(*graph_query)
+    graph_data = graph_data_cache.get(cache_key)
+    if graph_data is not None:
+        job = job_queue.submit(current_user.id, chart, None, (), result=graph_data)
+    else:
+        cache_generation = graph_data_cache.generation(graph_query[0])
+        job = job_queue.submit(current_user.id, chart, compute_graph_data, graph_query, on_done=lambda x: graph_data_cache.put(cache_key, x, cache_generation))
+    return jsonify(job.get_info())
+
+
+def get_users_job():
+    # The job asked for, or None unless it's one of the current user's
+    job = jobs.get_job_queue().get(request.args.get('job_id'))
+    if job is None or job.user_id != current_user.id:
+        return None
+    return job
 
-    column_metadata = db.session.query(ColumnMetadata).filter(ColumnMetadata.id.in_(chosen_ind_column_ids + [chosen_outcome_column_id])).all()
 
-    db_extractor = db_structure.DBExtractor(dataset_name=chosen_dataset)
+@flask_app.route('/graph_data_job_status')
+@login_required(roles=PAGE_ACCESS['visualization'])
+def graph_data_job_status():
+    job = get_users_job()
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.get_info())
+
+
+@flask_app.route('/graph_data_job_result')
+@login_required(roles=PAGE_ACCESS['visualization'])
+def graph_data_job_result():
+    job = get_users_job()
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.result is None:
+        return jsonify(job.get_info()), 409
+    return flask_app.response_class(job.result, mimetype='application/json')
+
+
+@flask_app.route('/cancel_graph_data_job')
+@login_required(roles=PAGE_ACCESS['visualization'])
+def cancel_graph_data_job():
+    job = get_users_job()
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(jobs.get_job_queue().cancel(job.id).get_info())
+
+
+def compute_graph_data(chosen_dataset, chosen_ind_column_ids, chosen_outcome_column_id, aggregate_fxn, filters_with_id_keys):
+    # The JSON /get_graph_data responds with, as bytes. Needs an app context, but no request, so that it can run as a job
+    column_metadata = db.session.query(ColumnMetadata).filter(ColumnMetadata.id.in_(chosen_ind_column_ids + [chosen_outcome_column_id])).all()
 
     tables = list(set(x.table_name for x in column_metadata))
     table_columns_of_interest = [(x.table_name, x.column_source_name) for x in column_metadata]
@@ -149,11 +238,6 @@ def get_graph_data():
             aggregate_column = f'{x.table_name}_{x.column_source_name}'
             aggregate_column_display_name = x.column_custom_name
 
-    paths = db_extractor.find_paths_multi_tables(tables)
-    df = db_extractor.get_biggest_df_from_paths(paths, table_columns_of_interest)
-
-    # Gets filters with {column_id: filter data}
-    filters_with_id_keys = json.loads(request.args.get('filters', None))
     # Need to rewrite to {table_columnsource: filter_data}
     filters_with_name_keys = {}
     for column_id_str, filter in filters_with_id_keys.items():
@@ -163,7 +247,9 @@ def get_graph_data():
                 filters_with_name_keys[f'{x.table_name}_{x.column_source_name}'] = filter
                 continue
     
-    aggregated_df = db_extractor.aggregate_df(df, groupby_columns, filters_with_name_keys, aggregate_column, aggregate_fxn)
+    with db_structure.DBExtractor(dataset_name=chosen_dataset) as db_extractor:
+        paths = db_extractor.find_paths_multi_tables(tables)
+        aggregated_df = db_extractor.aggregate_paths(paths, table_columns_of_interest, groupby_columns, filters_with_name_keys, aggregate_column, aggregate_fxn)
 
     labels = list(aggregated_df['groupby_labels'])
     outcome_possibilities = [x for x in aggregated_df.columns if x != 'groupby_labels']
@@ -192,7 +278,7 @@ def get_graph_data():
         'yaxis_label': aggregate_fxn
     }
 
-    return jsonify(return_data)
+    return jsonify(return_data).get_data()
 
 
 @flask_app.route('/get_accessible_tables')
@@ -216,8 +302,8 @@ def get_accessible_tables():
 
         include_tables = list(set([x[0] for x in db.session.query(ColumnMetadata.table_name).filter(ColumnMetadata.id.in_(all_chosen_column_ids))]))
         
-        db_extractor = db_structure.DBExtractor(dataset_name=chosen_dataset)
-        accessible_tables = db_extractor.find_multi_tables_still_accessible_tables(include_tables=include_tables)
+        with db_structure.DBExtractor(dataset_name=chosen_dataset) as db_extractor:
+            accessible_tables = db_extractor.find_multi_tables_still_accessible_tables(include_tables=include_tables)
         for table in all_tables:
             if table in include_tables or table in accessible_tables:
                 return_data[table] = True
@@ -268,37 +354,90 @@ def column_customization():
         
         return return_data
     elif request.method == 'PUT':
-        # inefficient, but not worth trying to do bulk updates
         data = request.get_json()
         logging.info(f'Update customization {data}')
-        success = True
-        for column_id, new_column_name in data['custom_column_names'].items():
-            found_column = db.session.query(ColumnMetadata).filter(ColumnMetadata.id == column_id).first()
-            if found_column is None:
-                logging.warning(f'Could not find column with id {column_id}')
-                success = False
-            else:
-                found_column.column_custom_name = new_column_name
-        db.session.commit()
-
-        for column_id in data['exclude_column_ids']:
-            found_column = db.session.query(ColumnMetadata).filter(ColumnMetadata.id == column_id).first()
-            if found_column is None:
-                logging.warning(f'Could not find column with id {column_id}')
-                success = False
-            else:
-                found_column.visible = False
-        db.session.commit()
-
-        for column_id in data['include_column_ids']:
-            found_column = db.session.query(ColumnMetadata).filter(ColumnMetadata.id == column_id).first()
-            if found_column is None:
-                logging.warning(f'Could not find column with id {column_id}')
-                success = False
-            else:
-                found_column.visible = True
-        db.session.commit()
-        return jsonify(success)
+        missing_column_ids = db_structure.customize_columns(data['custom_column_names'], data['exclude_column_ids'], data['include_column_ids'])
+        return jsonify({'success': len(missing_column_ids) == 0, 'missing_column_ids': missing_column_ids})
+
+
+@flask_app.route('/cache_stats')
+@login_required(roles=PAGE_ACCESS['config'])
+def cache_stats():
+    return jsonify({
+        'graph_data': cache.get_graph_data_cache().get_stats(),
+        'join': cache.get_join_cache().get_stats(),
+        'graph_data_jobs': jobs.get_job_queue().get_stats(),
+        'users': cache.get_user_cache().get_stats()
+    })
+
+
+def update_permissions(updated_permissions):
+	# Applies the names and roles of the edited rows of /manage_users in one transaction, looking up the users, their groups and
+	# the group ids once. A row edited more than once counts as its last edit
+	updated_permissions = OrderedDict((x['user'], x) for x in updated_permissions)
+	group_ids = dict((x.group_name, x.id) for x in db.session.query(Group))
+
+	usernames = list(updated_permissions)
+	user_objs = {}
+	for i in range(0, len(usernames), db_structure.SQL_IN_BATCH_SIZE):
+		user_objs.update((x.username, x) for x in db.session.query(User).filter(User.username.in_(usernames[i:i + db_structure.SQL_IN_BATCH_SIZE])))
+	user_ids = [x.id for x in user_objs.values()]
+	current_user_groups = defaultdict(dict)
+	for i in range(0, len(user_ids), db_structure.SQL_IN_BATCH_SIZE):
+		for user_group_rel in db.session.query(UserGroups).filter(UserGroups.user_id.in_(user_ids[i:i + db_structure.SQL_IN_BATCH_SIZE])):
+			current_user_groups[user_group_rel.user_id][user_group_rel.group_id] = user_group_rel.id
+
+	name_updates = []
+	add_user_groups = []
+	remove_user_group_ids = []
+	changed_user_ids = set()
+	for username, new_data in updated_permissions.items():
+		new_data = dict(new_data)
+		new_data.pop('user')
+		user_obj = user_objs.get(username)
+		if user_obj is None:
+			logging.warning(f'Could not find user {username}')
+			flash(f'Could not find user {username}')
+			continue
+
+		new_last_name, new_first_name = new_data.pop('name').replace(' ', '').split(',')
+		if new_last_name == 'None':
+			new_last_name = None
+		if new_first_name == 'None':
+			new_first_name = None
+		if (new_first_name, new_last_name) != (user_obj.first_name, user_obj.last_name):
+			name_updates.append({'id': user_obj.id, 'first_name': new_first_name, 'last_name': new_last_name})
+			changed_user_ids.add(user_obj.id)
+
+		# Remaining keys are all roles
+		current_group_ids = current_user_groups[user_obj.id]
+		for role, value in new_data.items():
+			if role not in group_ids:
+				logging.warning(f'Could not find role {role}')
+				continue
+			group_id = group_ids[role]
+			if value in ['true', True] and group_id not in current_group_ids:
+				logging.info(f'Adding role {role} to {username}')
+				add_user_groups.append({'user_id': user_obj.id, 'group_id': group_id})
+				changed_user_ids.add(user_obj.id)
+			elif value in ['false', False] and group_id in current_group_ids:
+				logging.info(f'Removing role {role} from {username}')
+				remove_user_group_ids.append(current_group_ids[group_id])
+				changed_user_ids.add(user_obj.id)
+
+	try:
+		db.session.bulk_update_mappings(User, name_updates)
+		db.session.bulk_insert_mappings(UserGroups, add_user_groups)
+		for i in range(0, len(remove_user_group_ids), db_structure.SQL_IN_BATCH_SIZE):
+			db.session.query(UserGroups).filter(UserGroups.id.in_(remove_user_group_ids[i:i + db_structure.SQL_IN_BATCH_SIZE])).delete(synchronize_session=False)
+		db.session.commit()
+	except Exception as e:
+		db.session.rollback()
+		logging.error(e)
+		raise Exception(e)
+
+	for user_id in changed_user_ids:
+		cache.invalidate_user(user_id)
 
 
 @flask_app.route('/manage_users', methods=['GET', 'POST'])
@@ -334,67 +473,25 @@ def manage_users():
 			if current_user.check_password(permission_change_form.password.data):
 				data = json.loads(request.form['data'])
 				logging.debug(f'Submitting change: {data}')
-				for new_data in data['updated_permissions']:
-					username = new_data.pop('user')
-					new_name = new_data.pop('name')
-					new_last_name, new_first_name = new_name.replace(' ', '').split(',')
-					if new_last_name == 'None':
-						new_last_name = None
-					if new_first_name == 'None':
-						new_first_name = None
-					
-					user_obj = db.session.query(User).filter(User.username == username).first()
-					user_id = user_obj.id
-					current_roles = set(user_obj.get_roles())
-					user_obj.first_name = new_first_name
-					user_obj.last_name = new_last_name
-					db.session.commit()
-					
-					# Remaining keys are all roles
-					new_roles = set([k for k, v in new_data.items() if v in ['true', True]])
-					new_non_roles = set([k for k, v in new_data.items() if v in ['false', False]])
-
-					add_roles = new_roles - current_roles
-					remove_roles = current_roles.intersection(new_non_roles)
-
-					for add_role in add_roles:
-						logging.info(f'Adding role {add_role} to {username}')
-						group_id = db.session.query(Group).filter(add_role == Group.group_name).first().id
-						new_user_group_rel = UserGroups(user_id=user_id, group_id=group_id)
-						db.session.add(new_user_group_rel)
-					db.session.commit()
-
-					for remove_role in remove_roles:
-						logging.info(f'Removing role {remove_role} from {username}')
-						group_id = db.session.query(Group).filter(remove_role == Group.group_name).first().id
-						db.session.query(UserGroups).filter(UserGroups.user_id == user_id, UserGroups.group_id == group_id).delete()
-					db.session.commit()
-
+				update_permissions(data['updated_permissions'])
 			else:
 				logging.info(f'Invalid password')
 				flash('Invalid password')
 
 		return redirect(url_for('manage_users'))
 
-	user_groups = db.session.query(UserGroups, User, Group).join(User, Group).all()
-	all_usernames = [x.username for x in db.session.query(User).all()]
-	all_groupnames = [x.group_name for x in db.session.query(Group).all()]
-
-	permission_dict = defaultdict(dict)
-	for user in all_usernames:
-		for group in all_groupnames:
-			permission_dict[user][group] = False
-
-	for user_group_access in user_groups:
-		permission_dict[user_group_access.User.username][user_group_access.Group.group_name] = True
+	# The whole matrix from two queries: every user with the groups they're in, and every group
+	users = OrderedDict()
+	for user_obj, group_name in db.session.query(User, Group.group_name).outerjoin(UserGroups, UserGroups.user_id == User.id).outerjoin(Group, Group.id == UserGroups.group_id).order_by(User.id):
+		users.setdefault(user_obj.username, (user_obj, set()))[1].add(group_name)
+	all_groupnames = [x[0] for x in db.session.query(Group.group_name).order_by(Group.id)]
 
 	permission_list = []
-	for user, permissions in permission_dict.items():
+	for username, (user_obj, group_names) in users.items():
 		add_dict = {}
-		user_obj = db.session.query(User).filter(User.username == user).first()
-		add_dict['user'] = user
+		add_dict['user'] = username
 		add_dict['name'] = user_obj.full_name
-		for k, v in permissions.items():
-			add_dict[k] = v
+		for group in all_groupnames:
+			add_dict[group] = group in group_names
 		permission_list.append(add_dict)
 	return render_template('manage_users.html', header="Manage Users", navbar_access=navbar_access(), permissions=permission_list, add_user_form=add_user_form, permission_change_form=permission_change_form)